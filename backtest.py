@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+# backtest.py
+
+# replay historical trades or klines through the grid strategy with a simulated fill model
+
+import argparse as ap
+import time
+import numpy as np
+import pandas as pd
+from grid import GridStrategy, LadderStrategy
+from eventlog import readEventFrame
+
+# column layout of the headerless CSV files distributed by data.binance.vision
+TRADES_COLUMNS = ['id', 'price', 'qty', 'quote_qty', 'time', 'is_buyer_maker', 'is_best_match']
+KLINES_COLUMNS = [
+    'open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time',
+    'quote_volume', 'count', 'taker_buy_volume', 'taker_buy_quote_volume', 'ignore'
+]
+
+def readTable(path) -> pd.DataFrame:
+
+    if path.endswith('.parquet'):
+        return(pd.read_parquet(path))
+
+    # ticks of an event log written by the bot, sampled with --tick_sample
+    if path.endswith('.jsonl'):
+        return(readEventFrame(path, ('tick',)))
+
+    df = pd.read_csv(path, nrows=1, header=None)
+    try:
+        # a numeric first cell means the file has no header
+        float(df.iloc[0, 0])
+    except ValueError:
+        return(pd.read_csv(path))
+    if df.shape[1] == len(KLINES_COLUMNS):
+        return(pd.read_csv(path, header=None, names=KLINES_COLUMNS))
+    if df.shape[1] == len(TRADES_COLUMNS):
+        return(pd.read_csv(path, header=None, names=TRADES_COLUMNS))
+    raise ValueError(f'cannot infer the columns of {path}')
+
+def klinesToTicks(df) -> np.ndarray:
+
+    # replay each bar as open, low, high, close for bullish bars and open, high, low, close
+    # for bearish bars, which is the most likely path of the price within the bar
+    open_ = df['open'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+    bullish = close >= open_
+    ticks = np.empty((len(df), 4))
+    ticks[:, 0] = open_
+    ticks[:, 1] = np.where(bullish, low, high)
+    ticks[:, 2] = np.where(bullish, high, low)
+    ticks[:, 3] = close
+    return(ticks.ravel())
+
+def loadPrices(path, symbol=None) -> np.ndarray:
+
+    df = readTable(path)
+    if 'symbol' in df.columns:
+        if symbol is not None:
+            df = df[df['symbol'] == symbol]
+        elif df['symbol'].nunique() > 1:
+            raise ValueError(f'{path} contains several symbols; select one with --symbol')
+    if {'open', 'high', 'low', 'close'}.issubset(df.columns):
+        return(klinesToTicks(df))
+    if 'price' in df.columns:
+        return(df['price'].to_numpy(dtype=float))
+    raise ValueError(f'{path} contains neither trades (price) nor klines (open, high, low, close)')
+
+def nextCrossing(prices, start, lower, upper, block=256) -> int:
+
+    # index of the first tick from start that lies outside [lower, upper], or len(prices);
+    # the array is scanned in growing blocks so that long quiet stretches cost few numpy calls
+    n = len(prices)
+    while start < n:
+        chunk = prices[start:start + block]
+        hits = np.flatnonzero((chunk > upper) | (chunk < lower))
+        if len(hits) > 0:
+            return(start + int(hits[0]))
+        start += len(chunk)
+        block = min(block * 2, 1 << 20)
+    return(n)
+
+class FillModel:
+
+    def __init__(self, fee=0.001, slippage=0.0):
+
+        self.fee = fee # commission rate charged in stake currency
+        self.slippage = slippage # adverse price move between the crossing and the fill
+
+    def buyPrice(self, price) -> float:
+
+        return(price * (1 + self.slippage))
+
+    def sellPrice(self, price) -> float:
+
+        return(price * (1 - self.slippage))
+
+class Backtester:
+
+    def __init__(self, grid, fill_model=None, stake_balance=1000, trade_balance=0, ndecimal_precision=5):
+
+        self.grid = grid
+        self.fill_model = fill_model if fill_model is not None else FillModel()
+        self.start_stake_balance = stake_balance
+        self.start_trade_balance = trade_balance
+        self.stake_balance = stake_balance
+        self.trade_balance = trade_balance
+        self.ndecimal_precision = ndecimal_precision
+
+        # counters
+        self.n_buys = 0
+        self.n_sells = 0
+        self.n_stoplosses = 0
+        self.n_resets = 0
+
+    def buy(self, price) -> bool:
+
+        amount = self.grid.buyAmount(self.stake_balance, self.ndecimal_precision)
+        cost = amount * self.fill_model.buyPrice(price) * (1 + self.fill_model.fee)
+        if amount <= 0 or cost > self.stake_balance:
+            # the exchange would reject the order
+            return(False)
+        self.stake_balance -= cost
+        self.trade_balance += amount
+        self.grid.openPosition(amount, price)
+        self.n_buys += 1
+        return(True)
+
+    def buyLevel(self, level, price) -> bool:
+
+        amount = self.grid.buyAmount(self.stake_balance, self.ndecimal_precision, level)
+        cost = amount * self.fill_model.buyPrice(price) * (1 + self.fill_model.fee)
+        if amount <= 0 or cost > self.stake_balance:
+            return(False)
+        self.stake_balance -= cost
+        self.trade_balance += amount
+        self.grid.openLevel(level, amount)
+        self.n_buys += 1
+        return(True)
+
+    def tradeLadder(self, price):
+
+        # all the levels crossed by the tick are filled at its price; those the stake balance
+        # does not cover are retried by the next ticks beyond them
+        trigger, levels = self.grid.cross(price)
+        if trigger == 'buy':
+            for level in reversed(levels):
+                if not self.buyLevel(level, price):
+                    break
+        elif trigger is not None:
+            for level in levels:
+                amount, _ = self.grid.closeLevel(level)
+                self.sell(amount, price)
+            if trigger == 'sell':
+                self.n_sells += len(levels)
+            else:
+                self.n_stoplosses += len(levels)
+        self.grid.moveCursor(price, trigger, levels)
+
+    def sell(self, amount, price):
+
+        self.stake_balance += amount * self.fill_model.sellPrice(price) * (1 - self.fill_model.fee)
+        self.trade_balance -= amount
+
+    def run(self, prices) -> dict:
+
+        start = time.perf_counter()
+        prices = np.asarray(prices, dtype=float)
+
+        # the grid starts around the first price
+        self.grid.setGrid(prices[0])
+
+        # indices and balances after every fill, to rebuild the equity curve afterwards
+        fill_index = [0]
+        fill_stake = [self.stake_balance]
+        fill_trade = [self.trade_balance]
+
+        n = len(prices)
+        i = 0
+        lower, upper = self.grid.band()
+        while True:
+
+            # jump to the next tick outside the band, nothing can happen inside it
+            i = nextCrossing(prices, i, lower, upper)
+            if i >= n:
+                break
+            price = float(prices[i])
+
+            action = self.grid.decide(price)
+            if action == 'sell':
+                amount, _ = self.grid.closeLastPosition(price)
+                self.sell(amount, price)
+                self.n_sells += 1
+            elif action == 'stoploss':
+                amount, _ = self.grid.closeOldestPosition()
+                self.sell(amount, price)
+                self.n_stoplosses += 1
+            elif action == 'buy':
+                if not self.buy(price):
+                    i += 1
+                    continue
+            elif action == 'reset':
+                self.grid.reset_grid(price)
+                self.n_resets += 1
+            elif action == 'ladder':
+                self.tradeLadder(price)
+
+            fill_index.append(i)
+            fill_stake.append(self.stake_balance)
+            fill_trade.append(self.trade_balance)
+            lower, upper = self.grid.band()
+            i += 1
+
+        elapsed = time.perf_counter() - start
+
+        # equity curve: balances are step functions of the tick index
+        steps = np.searchsorted(fill_index, np.arange(len(prices)), side='right') - 1
+        equity = np.asarray(fill_stake)[steps] + np.asarray(fill_trade)[steps] * prices
+        drawdown = np.maximum.accumulate(equity) - equity
+        max_drawdown_index = int(np.argmax(drawdown))
+        peak = np.maximum.accumulate(equity)[max_drawdown_index]
+
+        start_equity = float(equity[0])
+        end_equity = float(equity[-1])
+        report = {
+            'ticks': len(prices),
+            'elapsed': elapsed,
+            'ticks_per_second': len(prices) / elapsed if elapsed > 0 else np.inf,
+            'start_equity': start_equity,
+            'end_equity': end_equity,
+            'pnl': end_equity - start_equity,
+            'pnl_percent': (end_equity - start_equity) / start_equity * 100,
+            'market_change_percent': float((prices[-1] - prices[0]) / prices[0] * 100),
+            'trades': self.n_buys + self.n_sells + self.n_stoplosses,
+            'buys': self.n_buys,
+            'sells': self.n_sells,
+            'stoplosses': self.n_stoplosses,
+            'resets': self.n_resets,
+            'open_trades': self.grid.active_trades,
+            'max_drawdown': float(drawdown[max_drawdown_index]),
+            'max_drawdown_percent': float(drawdown[max_drawdown_index] / peak * 100) if peak > 0 else 0.0
+        }
+        return(report)
+
+def backtest(prices, grid_step=0.01, max_open_trades=5, tradeable_stake=0.8, stoploss=None,
+        stake_balance=1000, fee=0.001, slippage=0.0, ndecimal_precision=5, fee_aware=False, strategy='band',
+        ladder_levels=100, ladder_lower=None, ladder_upper=None, ladder_width=0.1, ladder_spacing='arithmetic') -> dict:
+
+    # fee-aware grids widen the sell threshold by the commissions of the round trip, like the bot;
+    # a 'ladder' of static levels replaces the band of thresholds moving with the price
+    if strategy == 'ladder':
+        grid = LadderStrategy(
+            n_levels=ladder_levels,
+            lower=ladder_lower,
+            upper=ladder_upper,
+            width=ladder_width,
+            spacing=ladder_spacing,
+            tradeable_stake=tradeable_stake,
+            stoploss=stoploss,
+            fee_rate=fee if fee_aware else 0.0
+        )
+    else:
+        grid = GridStrategy(
+            grid_step=grid_step,
+            max_open_trades=max_open_trades,
+            tradeable_stake=tradeable_stake,
+            stoploss=stoploss,
+            fee_rate=fee if fee_aware else 0.0
+        )
+    backtester = Backtester(
+        grid,
+        fill_model=FillModel(fee=fee, slippage=slippage),
+        stake_balance=stake_balance,
+        ndecimal_precision=ndecimal_precision
+    )
+    return(backtester.run(prices))
+
+def printReport(path, report):
+
+    print('---')
+    print(f'{path}')
+    print(f'ticks: {report["ticks"]} in {report["elapsed"]:.2f} s ({report["ticks_per_second"]:.0f} ticks/s)')
+    print(f'pnl: {report["pnl"]:.4f} ({report["pnl_percent"]:.2f} %) | market change: {report["market_change_percent"]:.2f} %')
+    print(f'trades: {report["trades"]} (buys: {report["buys"]}, sells: {report["sells"]}, stoplosses: {report["stoplosses"]}) | grid resets: {report["resets"]} | open trades: {report["open_trades"]}')
+    print(f'max drawdown: {report["max_drawdown"]:.4f} ({report["max_drawdown_percent"]:.2f} %)')
+
+def parseArgs():
+
+    # ./backtest.py --data XRPBUSD-trades-2022-06.csv
+    parser = ap.ArgumentParser(description='Binance Grid Bot backtest')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '--data', metavar='FILE', type=str, nargs='+',
+        help='CSV or Parquet files of trades (price) or klines (open, high, low, close), or bot event logs (.jsonl)',
+        required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument('--symbol', type=str, default=None, help='symbol replayed from an event log of several pairs')
+    optional.add_argument('--grid_step', type=float, default=0.01)
+    optional.add_argument('--max_open_trades', type=int, default=5)
+    optional.add_argument('--tradeable_stake', type=float, default=0.8)
+    optional.add_argument(
+        '--stoploss', type=float, default=None,
+        help='loss tolerance of a position (default: grid_step * (max_open_trades + 1)); for the ladder, below its lowest level (default: none)')
+    optional.add_argument('--stake_balance', type=float, default=1000)
+    optional.add_argument('--fee', type=float, default=0.001, help='commission rate per fill')
+    optional.add_argument('--slippage', type=float, default=0.0, help='relative slippage per fill')
+    optional.add_argument(
+        '--fee_aware', action='store_true',
+        help='widen the sell threshold by the fees of the round trip, as the bot does')
+    optional.add_argument(
+        '--strategy', type=str, default='band', choices=['band', 'ladder'],
+        help='thresholds moving with the last trade (band), or a static ladder of price levels (default: band)')
+    optional.add_argument('--ladder_levels', type=int, default=100, help='price levels of the ladder')
+    optional.add_argument('--ladder_lower', type=float, default=None, help='lowest level of the ladder')
+    optional.add_argument('--ladder_upper', type=float, default=None, help='highest level of the ladder')
+    optional.add_argument(
+        '--ladder_width', type=float, default=0.1,
+        help='relative distance of the missing ladder bounds to the first price (default: 0.1)')
+    optional.add_argument('--ladder_spacing', type=str, default='arithmetic', choices=['arithmetic', 'geometric'])
+    optional.add_argument('--precision', type=int, default=5, help='number of decimals of the order quantity')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    args = parseArgs()
+    for path in args.data:
+        prices = loadPrices(path, args.symbol)
+        report = backtest(
+            prices,
+            grid_step=args.grid_step,
+            max_open_trades=args.max_open_trades,
+            tradeable_stake=args.tradeable_stake,
+            stoploss=args.stoploss,
+            stake_balance=args.stake_balance,
+            fee=args.fee,
+            slippage=args.slippage,
+            ndecimal_precision=args.precision,
+            fee_aware=args.fee_aware,
+            strategy=args.strategy,
+            ladder_levels=args.ladder_levels,
+            ladder_lower=args.ladder_lower,
+            ladder_upper=args.ladder_upper,
+            ladder_width=args.ladder_width,
+            ladder_spacing=args.ladder_spacing
+        )
+        printReport(path, report)
+
+if __name__ == '__main__':
+    main()
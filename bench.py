@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+# bench.py
+
+# reproducible benchmarks of the tick-processing hot path, the position bookkeeping,
+# the wallet database and the dashboard data preparation, saved as JSON for comparisons
+
+import argparse as ap
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import numpy as np
+from grid import GridStrategy, LadderStrategy
+from backtest import Backtester, FillModel, loadPrices
+from storage import Journal, WalletWriter, bulkInsertWallet, connect, queryRollup
+
+def randomWalk(n_ticks, seed=0, start=0.5, volatility=0.001) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    return(start * np.exp(np.concatenate([[0.0], np.cumsum(rng.normal(0, volatility, n_ticks - 1))])))
+
+def measure(run, setup=None, repeat=3) -> list:
+
+    # wall time of each repetition; setup is not timed and its result is passed to run
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        run(argument) if setup is not None else run()
+        times.append(time.perf_counter() - start)
+    return(times)
+
+def result(name, size, times, unit) -> dict:
+
+    # rate of the best repetition, the least disturbed by the rest of the machine
+    best = min(times)
+    return({
+        'name': name,
+        'size': size,
+        'unit': unit,
+        'best': best,
+        'median': float(np.median(times)),
+        'rate': size / best if best > 0 else float('inf')
+    })
+
+def simulatedBot(prices, db_file, strategy='band'):
+
+    # a grid bot trading the price path on the in-process simulator: orders go through the
+    # simulated client, the user-data events through the wallet ledger, and the fills to the
+    # wallet writer and the journal, as in a live run without the network
+    from bot import GridBot
+    from exchange import CommissionRates, SymbolInfoCache, WalletLedger
+    from simulator import Exchange, SimulatedClient, SimulatedSession
+
+    # the stake covers the minimum notional of 500 levels
+    symbols = {'XRPBUSD': {'trade_coin': 'XRP', 'stake_currency': 'BUSD', 'tick_size': 1e-5, 'prices': prices}}
+    exchange = Exchange(symbols, {'BUSD': 10000.0}, weight_limit=float('inf'))
+    client = SimulatedClient(exchange)
+    symbol_info = SymbolInfoCache(client, list(symbols), cache_file=None)
+    symbol_info.load()
+    commission_rates = CommissionRates(client, bnb_discount=0)
+    commission_rates.load()
+    ledger = WalletLedger(client, client.api_key, None)
+    ledger.reconcile()
+    ledger.stream_alive = True
+    exchange.user_callbacks.append(lambda key, msg: ledger.handleMessage(msg))
+    wallet_writer = WalletWriter(db_file)
+    wallet_writer.start()
+    bot = GridBot(
+        client.api_key, None, {'XRPBUSD': ['XRP', 'BUSD']}, client=client, session=SimulatedSession(exchange),
+        symbol_info=symbol_info, ledger=ledger, wallet_writer=wallet_writer, journal=Journal(db_file),
+        commission_rates=commission_rates, strategy=strategy, ladder_levels=500
+    )
+    wallet_writer.registerSymbol(bot.trade_symbol, bot.trade_coin, bot.stake_currency)
+    bot.updateTradingFees()
+    bot.checkAndTrackWallet()
+    bot.startGrid(exchange.price(bot.trade_symbol))
+    return(exchange, bot)
+
+def tradeSimulated(exchange, bot, n_ticks):
+
+    # the work of the trading thread for every tick, from the price to the order and its records
+    for _ in range(n_ticks):
+        exchange.step()
+        try:
+            bot.onPrice(exchange.price(bot.trade_symbol))
+        except Exception as e:
+            bot.handleException(e)
+    bot.wallet_writer.close()
+
+def benchDecision(prices, repeat) -> list:
+
+    # the bot requires the binance client, so it is only imported by this group; its events
+    # are kept off the console
+    from eventlog import eventlog
+
+    eventlog.configure(console=False)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        counter = iter(range(repeat * 2))
+        n_ticks = len(prices) - 1
+
+        def bandSetup():
+            return(simulatedBot(prices, os.path.join(tmp_dir, f'decision_{next(counter)}.db')))
+
+        def ladderSetup():
+            return(simulatedBot(prices, os.path.join(tmp_dir, f'decision_{next(counter)}.db'), strategy='ladder'))
+
+        def run(setup):
+            tradeSimulated(*setup, n_ticks)
+
+        results.append(result('bot_decision', n_ticks, measure(run, bandSetup, repeat), 'ticks'))
+        results.append(result('bot_decision_ladder_500', n_ticks, measure(run, ladderSetup, repeat), 'ticks'))
+
+    def runBacktest():
+        Backtester(GridStrategy(), FillModel()).run(prices)
+
+    results.append(result('backtest', len(prices), measure(runBacktest, repeat=repeat), 'ticks'))
+
+    # dense static ladder, crossed by most of the ticks
+    def runLadderBacktest():
+        Backtester(LadderStrategy(n_levels=500), FillModel()).run(prices)
+
+    results.append(result('backtest_ladder_500', len(prices), measure(runLadderBacktest, repeat=repeat), 'ticks'))
+    return(results)
+
+def benchPositions(depths, cycles, repeat, n_calls=10000) -> list:
+
+    # open `depth` positions, then close them LIFO (sell) or FIFO (stoploss); one op per push or pop
+    results = []
+    for depth in depths:
+
+        def setup():
+            return(GridStrategy(max_open_trades=depth))
+
+        def lifo(grid):
+            for _ in range(cycles):
+                for i in range(depth):
+                    grid.openPosition(1.0, 1.0 + i * 1e-4)
+                for _ in range(depth):
+                    grid.closeLastPosition(1.0)
+
+        def fifo(grid):
+            for _ in range(cycles):
+                for i in range(depth):
+                    grid.openPosition(1.0, 1.0 + i * 1e-4)
+                for _ in range(depth):
+                    grid.closeOldestPosition()
+
+        def buyAmount(grid):
+            for i in range(depth):
+                grid.openPosition(1.0, 1.0 + i * 1e-4)
+            grid.setGrid(1.0)
+            for _ in range(n_calls):
+                grid.buyAmount(1000.0, 5)
+
+        ops = 2 * cycles * depth
+        results.append(result(f'positions_lifo_depth_{depth}', ops, measure(lifo, setup, repeat), 'ops'))
+        results.append(result(f'positions_fifo_depth_{depth}', ops, measure(fifo, setup, repeat), 'ops'))
+        results.append(result(f'buy_amount_depth_{depth}', n_calls, measure(buyAmount, setup, repeat), 'ops'))
+    return(results)
+
+def benchWrites(n_rows, n_journal, repeat) -> list:
+
+    # rows per second through the background writer, from the first write() to the last commit
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        counter = iter(range(repeat * 2))
+
+        def writerSetup():
+            writer = WalletWriter(os.path.join(tmp_dir, f'write_{next(counter)}.db'), max_queue=n_rows + 1)
+            writer.start()
+            return(writer)
+
+        def write(writer):
+            ts = 1700000000000
+            for i in range(n_rows):
+                writer.writeWallet('XRPBUSD', ts + i * 1000, 1000.0 - i * 1e-3, i * 1e-3, 0.5)
+            writer.close()
+
+        results.append(result('wallet_write', n_rows, measure(write, writerSetup, repeat), 'rows'))
+
+        def journalSetup():
+            return(Journal(os.path.join(tmp_dir, f'journal_{next(counter)}.db')))
+
+        def record(journal):
+            for i in range(n_journal):
+                journal.record('XRPBUSD', 'buy', 0.5, 10.0, {'order_id': i, 'executed_qty': 10.0, 'quote_qty': 5.0, 'fill_price': 0.5})
+            journal.close()
+
+        results.append(result('journal_record', n_journal, measure(record, journalSetup, repeat), 'entries'))
+    return(results)
+
+def walletFixture(fixture_dir, n_rows, seed=0) -> str:
+
+    # deterministic wallet database of n_rows rows, one row every 10 s, built once and reused
+    os.makedirs(fixture_dir, exist_ok=True)
+    db_file = os.path.join(fixture_dir, f'wallet_{n_rows}_{seed}.db')
+    if os.path.exists(db_file):
+        return(db_file)
+    tmp_file = f'{db_file}.tmp'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    rng = np.random.default_rng(seed)
+    price = randomWalk(n_rows, seed=seed)
+    trade_balance = np.round(np.abs(np.cumsum(rng.normal(0, 1, n_rows))), 5)
+    stake_balance = 1000.0 - trade_balance * price
+    ts = 1700000000000 + np.arange(n_rows, dtype=np.int64) * 10000
+
+    cnx = connect(tmp_file)
+    cnx.execute('INSERT INTO symbols (symbol, trade_coin, stake_currency) VALUES (?, ?, ?)', ('XRPBUSD', 'XRP', 'BUSD'))
+    chunk = 1000000
+    for start in range(0, n_rows, chunk):
+        end = min(start + chunk, n_rows)
+        bulkInsertWallet(cnx, zip(
+            ['XRPBUSD'] * (end - start), ts[start:end].tolist(), stake_balance[start:end].tolist(),
+            trade_balance[start:end].tolist(), price[start:end].tolist()
+        ))
+    cnx.close()
+    os.replace(tmp_file, db_file)
+    return(db_file)
+
+def benchReads(fixture_dir, sizes, repeat) -> list:
+
+    # dashboard imports dash, so it is only required by this group
+    from dashboard import readWallet, startValues, computeProfit
+    from downsample import TieredSeries
+
+    results = []
+    for n_rows in sizes:
+        db_file = walletFixture(fixture_dir, n_rows)
+        cnx = connect(db_file)
+
+        results.append(result('wallet_read', n_rows, measure(lambda: readWallet(cnx, 'XRPBUSD'), repeat=repeat), 'rows'))
+        results.append(result('rollup_query_1h', n_rows, measure(lambda: queryRollup(cnx, 'XRPBUSD', '1h'), repeat=repeat), 'rows'))
+
+        # dashboard preparation: read, profit columns, resolution tiers and the first redraw
+        df_wallet = readWallet(cnx, 'XRPBUSD')
+        start = startValues(df_wallet)
+        results.append(result('dashboard_profit', n_rows, measure(lambda: computeProfit(df_wallet, start), repeat=repeat), 'rows'))
+        df_profit = computeProfit(df_wallet, start)
+        x = df_wallet['ts'].to_numpy(dtype=np.int64) * 1000000
+        y = df_profit['unrealized_profit'].to_numpy(dtype=float)
+        results.append(result('dashboard_tiers', n_rows, measure(lambda: TieredSeries(x, y), repeat=repeat), 'rows'))
+        series = TieredSeries(x, y)
+        results.append(result('dashboard_query_full', n_rows, measure(lambda: series.query(), repeat=repeat), 'rows'))
+        zoom = (x[len(x) // 2], x[len(x) // 2 + len(x) // 100])
+        results.append(result('dashboard_query_zoom', n_rows, measure(lambda: series.query(*zoom), repeat=repeat), 'rows'))
+
+        def prepare():
+            df = readWallet(cnx, 'XRPBUSD')
+            profit = computeProfit(df, startValues(df))
+            TieredSeries(df['ts'].to_numpy(dtype=np.int64) * 1000000, profit['unrealized_profit'].to_numpy(dtype=float)).query()
+
+        results.append(result('dashboard_prepare', n_rows, measure(prepare, repeat=repeat), 'rows'))
+        cnx.close()
+    return(results)
+
+def gitCommit():
+
+    try:
+        return(subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return(None)
+
+def compare(results, baseline_file):
+
+    # rate ratio of every benchmark present in both runs; below 1 is a regression
+    with open(baseline_file) as baseline_fh:
+        baseline = json.load(baseline_fh)
+    previous = {(r['name'], r['size']): r for r in baseline['results']}
+    print('---')
+    print(f'compared with {baseline_file} (commit {baseline["meta"].get("commit")})')
+    for r in results:
+        old = previous.get((r['name'], r['size']))
+        if old is None:
+            continue
+        ratio = r['rate'] / old['rate'] if old['rate'] > 0 else float('inf')
+        print(f'{r["name"]:<28} {r["size"]:>10}: {ratio:6.2f}x')
+
+def parseArgs():
+
+    # ./bench.py --output bench_results.json
+    # ./bench.py --groups decision positions --data XRPBUSD-trades-2022-06.csv --compare bench_results.json
+    parser = ap.ArgumentParser(description='Binance Grid Bot benchmarks')
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument(
+        '--groups', type=str, nargs='+', default=['decision', 'positions', 'writes', 'reads'],
+        choices=['decision', 'positions', 'writes', 'reads'])
+    optional.add_argument(
+        '--data', metavar='FILE', type=str, default=None,
+        help='CSV or Parquet file of trades or klines replayed by the decision benchmarks (default: seeded random walk)')
+    optional.add_argument('--ticks', type=int, default=1000000, help='ticks of the random walk')
+    optional.add_argument('--depths', type=int, nargs='+', default=[5, 100, 1000], help='open positions in the bookkeeping benchmarks')
+    optional.add_argument('--rows', type=int, default=100000, help='rows written in the wallet write benchmark')
+    optional.add_argument('--journal_entries', type=int, default=500, help='entries written in the journal benchmark')
+    optional.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 1000000, 10000000],
+        help='rows of the wallet databases read by the read and dashboard benchmarks')
+    optional.add_argument('--fixtures', type=str, default='bench_data', help='directory of the generated wallet databases')
+    optional.add_argument('--repeat', type=int, default=3)
+    optional.add_argument('--output', type=str, default='bench_results.json')
+    optional.add_argument('--compare', metavar='FILE', type=str, default=None, help='previous results to compare with')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    args = parseArgs()
+    results = []
+    if 'decision' in args.groups:
+        prices = loadPrices(args.data) if args.data is not None else randomWalk(args.ticks)
+        results += benchDecision(prices, args.repeat)
+    if 'positions' in args.groups:
+        results += benchPositions(args.depths, cycles=max(1, 100000 // max(args.depths)), repeat=args.repeat)
+    if 'writes' in args.groups:
+        results += benchWrites(args.rows, args.journal_entries, args.repeat)
+    if 'reads' in args.groups:
+        results += benchReads(args.fixtures, args.sizes, args.repeat)
+
+    print('---')
+    for r in results:
+        print(f'{r["name"]:<28} {r["size"]:>10}: {r["rate"]:>14,.0f} {r["unit"]}/s (best {r["best"]:.4f} s, median {r["median"]:.4f} s)')
+
+    output = {
+        'meta': {
+            'commit': gitCommit(),
+            'time': str(datetime.datetime.now()),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'data': args.data,
+            'ticks': args.ticks if args.data is None else None,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as output_fh:
+        json.dump(output, output_fh, indent=2)
+    print(f'results written to {args.output}')
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,38 @@
 # Author: Alessandro Lussana <alussana@ebi.ac.uk>
 
 import argparse as ap
-import datetime
+import asyncio
+import concurrent.futures
+import json
+import math
+import queue
+import threading
 import time
-import requests
-import sqlite3
-import pandas as pd
+import uuid
 import numpy as np
 from binance.client import Client
-from binance import BinanceSocketManager
+from binance.exceptions import BinanceAPIException
+from binance import AsyncClient, BinanceSocketManager
+from grid import GridStrategy, LadderStrategy
+from exchange import DEFAULT_API_URL, CommissionRates, SymbolInfoCache, WalletLedger, parseOrderFills, splitOrderFills, useEndpoint
+from storage import WalletWriter, Journal
+from scheduler import RestSession, WeightBudget
+from livestate import LiveState
+from metrics import metrics
+from eventlog import eventlog, finite
+
+# default time window (s) of the starting reference price: the klines VWAP covers the last five
+# minutes of trades, while the stream mean delays the first trade by its whole window
+REFERENCE_WINDOWS = {'klines': 300, 'stream': 5}
 
 class GridBot:
 
-    def __init__(self, key, secret, trade_pair = {'BTCUSDT': ['BTC', 'USDT']}, test=True):
+    def __init__(self, key, secret, trade_pair = {'BTCUSDT': ['BTC', 'USDT']}, test=True, stream_type='trade',
+            grid_step=0.01, max_open_trades=5, tradeable_stake=0.8, client=None, session=None, db_file=None,
+            symbol_info=None, ledger=None, wallet_writer=None, journal=None, order_mode='market',
+            api_url=DEFAULT_API_URL, reference_source='klines', reference_window=None, commission_rates=None,
+            live_state=None, strategy='band', ladder_levels=100, ladder_lower=None, ladder_upper=None, ladder_width=0.1,
+            ladder_spacing='arithmetic', stoploss=None):
         
         # test mode
         self.test_mode = test
@@ -31,69 +51,153 @@ class GridBot:
         self.trade_coin = self.trade_pair[self.trade_symbol][0]
         self.stake_currency = self.trade_pair[self.trade_symbol][1]
 
-        # initialize client and socket manager
-        if self.test_mode:
+        # initialize client, unless shared with other bots; the async client and socket
+        # manager are created in stream()
+        if client is not None:
+            self.client = client
+        elif self.test_mode:
             self.client = Client(key, secret, testnet=True)
         else:
             self.client = Client(key, secret)
-            #client = await AsyncClient.create(api_key, api_secret)
-        self.socket_manager = BinanceSocketManager(self.client)
-        
-        # initialize trade socket
-        self.trade_socket = self.socket_manager.trade_socket(self.trade_symbol)
+        self.async_client = None
+        self.socket_manager = None
+
+        # price stream parameters
+        self.stream_type = stream_type # 'trade' or 'bookTicker'
+        self.stream_retry_interval = 30 # seconds of REST polling before reconnecting a lost websocket
+        self.poll_interval = 1.5 # seconds between REST price requests
         
-        # define price request url
-        self.price_url = f'https://api.binance.com/api/v3/ticker/price?symbol={self.trade_symbol}'
+        # define price request url, and the HTTP session budgeting the request weight of the
+        # price requests and of the client, unless shared with other bots
+        self.price_url = f'{api_url}/v3/ticker/price?symbol={self.trade_symbol}'
+        self.klines_url = f'{api_url}/v3/klines'
+        if session is None:
+            session = RestSession()
+            session.attach(self.client)
+        self.session = session
+
+        # wallet database, written by a background thread shared with other bots if any
+        self.db_file = db_file if db_file is not None else f'{self.trade_symbol}_wallet.db'
+        self.wallet_writer = wallet_writer
+
+        # journal of orders and grid state snapshots, used to resume a run
+        self.journal = journal
+        self.position_tolerance = 0.01 # relative shortfall of the trade balance tolerated when resuming positions
         
-        # wallet parameters
+        # wallet parameters; balances are read from the ledger kept by the user-data stream,
+        # which is shared with other bots if any and started in initialize() otherwise
         self.stake_balance = None
         self.trade_balance = None
-        self.tradeable_stake = 0.8 # proportion of tradeable stake currency
+        self.ledger = ledger
+
+        # order mode: 'market' orders sent on threshold crossings, or 'limit' orders resting at the thresholds
+        self.order_mode = order_mode
+        self.resting_orders = {} # side -> {'id', 'client_id', 'price', 'quantity'} of the resting limit orders
+        self.execution_reports = queue.Queue() # executionReport messages of this symbol from the user-data stream
+        self.client_order_prefix = f'grid{self.trade_symbol}'
         
-        # exchange parameters
-        self.min_quantity = self.getMinQty()
-        self.step_size = self.getStepSize()
-        self.ndecimal_precision = int(-np.log10(self.step_size))
-        # TODO get trading fees
+        # exchange parameters, from the symbol filters cache shared with other bots if any
+        if symbol_info is None:
+            symbol_info = SymbolInfoCache(self.client, [self.trade_symbol])
+            symbol_info.startRefresh()
+        self.symbol_info = symbol_info
+        self.symbol_info.callbacks.append(self.onFiltersChanged)
+        self.updateExchangeParameters()
+
+        # commission rates, from the cache shared with other bots if any; loaded in initialize()
+        if commission_rates is None:
+            commission_rates = CommissionRates(self.client)
+            commission_rates.startRefresh()
+        self.commission_rates = commission_rates
+        self.commission_rates.callbacks.append(self.onCommissionChanged)
         
-        # grid parameters
-        self.grid_step = 0.01
-        self.max_open_trades = 5
-        self.sell_threshold = None
-        self.buy_threshold = None
-        self.trades_amount = [] # LIFO queue of active trades amounts
-        self.trades_price = [] # prices corresponding to the the positions in self.trades_amount
-        self.active_trades = 0  # number of active trades
-        self.stoploss = self.grid_step * (self.max_open_trades + 1) # loss tolerance for a position before triggering sell order
-        self.stoploss_price = -np.inf # price that will trigger the stoploss for the oldest position
+        # grid state and parameters: a 'band' of thresholds moved with every trade, or a static
+        # 'ladder' of levels whose crossings are traded with one market order per tick
+        self.strategy = strategy
+        if strategy == 'ladder':
+            if order_mode != 'market':
+                raise ValueError('the ladder strategy trades with market orders only')
+            self.grid = LadderStrategy(
+                n_levels=ladder_levels, lower=ladder_lower, upper=ladder_upper, width=ladder_width,
+                spacing=ladder_spacing, tradeable_stake=tradeable_stake, stoploss=stoploss
+            )
+        else:
+            self.grid = GridStrategy(
+                grid_step=grid_step, max_open_trades=max_open_trades, tradeable_stake=tradeable_stake, stoploss=stoploss
+            )
         self.price = None # current price
 
+        # starting reference price: VWAP of the 'klines' of the last reference_window seconds,
+        # or mean price of the first reference_window seconds of the 'stream'
+        self.reference_source = reference_source
+        self.reference_window = reference_window if reference_window is not None else REFERENCE_WINDOWS[reference_source]
+        self.reference_start = None # time of the first price of the stream window, in ms
+        self.reference_sum = 0.0
+        self.reference_count = 0
+
+        # live grid state published to the memory-mapped file read by the dashboard, if any
+        self.live_state = live_state
+        self.publish_interval = 0.25 # seconds between publications of unchanged grids
+        self.publish_time = 0.0
+
+        # streamed ticks are evaluated by a trading thread of the bot, so that its blocking order
+        # requests stall neither the event loop nor the other pairs; a tick waiting there is
+        # replaced by a newer one, and streamed ticks older than the last one evaluated are
+        # dropped; the prices polled over REST carry no event time and are always evaluated
+        self.pending_tick = None # (price, event_time) of the newest tick not yet evaluated
+        self.tick_condition = threading.Condition()
+        self.last_event_time = None
+        self.ticks_dropped = 0
+        self.trading_thread = None
+
     def getStepSize(self) -> float:
 
-        filters = self.client.get_symbol_info(self.trade_symbol)['filters']
-        filters_dict = {}
-        for filter in filters:
-            filters_dict[filter['filterType']] = filter
-        stepSize = float(filters_dict['LOT_SIZE']['stepSize'])
-        return(stepSize)
+        return(self.symbol_info.getStepSize(self.trade_symbol))
     
     def getFreeAssetBalance(self, asset: str) -> float:
 
-        return(float(self.client.get_asset_balance(asset=asset)['free']))
+        return(self.ledger.getFreeBalance(asset))
     
     def getPrice(self) -> float:
 
-        response = requests.get(self.price_url).json()
+        with metrics.span('get_price'):
+            response = self.session.get(self.price_url)
+            response.raise_for_status()
+            response = response.json()
         return(float(response['price']))
 
     def getMinQty(self) -> float:
 
-        filters = self.client.get_symbol_info(self.trade_symbol)['filters']
-        filters_dict = {}
-        for filter in filters:
-            filters_dict[filter['filterType']] = filter
-        minQty = float(filters_dict['LOT_SIZE']['minQty'])
-        return(minQty)
+        return(self.symbol_info.getMinQty(self.trade_symbol))
+
+    def getTickSize(self) -> float:
+
+        return(self.symbol_info.getTickSize(self.trade_symbol))
+
+    def getMinNotional(self) -> float:
+
+        return(self.symbol_info.getMinNotional(self.trade_symbol))
+
+    def updateExchangeParameters(self):
+
+        self.min_quantity = self.getMinQty()
+        self.step_size = self.getStepSize()
+        self.ndecimal_precision = int(-np.log10(self.step_size))
+        self.tick_size = self.getTickSize()
+        self.nprice_precision = int(-np.log10(self.tick_size))
+        self.min_notional = self.getMinNotional()
+
+    def onFiltersChanged(self, symbols):
+
+        if self.trade_symbol in symbols:
+            self.updateExchangeParameters()
+
+            # log
+            eventlog.emit(
+                'info', self.trade_symbol,
+                [f'{self.trade_symbol} filters updated: min quantity {self.min_quantity} | step size {self.step_size} | tick size {self.tick_size} | min notional {self.min_notional}'],
+                min_qty=self.min_quantity, step_size=self.step_size, tick_size=self.tick_size, min_notional=self.min_notional
+            )
         
     def getServerTime(self):
 
@@ -102,15 +206,24 @@ class GridBot:
     
     def getTradingFees(self) -> float:
 
-        if self.test_mode:
-            # the testnet key seems to be invalid when calling client.get_trade_fee()
-            return(0)
-        else:
-            fees = self.client.get_trade_fee(symbol=self.trade_symbol)
-            fee = fees # TODO get taker or maker commissions
-            return(fee)
+        # resting limit orders are filled as maker, market orders as taker
+        return(self.commission_rates.get('maker' if self.order_mode == 'limit' else 'taker'))
+
+    def updateTradingFees(self):
+
+        # the grid thresholds are moved by the next fill or reset, not retroactively
+        self.grid.fee_rate = self.getTradingFees()
 
-    def checkAndTrackWallet(self):
+    def onCommissionChanged(self, rates):
+
+        self.updateTradingFees()
+
+    def checkAndTrackWallet(self, log=False):
+
+        with metrics.span('wallet_write'):
+            self.trackWallet(log)
+
+    def trackWallet(self, log=False):
 
         changes_detected = False
         
@@ -128,31 +241,58 @@ class GridBot:
 
         # write to wallet database if changes are detected
         if changes_detected:
-            local_time = datetime.datetime.now()
-            df = pd.DataFrame({
-                'local_time': local_time, 
-                self.stake_currency: self.stake_balance,
-                self.trade_coin: self.trade_balance,
-                f'{self.trade_symbol}_price': self.price
-                },
-                index=[local_time]
-                )
-            df.to_sql(self.trade_symbol, self.sql_wallet_cnx, if_exists='append', index=True)
+            self.wallet_writer.writeWallet(
+                self.trade_symbol, int(time.time() * 1000), self.stake_balance, self.trade_balance, self.price
+            )
+
+        # log
+        if changes_detected or log:
+            eventlog.emit(
+                'wallet', self.trade_symbol, [f'current stake balance: {self.stake_balance}'] if log else (),
+                trade_coin=self.trade_coin, stake_currency=self.stake_currency, stake_balance=self.stake_balance,
+                trade_balance=self.trade_balance, price=self.price, changed=changes_detected
+            )
+
+    def gridFields(self) -> dict:
+
+        # grid state attached to the grid events
+        return({
+            'buy_threshold': finite(self.grid.buy_threshold),
+            'sell_threshold': finite(self.grid.sell_threshold),
+            'stoploss_price': finite(self.grid.stoploss_price),
+            'positions': self.grid.trades_amount
+        })
+
+    def logGrid(self, action, lines=(), separator=False, **fields):
+
+        eventlog.emit(
+            'grid', self.trade_symbol,
+            list(lines) + [f'buy_threshold set at {self.grid.buy_threshold} | sell_threshold set at {self.grid.sell_threshold}'],
+            separator, action=action, **self.gridFields(), **fields
+        )
+
+    def createOrder(self, **params):
+
+        # time the request, and the delay between sending it and its execution on the exchange
+        send_time = time.time()
+        with metrics.span('create_order'):
+            order = self.client.create_order(**params)
+        if 'transactTime' in order:
+            metrics.record('order_to_transact', order['transactTime'] / 1000 - send_time)
+        return(order)
 
     def placeBuyOrder(self):
 
+        buy_threshold = self.grid.buy_threshold
+
         # get stake balance
         self.stake_balance = self.getFreeAssetBalance(self.stake_currency)
 
         # determine the amount to buy
-        total_stake = self.stake_balance
-        for i in range(len(self.trades_amount)):
-            total_stake = total_stake + self.trades_amount[i] * self.trades_price[i]
-        stake_amount = total_stake * self.tradeable_stake / self.max_open_trades
-        amount = round(stake_amount / self.buy_threshold, self.ndecimal_precision)
+        amount = self.grid.buyAmount(self.stake_balance, self.ndecimal_precision)
 
         # perform buy order
-        order = self.client.create_order(
+        order = self.createOrder(
             symbol=self.trade_symbol,
             side='BUY',
             type='MARKET',
@@ -160,53 +300,92 @@ class GridBot:
         )
 
         # get order details
-        time = order['transactTime']
-        # TODO
-            
-        # update the amount of active trades
-        self.active_trades += 1
+        fills = parseOrderFills(order)
+        time = fills['transact_time']
 
-        # add the amount to the LIFO queue of active trades amounts
-        self.trades_amount.append(amount)
+        # apply the order to the ledger until the stream reports it
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, 'BUY', fills)
 
-        # add the price to the LIFO queue of active trades prices
-        self.trades_price.append(self.price)
+        # add the position to the grid and move it
+        self.grid.openPosition(
+            self.netQuantity(fills), self.price,
+            order_id=fills['order_id'], fill_price=fills['fill_price'], fees=fills['commission'], time=time
+        )
+        self.journalEvent('buy', self.price, self.grid.positions.last.amount, fills, self.grid.positions.last.expected_pnl)
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: buy order placed for {amount} {self.trade_coin} triggered by buy threshold ({self.buy_threshold}) at Binance server time {time}')
-        print(f'[{local_time}]: current active trades: {self.trades_amount}')
+        expected_pnl = self.grid.positions.last.expected_pnl
+        eventlog.emit(
+            'order', self.trade_symbol,
+            [f'buy order placed for {amount} {self.trade_coin} triggered by buy threshold ({buy_threshold}) at Binance server time {time}'],
+            True, side='BUY', type='MARKET', trigger='buy_threshold', threshold=buy_threshold, amount=amount,
+            price=self.price, order_id=fills['order_id'], transact_time=time
+        )
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'filled {fills["executed_qty"]} {self.trade_coin} at {fills["fill_price"]}; expected net pnl at the sell threshold {expected_pnl:.8f} {self.stake_currency}'],
+            side='BUY', grid_price=self.price, expected_pnl=expected_pnl, **fills
+        )
+        self.logGrid('buy', [f'current active trades: {self.grid.trades_amount}'])
 
-        # move grid
-        self.buy_threshold = round(self.price * (1 - self.grid_step), 5)
-        self.sell_threshold = round(self.price * (1 + self.grid_step), 5)
+        # check wallet, if changes are detected, write on database
+        self.checkAndTrackWallet(log=True)
+    
+    def placeSellOrder(self):
 
-        # set stoploss price if no older positions exist
-        if self.active_trades == 1:
-            self.stoploss_price = self.trades_price[0] * (1 - self.stoploss)
+        # determine the amount to sell from the LIFO queue of active trades
+        amount = self.grid.positions.last.amount
+        sell_threshold = self.grid.sell_threshold
 
-        # log
-        local_time = datetime.datetime.now()       
-        print(f'[{local_time}]: buy_threshold set at {self.buy_threshold} | sell_threshold set at {self.sell_threshold}')
+        # perform the sell order
+        order = self.createOrder(
+            symbol=self.trade_symbol,
+            side='SELL',
+            type='MARKET',
+            quantity=amount
+        )
 
-        # check wallet, if changes are detected, write on database
-        self.checkAndTrackWallet()
+        # get order details
+        fills = parseOrderFills(order)
+        time = fills['transact_time']
 
+        # apply the order to the ledger until the stream reports it
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, 'SELL', fills)
+
+        # remove the position from the grid and move it
+        expected_pnl = self.grid.positions.last.expected_pnl
+        amount, buy_price = self.grid.closeLastPosition(self.price)
+        self.journalEvent('sell', self.price, amount, fills, expected_pnl)
+        
         # log
-        local_time = datetime.datetime.now()
-        print(f'[{local_time}]: current stake balance: {self.stake_balance}')
+        eventlog.emit(
+            'order', self.trade_symbol,
+            [f'sell order placed for {amount} {self.trade_coin} triggered by sell threshold ({sell_threshold}) at Binance server time {time}'],
+            True, side='SELL', type='MARKET', trigger='sell_threshold', threshold=sell_threshold, amount=amount,
+            price=self.price, order_id=fills['order_id'], transact_time=time
+        )
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'expected buy price was {buy_price}; expected sell price is {self.price}; filled at {fills["fill_price"]}'],
+            side='SELL', grid_price=self.price, buy_price=buy_price, expected_pnl=expected_pnl, **fills
+        )
+        self.logGrid('sell', [f'current active trades: {self.grid.trades_amount}'])
+
+        # check wallet, if changes are detected, write on database
+        self.checkAndTrackWallet(log=True)
     
-    def placeSellOrder(self):
+    def executeStoploss(self):
 
-        # determine the amount to sell from the LIFO queue of active trades
-        amount = self.trades_amount.pop()
+        # determine the amount to sell from the oldest active trade
+        amount = self.grid.positions.first.amount
+        stoploss_price = self.grid.stoploss_price
 
-        # remove the position from the list of active trades prices
-        buy_price = self.trades_price.pop()
+        # release the coins locked by the resting orders
+        if self.order_mode == 'limit':
+            self.cancelRestingOrders()
 
         # perform the sell order
-        order = self.client.create_order(
+        order = self.createOrder(
             symbol=self.trade_symbol,
             side='SELL',
             type='MARKET',
@@ -214,176 +393,1051 @@ class GridBot:
         )
 
         # get order details
-        time = order['transactTime']
-        # TODO
-        
-        # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: sell order placed for {amount} {self.trade_coin} triggered by sell threshold ({self.sell_threshold}) at Binance server time {time}')
-        print(f'[{local_time}]: expected buy price was {buy_price}; expected sell price is {self.price}')
-        print(f'[{local_time}]: current active trades: {self.trades_amount}')
+        fills = parseOrderFills(order)
+        time = fills['transact_time']
 
-        # move grid
-        self.buy_threshold = round(self.price * (1 - self.grid_step), 5)
-        self.sell_threshold = round(self.price * (1 + self.grid_step), 5)
+        # apply the order to the ledger until the stream reports it
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, 'SELL', fills)
 
-        # update the number of active trades
-        self.active_trades -= 1
+        # remove the oldest position from the grid
+        self.grid.closeOldestPosition()
+        self.journalEvent('stoploss', self.price, amount, fills)
 
         # log
-        local_time = datetime.datetime.now()
-        print(f'[{local_time}]: buy_threshold set at {self.buy_threshold} | sell_threshold set at {self.sell_threshold}')
+        eventlog.emit(
+            'order', self.trade_symbol,
+            [f'sell order placed for {amount} {self.trade_coin} triggered by stoploss threshold ({stoploss_price}) at Binance server time {time}'],
+            True, side='SELL', type='MARKET', trigger='stoploss', threshold=stoploss_price, amount=amount,
+            price=self.price, order_id=fills['order_id'], transact_time=time
+        )
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'filled {fills["executed_qty"]} {self.trade_coin} at {fills["fill_price"]}'],
+            side='SELL', grid_price=self.price, **fills
+        )
+        eventlog.emit(
+            'grid', self.trade_symbol, [f'current active trades: {self.grid.trades_amount}'],
+            action='stoploss', **self.gridFields()
+        )
+
+        # rest new orders around the current grid
+        if self.order_mode == 'limit':
+            self.placeRestingOrders()
 
         # check wallet, if changes are detected, write on database
-        self.checkAndTrackWallet()
+        self.checkAndTrackWallet(log=True)
+
+    def reset_grid(self):
+
+        # set new buy and sell thresholds
+        self.grid.reset_grid(self.price)
+        self.journalEvent('reset', self.price)
 
         # log
-        local_time = datetime.datetime.now()
-        print(f'[{local_time}]: current stake balance: {self.stake_balance}')
-    
-    def executeStoploss(self):
+        self.logGrid('reset', ['sell threshold crossed but no active trades - resetting grid'], separator=True)
 
-        # determine the amount to sell from the oldest active trade
-        amount = self.trades_amount.pop(0)
+        # move the resting buy order to the new threshold
+        if self.order_mode == 'limit':
+            self.placeRestingOrders()
+
+    def tradeLadder(self):
+
+        # all the ladder levels crossed since the last price are traded with a single order; the
+        # cursor only moves past the levels traded, also when the order fails
+        trigger, levels = self.grid.cross(self.price)
+        try:
+            if trigger == 'buy':
+                self.placeLadderBuyOrder(levels)
+            elif trigger is not None:
+                self.placeLadderSellOrder(trigger, levels)
+        finally:
+            self.grid.moveCursor(self.price, trigger, levels)
+
+    def placeLadderBuyOrder(self, levels):
+
+        # get stake balance
+        self.stake_balance = self.getFreeAssetBalance(self.stake_currency)
+
+        # the amount of every level, from the highest one, as long as the stake balance covers
+        # them at their level price, above the market price that crossed them
+        amounts = {}
+        cost = 0.0
+        for level in reversed(levels):
+            amount = self.grid.buyAmount(self.stake_balance, self.ndecimal_precision, level)
+            cost += amount * self.grid.levels[level] * (1 + self.grid.fee_rate)
+            if cost > self.stake_balance:
+                break
+            amounts[level] = amount
+        quantity = round(sum(amounts.values()), self.ndecimal_precision)
+        if not self.isTradeable(self.price, quantity):
+
+            # log
+            eventlog.emit(
+                'error', self.trade_symbol,
+                [f'buy order of {quantity} {self.trade_coin} for {len(levels)} ladder levels below the exchange minimums or the stake balance; not placed'],
+                side='BUY', amount=quantity, price=self.price, levels=[self.grid.levels[level] for level in levels]
+            )
+            return
+
+        # perform buy order
+        order = self.createOrder(
+            symbol=self.trade_symbol,
+            side='BUY',
+            type='MARKET',
+            quantity=quantity
+        )
+
+        # get order details
+        fills = parseOrderFills(order)
+        time = fills['transact_time']
+
+        # apply the order to the ledger until the stream reports it
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, 'BUY', fills)
+
+        # one position per level, sharing the fills of the order
+        expected_pnl = 0.0
+        for level, amount in amounts.items():
+            level_fills = splitOrderFills(fills, amount / quantity)
+            self.grid.openLevel(
+                level, self.netQuantity(level_fills),
+                order_id=fills['order_id'], fill_price=fills['fill_price'], fees=level_fills['commission'], time=time
+            )
+            position = self.grid.held[level]
+            self.journalEvent('buy', position.price, position.amount, level_fills, position.expected_pnl)
+            expected_pnl += position.expected_pnl
+
+        # log
+        level_prices = [self.grid.levels[level] for level in amounts]
+        eventlog.emit(
+            'order', self.trade_symbol,
+            [f'buy order placed for {quantity} {self.trade_coin} triggered by {len(amounts)} ladder levels ({level_prices[-1]} to {level_prices[0]}) at Binance server time {time}'],
+            True, side='BUY', type='MARKET', trigger='ladder', levels=level_prices, amount=quantity,
+            price=self.price, order_id=fills['order_id'], transact_time=time
+        )
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'filled {fills["executed_qty"]} {self.trade_coin} at {fills["fill_price"]}; expected net pnl at the sell levels {expected_pnl:.8f} {self.stake_currency}'],
+            side='BUY', grid_price=self.price, expected_pnl=expected_pnl, **fills
+        )
+        self.logGrid('buy', [f'current active trades: {self.grid.active_trades}'])
+
+        # check wallet, if changes are detected, write on database
+        self.checkAndTrackWallet(log=True)
 
-        # remove the oldest position from trades_price
-        self.trades_price.pop(0)
+    def placeLadderSellOrder(self, trigger, levels):
+
+        # sell the positions of all the levels together
+        quantity = round(sum(self.grid.held[level].amount for level in levels), self.ndecimal_precision)
 
         # perform the sell order
-        order = self.client.create_order(
+        order = self.createOrder(
             symbol=self.trade_symbol,
             side='SELL',
             type='MARKET',
-            quantity=amount
+            quantity=quantity
         )
 
         # get order details
-        time = order['transactTime']
-        # TODO
+        fills = parseOrderFills(order)
+        time = fills['transact_time']
+
+        # apply the order to the ledger until the stream reports it
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, 'SELL', fills)
+
+        # remove the positions from the ladder; they are journaled at their level
+        expected_pnl = 0.0
+        buy_prices = []
+        for level in levels:
+            position_pnl = self.grid.held[level].expected_pnl if trigger == 'sell' else None
+            amount, buy_price = self.grid.closeLevel(level)
+            self.journalEvent(trigger, buy_price, amount, splitOrderFills(fills, amount / quantity), position_pnl)
+            expected_pnl += position_pnl or 0.0
+            buy_prices.append(buy_price)
+
+        # log
+        trigger_line = 'stoploss threshold' if trigger == 'stoploss' else f'{len(levels)} ladder levels'
+        eventlog.emit(
+            'order', self.trade_symbol,
+            [f'sell order placed for {quantity} {self.trade_coin} triggered by {trigger_line} at Binance server time {time}'],
+            True, side='SELL', type='MARKET', trigger=trigger if trigger == 'stoploss' else 'ladder', amount=quantity,
+            price=self.price, order_id=fills['order_id'], transact_time=time
+        )
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'positions bought at {buy_prices[0]} to {buy_prices[-1]}; expected sell price is {self.price}; filled at {fills["fill_price"]}'],
+            side='SELL', grid_price=self.price, buy_prices=buy_prices,
+            expected_pnl=expected_pnl if trigger == 'sell' else None, **fills
+        )
+        self.logGrid(trigger, [f'current active trades: {self.grid.active_trades}'])
+
+        # check wallet, if changes are detected, write on database
+        self.checkAndTrackWallet(log=True)
+
+    def roundPrice(self, price, up=False) -> float:
+
+        # round a price to the tick size, towards the inside of the grid
+        ticks = price / self.tick_size
+        ticks = math.ceil(round(ticks, 8)) if up else math.floor(round(ticks, 8))
+        return(round(ticks * self.tick_size, self.nprice_precision))
+
+    def roundQuantity(self, quantity) -> float:
+
+        steps = math.floor(round(quantity / self.step_size, 8))
+        return(round(steps * self.step_size, self.ndecimal_precision))
+
+    def netQuantity(self, fills) -> float:
+
+        # the trade coin bought, less the commission taken in it, as a sellable quantity
+        commission = fills['commission'].get(self.trade_coin, 0.0)
+        return(self.roundQuantity(fills['executed_qty'] - commission))
+
+    def newClientOrderId(self) -> str:
+
+        return(f'{self.client_order_prefix}{uuid.uuid4().hex[:16]}')
 
-        # update the amount of active trades
-        self.active_trades -= 1
+    def isTradeable(self, price, quantity) -> bool:
+
+        return(quantity >= self.min_quantity and price * quantity >= self.min_notional)
+
+    def cancelOpenOrders(self):
+
+        # cancel the limit orders left resting by a previous run
+        for order in self.client.get_open_orders(symbol=self.trade_symbol):
+            if order['clientOrderId'].startswith(self.client_order_prefix):
+                self.client.cancel_order(symbol=self.trade_symbol, orderId=order['orderId'])
+
+                # log
+                eventlog.emit(
+                    'order', self.trade_symbol, [f'cancelled {order["side"]} order {order["orderId"]} left by a previous run'],
+                    side=order['side'], type='CANCEL', order_id=order['orderId']
+                )
+
+    def cancelRestingOrders(self):
+
+        for side in list(self.resting_orders):
+            self.cancelRestingOrder(side)
+
+    def cancelRestingOrder(self, side):
+
+        resting = self.resting_orders.pop(side)
+        try:
+            self.client.cancel_order(symbol=self.trade_symbol, orderId=resting['id'])
+        except BinanceAPIException as e:
+            # the order was filled in the meantime; the fill is applied from the user-data stream
+            eventlog.emit(
+                'error', self.trade_symbol, [f'cannot cancel {side} order {resting["id"]}: {e.message}'],
+                side=side, order_id=resting['id'], message=e.message
+            )
+            return
+
+        # log
+        eventlog.emit('order', self.trade_symbol, (), side=side, type='CANCEL', order_id=resting['id'])
+
+    def placeRestingOrder(self, side, price, quantity):
+
+        resting = self.resting_orders.get(side)
+        if resting is not None and resting['price'] == price and resting['quantity'] == quantity:
+            return
+
+        client_id = self.newClientOrderId()
+        params = {
+            'symbol': self.trade_symbol,
+            'side': side,
+            'type': 'LIMIT',
+            'timeInForce': 'GTC',
+            'quantity': quantity,
+            'price': f'{price:.{self.nprice_precision}f}',
+            'newClientOrderId': client_id
+        }
+        try:
+            if resting is None:
+                order = self.createOrder(**params)
+            else:
+                # cancel the resting order and place the new one in a single request;
+                # nothing is placed if the old order was filled in the meantime
+                with metrics.span('cancel_replace_order'):
+                    response = self.client.cancel_replace_order(
+                        cancelReplaceMode='STOP_ON_FAILURE',
+                        cancelOrderId=resting['id'],
+                        **params
+                    )
+                order = response['newOrderResponse']
+        except BinanceAPIException as e:
+            self.resting_orders.pop(side, None)
+            eventlog.emit(
+                'error', self.trade_symbol, [f'cannot place {side} limit order at {price}: {e.message}'],
+                side=side, price=price, quantity=quantity, message=e.message
+            )
+            return
+
+        self.resting_orders[side] = {'id': order['orderId'], 'client_id': client_id, 'price': price, 'quantity': quantity}
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: sell order placed for {amount} {self.trade_coin} triggered by stoploss threshold ({self.stoploss_price}) at Binance server time {time}')
-        print(f'[{local_time}]: current active trades: {self.trades_amount}')
-
-        # update stoploss trigger price
-        if self.active_trades > 0:
-            self.stoploss_price = self.trades_price[0] * (1 - self.stoploss)
+        eventlog.emit(
+            'order', self.trade_symbol, [f'{side} limit order {order["orderId"]} resting at {price} for {quantity} {self.trade_coin}'],
+            side=side, type='LIMIT', price=price, amount=quantity, order_id=order['orderId'], client_order_id=client_id,
+            replaced_order_id=resting['id'] if resting is not None else None
+        )
+
+    def placeRestingOrders(self):
+
+        # buy order at the buy threshold, sized on the stake not locked by other orders
+        if self.grid.active_trades < self.grid.max_open_trades:
+            price = self.roundPrice(self.grid.buy_threshold)
+            resting = self.resting_orders.get('BUY')
+            stake_balance = self.getFreeAssetBalance(self.stake_currency)
+            if resting is not None:
+                stake_balance += resting['price'] * resting['quantity']
+            quantity = self.roundQuantity(self.grid.buyAmount(stake_balance, self.ndecimal_precision))
+            if self.isTradeable(price, quantity):
+                self.placeRestingOrder('BUY', price, quantity)
+            else:
+                eventlog.emit(
+                    'error', self.trade_symbol, [f'buy order of {quantity} {self.trade_coin} at {price} below the exchange minimums; not placed'],
+                    side='BUY', price=price, quantity=quantity, message='below the exchange minimums'
+                )
+        elif 'BUY' in self.resting_orders:
+            self.cancelRestingOrder('BUY')
+
+        # sell order at the sell threshold for the last position
+        if self.grid.active_trades > 0:
+            price = self.roundPrice(self.grid.sell_threshold, up=True)
+            quantity = self.roundQuantity(self.grid.positions.last.amount)
+            if self.isTradeable(price, quantity):
+                self.placeRestingOrder('SELL', price, quantity)
+        elif 'SELL' in self.resting_orders:
+            self.cancelRestingOrder('SELL')
+
+    def onExecutionReport(self, msg):
+
+        # called from the user-data stream thread: queue the reports of this bot's orders,
+        # which are applied to the grid from the trading loop
+        if msg['s'] == self.trade_symbol and msg['c'].startswith(self.client_order_prefix):
+            self.execution_reports.put(msg)
+
+    def processExecutionReports(self):
+
+        while True:
+            try:
+                msg = self.execution_reports.get_nowait()
+            except queue.Empty:
+                return
+
+            # only orders that stopped executing change the grid
+            if msg['X'] not in ('FILLED', 'CANCELED', 'EXPIRED', 'REJECTED'):
+                continue
+            executed_qty = float(msg['z'])
+            if executed_qty <= 0:
+                continue
+            side = msg['S']
+            resting = self.resting_orders.get(side)
+            if resting is not None and resting['id'] == msg['i']:
+                del self.resting_orders[side]
+            self.applyFill(side, msg)
+
+    def applyFill(self, side, msg):
+
+        executed_qty = float(msg['z'])
+        quote_qty = float(msg['Z'])
+        price = float(msg['p'])
+        fills = {
+            'order_id': msg['i'],
+            'client_order_id': msg['c'],
+            'status': msg['X'],
+            'transact_time': msg['T'],
+            'executed_qty': executed_qty,
+            'quote_qty': quote_qty,
+            'fill_price': quote_qty / executed_qty,
+            'commission': {msg['N']: float(msg['n'])} if msg['N'] else {}
+        }
+
+        # the limit price plays the role of the price that crossed the threshold
+        self.price = price
+        expected_pnl = None
+        if side == 'BUY':
+            self.grid.openPosition(
+                self.netQuantity(fills), price,
+                order_id=fills['order_id'], fill_price=fills['fill_price'], fees=fills['commission'], time=msg['T']
+            )
+            expected_pnl = self.grid.positions.last.expected_pnl
+            self.journalEvent('buy', price, self.grid.positions.last.amount, fills, expected_pnl)
+            action = 'buy'
+        elif self.grid.active_trades == 0:
+            # the position was already closed by a stoploss
+            self.journalEvent('late_sell', price, executed_qty, fills)
+            action = 'late_sell'
         else:
-            self.stoploss_price = -np.inf
+            if executed_qty < self.grid.positions.last.amount:
+                # partially filled before being cancelled: keep the rest of the position open
+                self.grid.reduceLastPosition(executed_qty, self.ndecimal_precision)
+                self.journalEvent('partial_sell', price, executed_qty, fills)
+                action = 'partial_sell'
+            else:
+                expected_pnl = self.grid.positions.last.expected_pnl
+                self.grid.closeLastPosition(price)
+                self.journalEvent('sell', price, executed_qty, fills, expected_pnl)
+                action = 'sell'
 
-        # check wallet, if changes are detected, write on database
+        # log
+        eventlog.emit(
+            'fill', self.trade_symbol,
+            [f'{side} limit order {msg["i"]} filled for {executed_qty} {self.trade_coin} at {fills["fill_price"]} at Binance server time {msg["T"]}'],
+            True, side=side, grid_price=price, expected_pnl=expected_pnl, **fills
+        )
+        self.logGrid(action, [f'current active trades: {self.grid.trades_amount}'])
+
+        # move the resting orders with the grid
+        self.ledger.applyOrder(self.trade_coin, self.stake_currency, side, fills, locked=True)
+        self.placeRestingOrders()
         self.checkAndTrackWallet()
+        self.publishState(force=True)
 
-        # log
-        local_time = datetime.datetime.now()
-        print(f'[{local_time}]: current stake balance: {self.stake_balance}')
+    def journalEvent(self, event, price, amount=None, fills=None, expected_pnl=None):
 
-    def reset_grid(self):
+        # append the event to the journal and snapshot the grid state periodically
+        if self.journal.record(self.trade_symbol, event, price, amount, fills, expected_pnl):
+            self.journal.snapshot(self.trade_symbol, self.grid.getState())
+
+    def reconcilePositions(self):
+
+        # drop the oldest positions that the trade balance cannot cover anymore
+        total_amount = self.grid.positions.total_amount
+        while self.grid.active_trades > 0 and total_amount > self.trade_balance * (1 + self.position_tolerance):
+            amount, buy_price = self.grid.closeOldestPosition()
+            self.journalEvent('drop', self.price, amount)
+            total_amount -= amount
+
+            # log
+            eventlog.emit(
+                'grid', self.trade_symbol,
+                [f'position of {amount} {self.trade_coin} bought at {buy_price} not covered by the trade balance ({self.trade_balance}); dropped'],
+                action='drop', amount=amount, buy_price=buy_price, **self.gridFields()
+            )
+
+    def resume(self) -> bool:
+
+        # rebuild the grid from the last snapshot and the events journaled after it
+        state, events = self.journal.load(self.trade_symbol)
+        if state is not None:
+            self.grid.setState(state)
+        for event, amount, price, order_id, fill_price, fees, transact_time in events:
+            self.grid.replayEvent(event, amount, price, order_id, fill_price, fees, transact_time)
+        if self.grid.buy_threshold is None:
+            return(False)
+
+        # check the positions against the exchange, then save the reconciled state
+        self.reconcilePositions()
+        self.journal.snapshot(self.trade_symbol, self.grid.getState())
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: sell threshold crossed but no active trades - resetting grid')
+        self.logGrid(
+            'resume',
+            [f'resumed {self.grid.active_trades} active trades from the journal ({len(events)} events after the last snapshot): {self.grid.trades_amount}'],
+            separator=True
+        )
+        return(True)
+
+    def getReferencePrice(self) -> float:
+
+        # volume-weighted average price over the last reference_window seconds, from a single
+        # request of one-minute klines; the last close, or the ticker, for a window without trades
+        params = {'symbol': self.trade_symbol, 'interval': '1m', 'limit': max(1, math.ceil(self.reference_window / 60))}
+        with metrics.span('get_reference_price'):
+            response = self.session.get(self.klines_url, params=params)
+            response.raise_for_status()
+            klines = response.json()
+        volume = sum(float(kline[5]) for kline in klines)
+        if volume > 0:
+            price = sum(float(kline[7]) for kline in klines) / volume
+        elif klines:
+            price = float(klines[-1][4])
+        else:
+            price = self.getPrice()
+        return(round(price, self.nprice_precision))
+
+    def collectReferencePrice(self, price, event_time=None):
+
+        # mean of the prices received during the first reference_window seconds of the stream,
+        # then the grid is set around it
+        now = event_time if event_time is not None else time.time() * 1000
+        if self.reference_start is None:
+            self.reference_start = now
+        self.reference_sum += price
+        self.reference_count += 1
+        if now - self.reference_start < self.reference_window * 1000:
+            return
+        self.startGrid(round(self.reference_sum / self.reference_count, self.nprice_precision))
+        if self.order_mode == 'limit':
+            self.placeRestingOrders()
+
+    def startGrid(self, reference_price):
 
-        # set new buy and sell thresholds
-        self.buy_threshold = round(self.price * (1 - self.grid_step), 5)
-        self.sell_threshold = round(self.price * (1 + self.grid_step), 5)
+        # set the starting grid thresholds
+        self.grid.setGrid(reference_price)
+        self.journalEvent('start', reference_price)
+        self.journal.snapshot(self.trade_symbol, self.grid.getState())
 
         # log
-        local_time = datetime.datetime.now()       
-        print(f'[{local_time}]: buy_threshold set at {self.buy_threshold} | sell_threshold set at {self.sell_threshold}')
-
-    def getMeanPrice(self):
-        price = 0
-        for i in range(10):
-            time.sleep(1)
-            price = price + self.getPrice()
-        mean_price = round(price / 10, 5) 
-        return(mean_price)
-    
-    def start(self):
+        lines = [f'reference price for {self.trade_symbol} initialized at {reference_price}.']
+        if self.strategy == 'ladder':
+            lines.append(f'{self.grid.n_levels} {self.grid.spacing} ladder levels from {self.grid.levels[0]} to {self.grid.levels[-1]}')
+        self.logGrid('start', lines, separator=True, reference_price=reference_price)
+
+    def initialize(self, reference_price=None):
         
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        if self.test_mode:
-            print(f'[{local_time}]: starting bot in test mode.')
-        else:
-            print(f'[{local_time}]: starting bot.')
+        eventlog.emit(
+            'info', self.trade_symbol, ['starting bot in test mode.' if self.test_mode else 'starting bot.'], True,
+            test=self.test_mode
+        )
         
-        # SQLite db for wallet and parameters
-        self.sql_wallet_cnx = sqlite3.connect(f'{self.trade_symbol}_wallet.db')
+        # wallet ledger, unless shared with other bots
+        if self.ledger is None:
+            self.ledger = WalletLedger(self.client, self.key, self.secret, test=self.test_mode)
+            self.ledger.start()
+
+        # SQLite db for wallet and parameters, unless shared with other bots
+        if self.wallet_writer is None:
+            self.wallet_writer = WalletWriter(self.db_file)
+            self.wallet_writer.start()
+        if self.journal is None:
+            self.journal = Journal(self.db_file)
+        self.wallet_writer.registerSymbol(self.trade_symbol, self.trade_coin, self.stake_currency)
+
+        # dump the latency histograms to the latency table periodically
+        metrics.startDump(self.wallet_writer)
+
+        # commission rate folded into the grid thresholds
+        self.updateTradingFees()
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: connected to SQLite database {self.trade_symbol}_wallet.db')
+        eventlog.emit('info', self.trade_symbol, [f'writing to SQLite database {self.db_file}'], True, db_file=self.db_file)
 
         # get starting balance
         self.checkAndTrackWallet()
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: starting stake balance is {self.stake_balance} {self.stake_currency}')
-        print(f'[{local_time}]: starting trade balance is {self.trade_balance} {self.trade_coin}')
-
-        # set the starting price
-        mean_price = self.getMeanPrice()
+        eventlog.emit(
+            'info', self.trade_symbol,
+            [f'starting stake balance is {self.stake_balance} {self.stake_currency}', f'starting trade balance is {self.trade_balance} {self.trade_coin}'],
+            True, stake_balance=self.stake_balance, trade_balance=self.trade_balance
+        )
 
-        # set the starting grid thresholds
-        self.buy_threshold = round(mean_price * (1 - self.grid_step), 5)
-        self.sell_threshold = round(mean_price * (1 + self.grid_step), 5)
+        # resume the grid of the previous run, if any; otherwise set it around the reference
+        # price, unless it is gathered from the first ticks of the price stream
+        resumed = self.resume()
+        if not resumed and self.reference_source == 'klines':
+            if reference_price is None:
+                reference_price = self.getReferencePrice()
+            self.startGrid(reference_price)
+        elif not resumed:
+
+            # log
+            eventlog.emit(
+                'info', self.trade_symbol,
+                [f'reference price for {self.trade_symbol} gathered from the first {self.reference_window} seconds of prices.'], True
+            )
+
+        # rest limit orders at the thresholds, replacing those of the previous run
+        if self.order_mode == 'limit':
+            self.ledger.execution_callbacks.append(self.onExecutionReport)
+            self.cancelOpenOrders()
+            if self.grid.buy_threshold is not None:
+                self.placeRestingOrders()
+
+        self.publishState(force=True)
 
         # log
-        local_time = datetime.datetime.now()
-        print('---')
-        print(f'[{local_time}]: mean price for {self.trade_symbol} initialized at {mean_price}.')
-        print(f'[{local_time}]: buy_threshold set at {self.buy_threshold} | sell_threshold set at {self.sell_threshold}')
-        print(f'[{local_time}]: trade starts.')
+        eventlog.emit('info', self.trade_symbol, ['trade starts.'])
+
+    def onPrice(self, price, event_time=None):
+
+        # delay between the trade on the exchange and its receipt, for streamed ticks
+        receipt_time = time.perf_counter()
+        if event_time is not None:
+            metrics.record('event_to_receipt', time.time() - event_time / 1000)
+
+        # apply the fills of the resting orders first
+        if self.order_mode == 'limit':
+            self.processExecutionReports()
+
+        self.price = price
+        eventlog.tick(self.trade_symbol, price, event_time)
+
+        # until the grid is set, prices only feed the reference price
+        if self.grid.buy_threshold is None:
+            self.collectReferencePrice(price, event_time)
+            return
+
+        # decide whether to trigger a stoploss, place a sell/buy order, reset the grid, or do nothing
+        action = self.grid.decide(self.price)
+        metrics.record('tick_to_decision', time.perf_counter() - receipt_time)
+        if self.order_mode == 'limit' and action in ('buy', 'sell'):
+            # crossings are filled by the resting orders
+            action = None
+        if action == 'sell':
+            self.placeSellOrder()
+        elif action == 'stoploss':
+            self.executeStoploss()
+        elif action == 'buy':
+            self.placeBuyOrder()
+        elif action == 'reset':
+            self.reset_grid()
+        elif action == 'ladder':
+            self.tradeLadder()
+        self.publishState(force=action is not None)
+
+    def submitPrice(self, price, event_time=None):
+
+        # called from the event loop; never blocks on the exchange
+        with self.tick_condition:
+            if self.pending_tick is not None:
+                self.ticks_dropped += 1
+            self.pending_tick = (price, event_time)
+            self.tick_condition.notify()
+
+    def tradingLoop(self):
+
+        while True:
+            with self.tick_condition:
+                while self.pending_tick is None and self.trading_thread is not None:
+                    self.tick_condition.wait()
+                if self.trading_thread is None:
+                    return
+                price, event_time = self.pending_tick
+                self.pending_tick = None
+
+            # a streamed tick from before the last one evaluated, e.g. delivered late by a
+            # reconnected socket
+            if event_time is not None and self.last_event_time is not None and event_time < self.last_event_time:
+                self.ticks_dropped += 1
+                continue
+            if event_time is not None:
+                self.last_event_time = event_time
+            try:
+                self.onPrice(price, event_time)
+            except Exception as e:
+                self.handleException(e)
+
+    def startTrading(self):
+
+        self.trading_thread = threading.Thread(target=self.tradingLoop, name=f'trading-{self.trade_symbol}', daemon=True)
+        self.trading_thread.start()
+
+    def stopTrading(self, timeout=10):
+
+        # let the order in progress, if any, complete before the state is saved
+        thread = self.trading_thread
+        if thread is None:
+            return
+        with self.tick_condition:
+            self.trading_thread = None
+            self.tick_condition.notify()
+        thread.join(timeout)
+
+    def publishState(self, force=False):
+
+        if self.live_state is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.publish_time < self.publish_interval:
+            return
+        self.publish_time = now
+        self.live_state.publish(self.trade_symbol, self.price, self.grid, self.stake_balance, self.trade_balance)
+
+    def handleException(self, e):
+
+        if isinstance(e, BinanceAPIException) and e.status_code in (418, 429):
+            # the session already holds back all the requests until the limit resets
+            eventlog.emit(
+                'error', self.trade_symbol, [f'request rejected by the rate limit ({e.status_code}); requests are paused'],
+                message=str(e), status_code=e.status_code
+            )
+            return
+        eventlog.emit(
+            'error', self.trade_symbol,
+            ['an exception occurred; the bot tried to keep running and the error message is displayed below:', str(e)],
+            message=str(e)
+        )
+
+    def saveState(self):
+
+        if self.journal is not None and self.grid.buy_threshold is not None:
+            self.journal.snapshot(self.trade_symbol, self.grid.getState())
+
+    def shutdown(self):
+
+        # save the grid state and flush pending database writes before leaving
+        self.stopTrading()
+        self.saveState()
+        if self.wallet_writer is not None:
+            self.wallet_writer.close()
+        eventlog.emit('info', None, ['bot terminated'])
+        eventlog.stop()
+        exit()
+
+    def start(self):
+
+        self.initialize()
 
         # grid strategy loop
         while True:
             try:
                 # loop every couple of seconds
-                time.sleep(1.5)
-
-                # track the time
-                local_time = datetime.datetime.now()
+                time.sleep(self.poll_interval)
 
                 # get the current price
                 try:
-                    self.price = self.getPrice()
+                    price = self.getPrice()
                 except:
-                    print(f'[{local_time}]: cannot get current price; possible network issue.')
-
-                # decide whether to trigger a stoploss, place a sell/buy order, reset the grid, or do nothing
-                if self.active_trades > 0 and self.price > self.sell_threshold:
-                    self.placeSellOrder()
-                elif self.active_trades > 0 and self.price < self.stoploss_price:
-                    self.executeStoploss()
-                elif self.active_trades < self.max_open_trades and self.price < self.buy_threshold:
-                    self.placeBuyOrder()
-                elif self.active_trades == 0 and self.price > self.sell_threshold:
-                    self.reset_grid()
+                    eventlog.emit('error', self.trade_symbol, ['cannot get current price; possible network issue.'])
+                    price = self.price
+
+                self.onPrice(price)
 
             except KeyboardInterrupt:
-                local_time = datetime.datetime.now()
-                print(f'[{local_time}]: bot terminated')
-                exit()
+                self.shutdown()
 
             except Exception as e:
-                local_time = datetime.datetime.now()
-                print(f'[{local_time}]: an exception occurred; the bot tried to keep running and the error message is displayed below:')
-                print(e)
+                self.handleException(e)
                 continue
-                
+
+    def openPriceSocket(self):
+
+        if self.stream_type == 'bookTicker':
+            return(self.socket_manager.symbol_book_ticker_socket(self.trade_symbol))
+        else:
+            return(self.socket_manager.trade_socket(self.trade_symbol))
+
+    def parseStreamPrice(self, msg) -> float:
+
+        if self.stream_type == 'bookTicker':
+            # mid price between best bid and best ask
+            return((float(msg['b']) + float(msg['a'])) / 2)
+        else:
+            return(float(msg['p']))
+
+    async def consumeStream(self):
+
+        async with self.openPriceSocket() as socket:
+
+            # log
+            eventlog.emit('info', self.trade_symbol, [f'listening to {self.stream_type} stream for {self.trade_symbol}'], True)
+
+            while True:
+                msg = await socket.recv()
+
+                # no message received within the socket timeout
+                if msg is None:
+                    continue
+
+                # the socket gave up reconnecting
+                if msg.get('e') == 'error':
+                    eventlog.emit('error', None, [f'websocket error: {msg.get("m")}'], message=msg.get('m'))
+                    return
+
+                # hand every tick to the trading thread as it arrives
+                try:
+                    self.submitPrice(self.parseStreamPrice(msg), msg.get('E'))
+                except Exception as e:
+                    self.handleException(e)
+
+    async def pollFallback(self, duration):
+
+        # log
+        eventlog.emit('error', None, [f'price stream lost; falling back to REST polling for {duration} seconds'], True, duration=duration)
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                price = await asyncio.to_thread(self.getPrice)
+            except:
+                eventlog.emit('error', self.trade_symbol, ['cannot get current price; possible network issue.'])
+                continue
+            self.submitPrice(price)
+
+    async def stream(self):
+
+        self.initialize()
+        self.startTrading()
+
+        # initialize async client and socket manager
+        self.async_client = await AsyncClient.create(self.key, self.secret, testnet=self.test_mode)
+        self.socket_manager = BinanceSocketManager(self.async_client)
+
+        try:
+            while True:
+                try:
+                    await self.consumeStream()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.handleException(e)
+                await self.pollFallback(self.stream_retry_interval)
+        finally:
+            await self.async_client.close_connection()
+
+    def startStream(self):
+
+        try:
+            asyncio.run(self.stream())
+        except KeyboardInterrupt:
+            self.shutdown()
+
+class MultiGridBot:
+
+    def __init__(self, key, secret, config):
+
+        # test mode
+        self.test_mode = config.get('test', True)
+
+        # user API authentication details
+        self.key = key
+        self.secret = secret
+
+        # client and HTTP connection pool shared by all the pairs, whose weight budget is a share
+        # of the limit when other worker processes of a supervisor use the same IP address; an
+        # endpoint such as the local simulator replaces the exchange
+        api_url = DEFAULT_API_URL
+        if config.get('endpoint') is not None:
+            api_url = useEndpoint(config['endpoint'])
+        if self.test_mode:
+            self.client = Client(key, secret, testnet=True)
+        else:
+            self.client = Client(key, secret)
+        self.session = RestSession(
+            budget=WeightBudget(share=config.get('weight_share', 1.0)),
+            pool_maxsize=max(10, len(config['pairs']))
+        )
+        self.session.attach(self.client)
+        self.async_client = None
+        self.socket_manager = None
+
+        # price stream parameters
+        self.stream_type = config.get('stream_type', 'trade')
+        self.stream_retry_interval = 30 # seconds of REST polling before reconnecting a lost websocket
+        self.poll_interval = 1.5 # seconds between REST price requests
+
+        # wallet database shared by all the pairs
+        self.db_file = config.get('db_file', 'wallet.db')
+        self.wallet_writer = WalletWriter(self.db_file, flush_interval=config.get('db_flush_interval', 1.0))
+        self.journal = Journal(self.db_file)
+
+        # symbol filters of all the pairs, loaded with a single exchangeInfo request
+        self.symbol_info = SymbolInfoCache(self.client, [pair['symbol'] for pair in config['pairs']])
+        self.symbol_info.load()
+        self.symbol_info.startRefresh()
+
+        # commission rates of the account, shared by all the pairs
+        self.commission_rates = CommissionRates(self.client, bnb_discount=config.get('bnb_discount', 0.25))
+        self.commission_rates.load()
+        self.commission_rates.startRefresh()
+
+        # live grid state file of a supervisor, if any
+        self.live_state = None
+        if config.get('live_state'):
+            self.live_state = LiveState(config['live_state'], readonly=False)
+            self.live_state.claim([pair['symbol'] for pair in config['pairs']])
+
+        # wallet ledger of all the pairs, kept by a single user-data stream
+        self.ledger = WalletLedger(self.client, key, secret, test=self.test_mode)
+
+        # one grid bot with isolated grid state per pair
+        self.bots = {}
+        for pair in config['pairs']:
+            bot = GridBot(
+                key, secret,
+                {pair['symbol']: [pair['trade_coin'], pair['stake_currency']]},
+                test=self.test_mode,
+                stream_type=self.stream_type,
+                grid_step=pair.get('grid_step', 0.01),
+                max_open_trades=pair.get('max_open_trades', 5),
+                tradeable_stake=pair.get('tradeable_stake', 0.8),
+                stoploss=pair.get('stoploss', config.get('stoploss')),
+                order_mode=config.get('order_mode', 'market'),
+                client=self.client,
+                session=self.session,
+                db_file=self.db_file,
+                symbol_info=self.symbol_info,
+                ledger=self.ledger,
+                wallet_writer=self.wallet_writer,
+                journal=self.journal,
+                api_url=api_url,
+                reference_source=config.get('reference_source', 'klines'),
+                reference_window=pair.get('reference_window', config.get('reference_window')),
+                commission_rates=self.commission_rates,
+                live_state=self.live_state,
+                strategy=pair.get('strategy', config.get('strategy', 'band')),
+                ladder_levels=pair.get('ladder_levels', 100),
+                ladder_lower=pair.get('ladder_lower'),
+                ladder_upper=pair.get('ladder_upper'),
+                ladder_width=pair.get('ladder_width', 0.1),
+                ladder_spacing=pair.get('ladder_spacing', 'arithmetic')
+            )
+            self.bots[bot.trade_symbol] = bot
+
+        # request url for the prices of all the pairs at once
+        symbols = json.dumps(list(self.bots.keys()), separators=(',', ':'))
+        self.price_url = f'{api_url}/v3/ticker/price?symbols={symbols}'
+
+    def initialize(self):
+
+        self.ledger.start()
+        self.wallet_writer.start()
+
+        # reference prices of all the pairs requested concurrently; a pair whose request fails
+        # retries it in its own initialization
+        reference_prices = {}
+        symbols = [symbol for symbol, bot in self.bots.items() if bot.reference_source == 'klines']
+        if symbols:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(symbols), 32)) as executor:
+                futures = {symbol: executor.submit(self.bots[symbol].getReferencePrice) for symbol in symbols}
+            for symbol, future in futures.items():
+                try:
+                    reference_prices[symbol] = future.result()
+                except Exception as e:
+                    self.bots[symbol].handleException(e)
+        for symbol, bot in self.bots.items():
+            bot.initialize(reference_prices.get(symbol))
+            bot.startTrading()
+
+    def getPrices(self) -> dict:
+
+        with metrics.span('get_prices'):
+            response = self.session.get(self.price_url)
+            response.raise_for_status()
+            response = response.json()
+        return({ticker['symbol']: float(ticker['price']) for ticker in response})
+
+    def dispatch(self, symbol, price, event_time=None):
+
+        # the tick is evaluated by the trading thread of its pair
+        self.bots[symbol].submitPrice(price, event_time)
+
+    def shutdown(self):
+
+        # save the grid states and flush pending database writes before leaving
+        for bot in self.bots.values():
+            bot.stopTrading()
+        for bot in self.bots.values():
+            bot.saveState()
+        if self.wallet_writer is not None:
+            self.wallet_writer.close()
+        eventlog.emit('info', None, ['bot terminated'])
+        eventlog.stop()
+        exit()
+
+    def start(self):
+
+        self.initialize()
+
+        # grid strategy loop
+        while True:
+            try:
+                # loop every couple of seconds
+                time.sleep(self.poll_interval)
+
+                # get the current prices of all the pairs with one request
+                try:
+                    prices = self.getPrices()
+                except:
+                    eventlog.emit('error', None, ['cannot get current prices; possible network issue.'])
+                    continue
+
+                for symbol, price in prices.items():
+                    self.dispatch(symbol, price)
+
+            except KeyboardInterrupt:
+                self.shutdown()
+
+    def openPriceSocket(self):
+
+        # one combined stream for all the pairs
+        streams = [f'{symbol.lower()}@{self.stream_type}' for symbol in self.bots]
+        return(self.socket_manager.multiplex_socket(streams))
+
+    async def consumeStream(self):
+
+        async with self.openPriceSocket() as socket:
+
+            # log
+            eventlog.emit('info', None, [f'listening to {self.stream_type} stream for {len(self.bots)} pairs'], True, symbols=list(self.bots))
+
+            while True:
+                msg = await socket.recv()
+
+                # no message received within the socket timeout
+                if msg is None:
+                    continue
+
+                # the socket gave up reconnecting
+                if msg.get('e') == 'error':
+                    eventlog.emit('error', None, [f'websocket error: {msg.get("m")}'], message=msg.get('m'))
+                    return
+
+                # route the tick to the bot of its pair
+                symbol = msg['stream'].split('@')[0].upper()
+                bot = self.bots[symbol]
+                try:
+                    price = bot.parseStreamPrice(msg['data'])
+                except Exception as e:
+                    bot.handleException(e)
+                    continue
+                self.dispatch(symbol, price, msg['data'].get('E'))
+
+    async def pollFallback(self, duration):
+
+        # log
+        eventlog.emit('error', None, [f'price stream lost; falling back to REST polling for {duration} seconds'], True, duration=duration)
+
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                prices = await asyncio.to_thread(self.getPrices)
+            except:
+                eventlog.emit('error', None, ['cannot get current prices; possible network issue.'])
+                continue
+            for symbol, price in prices.items():
+                self.dispatch(symbol, price)
+
+    async def stream(self):
+
+        self.initialize()
+
+        # initialize async client and socket manager
+        self.async_client = await AsyncClient.create(self.key, self.secret, testnet=self.test_mode)
+        self.socket_manager = BinanceSocketManager(self.async_client)
+
+        try:
+            while True:
+                try:
+                    await self.consumeStream()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    eventlog.emit(
+                        'error', None,
+                        ['an exception occurred; the bot tried to keep running and the error message is displayed below:', str(e)],
+                        message=str(e)
+                    )
+                await self.pollFallback(self.stream_retry_interval)
+        finally:
+            await self.async_client.close_connection()
+
+    def startStream(self):
+
+        try:
+            asyncio.run(self.stream())
+        except KeyboardInterrupt:
+            self.shutdown()
+
+def readConfig(config_file) -> dict:
+
+    with open(config_file) as config_fh:
+        config = json.load(config_fh)
+    return(config)
 
 def parseArgs():
 
@@ -396,10 +1450,61 @@ def parseArgs():
     requiredNamed.add_argument(
         '-s', '--api_secret', metavar='SECRET', type=str,
         help='API secret key file path', required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument(
+        '--poll', action='store_true',
+        help='poll the REST price endpoint instead of streaming prices from the websocket')
+    optional.add_argument(
+        '--stream_type', metavar='STREAM', type=str, default='trade',
+        choices=['trade', 'bookTicker'],
+        help='websocket stream used to evaluate the grid (default: trade)')
+    optional.add_argument(
+        '--order_mode', metavar='MODE', type=str, default='market', choices=['market', 'limit'],
+        help='market orders on threshold crossings, or limit orders resting at the thresholds (default: market)')
+    optional.add_argument(
+        '--metrics_port', metavar='PORT', type=int, default=None,
+        help='serve the latency histograms at http://127.0.0.1:PORT/metrics (Prometheus) and /metrics.json')
+    optional.add_argument(
+        '--endpoint', metavar='URL', type=str, default=None,
+        help='send all the requests to this server instead of Binance, e.g. the simulator at http://127.0.0.1:8765')
+    optional.add_argument(
+        '--reference', metavar='SOURCE', type=str, default='klines', choices=['klines', 'stream'],
+        help='starting reference price: VWAP of the recent one-minute klines, or mean of the first prices received (default: klines)')
+    optional.add_argument(
+        '--reference_window', metavar='SECONDS', type=int, default=None,
+        help='time window of the starting reference price (default: 300 for klines, 5 for stream)')
+    optional.add_argument(
+        '--strategy', metavar='STRATEGY', type=str, default='band', choices=['band', 'ladder'],
+        help='thresholds moved with every trade (band), or a static ladder of price levels, market orders only (default: band)')
+    optional.add_argument(
+        '--stoploss', metavar='LOSS', type=float, default=None,
+        help='loss tolerance of a position (default: grid_step * (max_open_trades + 1)); for the ladder, below its lowest level (default: none)')
+    optional.add_argument(
+        '--ladder_levels', metavar='N', type=int, default=100,
+        help='price levels of the ladder (default: 100)')
+    optional.add_argument(
+        '--ladder_lower', metavar='PRICE', type=float, default=None,
+        help='lowest level of the ladder (default: ladder_width below the reference price)')
+    optional.add_argument(
+        '--ladder_upper', metavar='PRICE', type=float, default=None,
+        help='highest level of the ladder (default: ladder_width above the reference price)')
+    optional.add_argument(
+        '--ladder_width', metavar='WIDTH', type=float, default=0.1,
+        help='relative distance of the ladder bounds to the reference price (default: 0.1)')
+    optional.add_argument(
+        '--ladder_spacing', metavar='SPACING', type=str, default='arithmetic', choices=['arithmetic', 'geometric'],
+        help='evenly spaced levels, or levels with a constant ratio (default: arithmetic)')
+    optional.add_argument(
+        '--event_log', metavar='FILE', type=str, default=None,
+        help='write the tick, order, fill, grid and wallet events to this JSON-lines file, rotated every 50 MB')
+    optional.add_argument(
+        '--tick_sample', metavar='RATE', type=float, default=0.0,
+        help='share of the ticks written to the event log (default: 0, none)')
+    optional.add_argument(
+        '-c', '--config', metavar='CONFIG', type=str, default=None,
+        help='JSON file with the pairs to trade and their grid parameters; all the pairs run in this process')
     args = parser.parse_args()
-    api_key = args.api_key
-    api_secret = args.api_secret
-    return(api_key, api_secret)
+    return(args)
 
 def readKeys(api_key, api_secret):
 
@@ -415,14 +1520,40 @@ def readKeys(api_key, api_secret):
 
 def main():
 
-    api_key, api_secret = parseArgs()
-    key, secret = readKeys(api_key, api_secret)
+    args = parseArgs()
+    key, secret = readKeys(args.api_key, args.api_secret)
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    if args.config is not None:
+        config = readConfig(args.config)
+        eventlog.configure(config.get('event_log', args.event_log), tick_sample=config.get('tick_sample', args.tick_sample))
+        config.setdefault('stream_type', args.stream_type)
+        config.setdefault('order_mode', args.order_mode)
+        config.setdefault('endpoint', args.endpoint)
+        config.setdefault('reference_source', args.reference)
+        config.setdefault('reference_window', args.reference_window)
+        config.setdefault('strategy', args.strategy)
+        config.setdefault('stoploss', args.stoploss)
+        bot = MultiGridBot(key, secret, config)
+        if args.poll:
+            bot.start()
+        else:
+            bot.startStream()
+        return
+    eventlog.configure(args.event_log, tick_sample=args.tick_sample)
     #trade_pair = {'BTCUSDT': ['BTC', 'USDT']}
     #trade_pair = {'XMRBUSD': ['XMR', 'BUSD']}
     trade_pair = {'XRPBUSD': ['XRP', 'BUSD']}
     #trade_pair = {'BUSDUSDT': ['BUSD', 'USDT']}
-    bot = GridBot(key, secret, trade_pair, test=True)
-    bot.start()
+    api_url = useEndpoint(args.endpoint) if args.endpoint is not None else DEFAULT_API_URL
+    bot = GridBot(key, secret, trade_pair, test=True, stream_type=args.stream_type, order_mode=args.order_mode, api_url=api_url,
+        reference_source=args.reference, reference_window=args.reference_window, strategy=args.strategy,
+        ladder_levels=args.ladder_levels, ladder_lower=args.ladder_lower, ladder_upper=args.ladder_upper,
+        ladder_width=args.ladder_width, ladder_spacing=args.ladder_spacing, stoploss=args.stoploss)
+    if args.poll:
+        bot.start()
+    else:
+        bot.startStream()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -8,71 +8,415 @@ from dash import Dash, html, dcc
 import plotly.express as px
 import plotly.io as pio
 import pandas as pd
-import sqlite3
+import numpy as np
+import os
+import threading
+import time
 import argparse as ap
-from dash import Dash, dcc, html, Input, Output
+from dash import Dash, dcc, html, Input, Output, State, callback_context, no_update
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
+from downsample import TieredSeries, reduceIndices
+from storage import connect
+from livestate import LiveState
 
 def parseArgs():
     # ./bot_dashboard.py --symbol XRPBUSD
+    # ./bot_dashboard.py --db wallet.db --live
     parser = ap.ArgumentParser(description='Binance Grid Bot Dashboard')
-    requiredNamed = parser.add_argument_group('required named arguments')
-    requiredNamed.add_argument(
-        '--symbol', metavar='SYMBOL', type=str,
-        help='traded pair symbol',
-        required=True)
     optional = parser.add_argument_group('optional arguments')
+    optional.add_argument(
+        '--symbol', metavar='SYMBOL', type=str, default=None,
+        help='traded pair symbol, reading {SYMBOL}_wallet.db unless --db is given')
+    optional.add_argument(
+        '--db', metavar='DB', type=str, default=None,
+        help='wallet database; all the pairs found in it can be displayed')
+    optional.add_argument(
+        '--live', action='store_true',
+        help='append the rows written by the bot to the charts as they arrive')
+    optional.add_argument(
+        '--interval', metavar='SECONDS', type=float, default=5,
+        help='seconds between checks for new rows in live mode (default: 5)')
+    optional.add_argument(
+        '--live_state', metavar='FILE', type=str, default=None,
+        help='live grid state file written by supervisor.py, shown every second without database queries')
+    optional.add_argument(
+        '--production', action='store_true',
+        help='serve without the debugger and reloader, with waitress when installed')
+    optional.add_argument(
+        '--host', metavar='HOST', type=str, default='0.0.0.0',
+        help='address to listen on (default: 0.0.0.0)')
+    optional.add_argument(
+        '--port', metavar='PORT', type=int, default=9050,
+        help='port to listen on (default: 9050)')
     args = parser.parse_args()
-    symbol = args.symbol
-    return(symbol)
+    if args.db is None and args.symbol is None:
+        parser.error('either --symbol or --db is required')
+    if args.db is None:
+        args.db = f'{args.symbol}_wallet.db'
+    return(args)
 
-if __name__ == '__main__':
-    symbol = parseArgs()
+def discoverSymbols(cnx) -> dict:
 
-    wallet_db_file = f'{symbol}_wallet.db'
+    # pairs registered by the bots, with their stake currency and trade coin
+    symbols = {}
+    for symbol, trade_coin, stake_currency in cnx.execute(
+            'SELECT symbol, trade_coin, stake_currency FROM symbols ORDER BY symbol'):
+        symbols[symbol] = {'stake_currency': stake_currency, 'trade_coin': trade_coin}
+    return(symbols)
 
-    cnx_wallet = sqlite3.connect(wallet_db_file)
+def readWallet(cnx, symbol, after_id=0) -> pd.DataFrame:
 
-    df_wallet = pd.read_sql_query("SELECT * from XRPBUSD", con=cnx_wallet)
+    # rows of the pair appended after after_id, in insertion order
+    df = pd.read_sql_query(
+        '''SELECT id AS row_id, ts, stake_balance, trade_balance, price
+        FROM wallet WHERE symbol = ? AND id > ? ORDER BY id''',
+        con=cnx,
+        params=(symbol, int(after_id))
+    )
+    return(df)
 
-    template = 'plotly_dark'
+def startValues(df_wallet) -> dict:
 
-    # calculate unrealized profit and price change at each timepoint
+    # the first record holds the starting balances, and the first record with a price the
+    # starting price (the bot writes its first record before it has one); a pair without
+    # records, or without prices yet, gets NaN placeholders
+    if len(df_wallet) == 0:
+        return({'row_id': None, 'ts': None, 'stake_amount': np.nan, 'trade_amount': np.nan, 'price': np.nan})
     first_record = df_wallet.iloc[0, :]
-    #start_stake_amount = float(df_wallet.loc[df_wallet['index']==-1, 'BUSD'])
-    start_stake_amount = float(first_record['BUSD'])
-    #start_trade_amount = float(df_wallet.loc[df_wallet['index']==-1, 'XRP'])
-    start_trade_amount= float(first_record['XRP'])
-    start_price = float(df_wallet.iloc[1,:]['XRPBUSD_price'])
-    unrealized_profit = [0]
-    unrealized_profit_percent = [0]
-    price_change = [0]
-    price_change_percent = [0]
-    for timepoint in df_wallet['local_time'][1:]:
-        stake_amount = float(df_wallet.loc[df_wallet['local_time']==timepoint]['BUSD'])
-        trade_amount = float(df_wallet.loc[df_wallet['local_time']==timepoint]['XRP'])
-        price = float(df_wallet.loc[df_wallet['local_time']==timepoint]['XRPBUSD_price'])
-        price_delta = price - start_price
-        stake_delta = stake_amount - start_stake_amount
-        trade_delta = trade_amount - start_trade_amount
-        delta_profit = stake_delta + trade_delta * price
-        unrealized_profit.append(delta_profit)
-        unrealized_profit_percent.append(delta_profit / start_stake_amount * 100)
-        price_change.append(price_delta)
-        price_change_percent.append(price_delta / start_price * 100)
+    prices = df_wallet['price'].dropna()
+    return({
+        'row_id': int(first_record['row_id']),
+        'ts': int(first_record['ts']),
+        'stake_amount': float(first_record['stake_balance']),
+        'trade_amount': float(first_record['trade_balance']),
+        'price': float(prices.iloc[0]) if len(prices) > 0 else np.nan
+    })
+
+def computeProfit(df_wallet, start) -> pd.DataFrame:
+
+    # unrealized profit and price change at each timepoint, relative to the start
+    stake_amount = df_wallet['stake_balance'].to_numpy(dtype=float)
+    trade_amount = df_wallet['trade_balance'].to_numpy(dtype=float)
+    price = df_wallet['price'].to_numpy(dtype=float)
+    unrealized_profit = (stake_amount - start['stake_amount']) + (trade_amount - start['trade_amount']) * price
+    price_change = price - start['price']
+
+    # the first record is the reference
+    is_first = df_wallet['row_id'].to_numpy() == start['row_id']
+    unrealized_profit[is_first] = 0
+    price_change[is_first] = 0
+
     df_profit = pd.DataFrame({
-        'local_time':df_wallet['local_time'],
+        'ts': df_wallet['ts'].to_numpy(),
         'unrealized_profit': unrealized_profit,
-        'unrealized_profit_percent': unrealized_profit_percent,
+        'unrealized_profit_percent': unrealized_profit / start['stake_amount'] * 100,
         'price_change': price_change,
-        'price_change_percent': price_change_percent
+        'price_change_percent': price_change / start['price'] * 100
         })
-    
+    return(df_profit)
+
+def loadWalletAndProfit(cnx, symbol, cache_file):
+
+    # resume from the cached rows and only process the rows appended since the previous run
+    cache = None
+    if cache_file is not None and os.path.exists(cache_file):
+        cache = pd.read_pickle(cache_file)
+        first_row = cnx.execute(
+            'SELECT id, ts FROM wallet WHERE symbol = ? ORDER BY id LIMIT 1', (symbol,)).fetchone()
+        # the cache belongs to another database if the first row differs
+        if first_row is None \
+                or 'ts' not in cache['start'] \
+                or first_row[0] != cache['start']['row_id'] \
+                or first_row[1] != cache['start']['ts']:
+            cache = None
+
+    if cache is None:
+        df_wallet = readWallet(cnx, symbol)
+        start = startValues(df_wallet)
+        df_profit = computeProfit(df_wallet, start)
+    else:
+        start = cache['start']
+        df_new = readWallet(cnx, symbol, cache['last_row_id'])
+        df_wallet = pd.concat([cache['df_wallet'], df_new], ignore_index=True)
+        df_profit = pd.concat([cache['df_profit'], computeProfit(df_new, start)], ignore_index=True)
+
+    # the start is only final once a record with a price was written
+    if cache_file is not None and not np.isnan(start['price']):
+        pd.to_pickle({
+            'start': start,
+            'last_row_id': int(df_wallet['row_id'].iloc[-1]),
+            'df_wallet': df_wallet,
+            'df_profit': df_profit
+        }, cache_file)
+
+    return(df_wallet, df_profit)
+
+class WalletData:
+
+    def __init__(self, db_file, symbol, columns, max_points=2000):
+
+        self.db_file = db_file
+        self.symbol = symbol
+        self.stake_currency = columns['stake_currency']
+        self.trade_coin = columns['trade_coin']
+        self.cache_file = f'{db_file}.{symbol}.profit.pkl'
+        self.lock = threading.Lock()
+
+        cnx = connect(db_file)
+        self.df_wallet, self.df_profit = loadWalletAndProfit(cnx, symbol, self.cache_file)
+        cnx.close()
+        self.start = startValues(self.df_wallet)
+
+        # resolution tiers of each plotted column, rebuilt once the history grew by 1 %
+        self.max_points = max_points # points per trace shipped to the browser
+        self.x = self.epochTimes(self.df_wallet)
+        self.tiers = {}
+
+    def epochTimes(self, df) -> np.ndarray:
+
+        # epoch milliseconds to the epoch nanoseconds used by pandas
+        return(df['ts'].to_numpy(dtype=np.int64) * 1000000)
+
+    def downsample(self, df, column, x0=None, x1=None, method='lttb'):
+
+        # bounded number of points of a column within [x0, x1] (epoch nanoseconds)
+        with self.lock:
+            n = len(self.x)
+            if n == 0:
+                return(pd.to_datetime(self.x), np.empty(0))
+            series, n_tiered = self.tiers.get(column, (None, 0))
+            if series is None or n > n_tiered * 1.01:
+                series = TieredSeries(self.x, df[column].to_numpy(dtype=float), max_points=self.max_points)
+                n_tiered = n
+                self.tiers[column] = (series, n_tiered)
+            indices = series.query(x0, x1, method=method)
+
+            # rows appended since the tiers were built, within the view and downsampled as well
+            values = df[column].to_numpy(dtype=float)
+            if n > n_tiered:
+                x0 = self.x[0] if x0 is None else x0
+                x1 = self.x[-1] if x1 is None else x1
+                lo = n_tiered + np.searchsorted(self.x[n_tiered:], x0, side='left')
+                hi = n_tiered + np.searchsorted(self.x[n_tiered:], x1, side='right')
+                new = reduceIndices(self.x, values, np.arange(lo, hi), self.max_points, method)
+                indices = np.concatenate([indices, new])
+            x = pd.to_datetime(self.x[indices])
+            y = values[indices]
+        return(x, y)
+
+    def lastRowId(self) -> int:
+
+        if len(self.df_wallet) == 0:
+            return(0)
+        return(int(self.df_wallet['row_id'].iloc[-1]))
+
+    def tail(self):
+
+        # append the rows written since the last check
+        with self.lock:
+            cnx = connect(self.db_file)
+            df_new = readWallet(cnx, self.symbol, self.lastRowId())
+            cnx.close()
+            if len(df_new) == 0:
+                return
+            self.df_wallet = pd.concat([self.df_wallet, df_new], ignore_index=True)
+            self.x = np.concatenate([self.x, self.epochTimes(df_new)])
+            if np.isnan(self.start['price']):
+                # the first records of the pair: the profits are relative to a start known only now
+                self.start = startValues(self.df_wallet)
+                self.df_profit = computeProfit(self.df_wallet, self.start)
+                self.tiers = {}
+            else:
+                self.df_profit = pd.concat([self.df_profit, computeProfit(df_new, self.start)], ignore_index=True)
+
+    def extension(self, columns, row_id, method='lttb', profit=False):
+
+        # points of the wallet (or profit) columns in the rows appended after row_id, each
+        # reduced to max_points, as the extendData of their traces; and the last row id
+        with self.lock:
+            df = self.df_profit if profit else self.df_wallet
+            lo = int(np.searchsorted(self.df_wallet['row_id'].to_numpy(), row_id, side='right'))
+            if lo == len(self.x):
+                return(None, row_id)
+            xs, ys = [], []
+            for column in columns:
+                values = df[column].to_numpy(dtype=float)
+                indices = reduceIndices(self.x, values, np.arange(lo, len(self.x)), self.max_points, method)
+                xs.append([str(t) for t in pd.to_datetime(self.x[indices])])
+                ys.append(values[indices].tolist())
+            return({'x': xs, 'y': ys}, int(self.df_wallet['row_id'].iloc[-1]))
+
+def xRange(relayout_data):
+
+    # visible time range of a zoomed chart, as epoch nanoseconds
+    if not relayout_data:
+        return(None, None)
+    if 'xaxis.range[0]' in relayout_data:
+        x_range = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout_data:
+        x_range = relayout_data['xaxis.range']
+    else:
+        return(None, None)
+    return(pd.Timestamp(x_range[0]).value, pd.Timestamp(x_range[1]).value)
+
+def walletFigure(data, radio_value, template, x0=None, x1=None):
+
+    # Create figure with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Add traces; balances are step-like, so the minimum, maximum and last value of each time bucket are kept
+    x, y = data.downsample(data.df_wallet, 'stake_balance', x0, x1, method='minmax')
+    fig.add_trace(
+        go.Scatter(x=x, y=y, name=data.stake_currency),
+        secondary_y=False
+    )
+
+    x, y = data.downsample(data.df_wallet, 'trade_balance', x0, x1, method='minmax')
+    fig.add_trace(
+        go.Scatter(x=x, y=y, name=data.trade_coin),
+        secondary_y = radio_value == 'Two axis'
+    )
+
+    # Add figure title; uirevision keeps the zoom when the figure is redrawn
+    fig.update_layout(
+        title_text=f"Wallet ({data.symbol})",
+        template=template,
+        uirevision=data.symbol
+    )
+
+    # Set x-axis title
+    fig.update_xaxes(title_text="time (UTC)")
+
+    # Set y-axes titles
+    if radio_value == 'Two axis':
+        fig.update_yaxes(title_text=f"<b>{data.stake_currency}</b> in wallet", secondary_y=False)
+        fig.update_yaxes(title_text=f"<b>{data.trade_coin}</b> in wallet", secondary_y=True)
+    else:
+        fig.update_yaxes(title_text="amount in wallet", secondary_y=False)
+
+    return fig
+
+def profitColumns(radio_value):
+
+    if radio_value == 'Absolute':
+        return(['unrealized_profit'])
+    return(['unrealized_profit_percent', 'price_change_percent'])
+
+def profitFigure(data, radio_value, template, x0=None, x1=None):
+
+    fig = make_subplots()
+
+    if radio_value == 'Absolute':
+        title='Unrealized profit'
+        y_label=f'unrealized profit in {data.stake_currency}'
+    elif radio_value == 'Percentage':
+        title='Unrealized profit (%)'
+        y_label=f'unrealized profit in {data.stake_currency} (%)'
+
+    for column, name in zip(profitColumns(radio_value), ['Bot', 'Market']):
+        x, y = data.downsample(data.df_profit, column, x0, x1, method='lttb')
+        fig.add_trace(
+            go.Scatter(x=x, y=y, name=name)
+        )
+
+    fig.update_layout(
+        title_text=f'{title} ({data.symbol})',
+        template=template,
+        uirevision=data.symbol
+    )
+    fig.update_xaxes(title_text="time (UTC)")
+    fig.update_yaxes(title_text=y_label)
+
+    return(fig)
+
+class LiveStateReader:
+
+    def __init__(self, path):
+
+        self.path = path
+        self.live_state = None
+        self.lock = threading.Lock()
+
+    def read(self) -> dict:
+
+        # the file is reopened when the supervisor recreated it
+        with self.lock:
+            if self.live_state is None or self.live_state.replaced():
+                if not os.path.exists(self.path):
+                    return({})
+                self.live_state = LiveState(self.path)
+            return(self.live_state.read())
+
+def formatNumber(value, digits=8) -> str:
+
+    if value is None or not np.isfinite(value):
+        return('-')
+    return(f'{value:.{digits}g}')
+
+def liveStateTable(states, selected):
+
+    # one row per pair, with the open positions of the selected pair below
+    columns = ['pair', 'price', 'buy threshold', 'sell threshold', 'stoploss', 'active trades', 'held',
+        'stake balance', 'trade balance', 'updated (s ago)']
+    now = time.time()
+    rows = []
+    for symbol, state in sorted(states.items()):
+        if state is None:
+            rows.append(html.Tr([html.Td(symbol)] + [html.Td('-')] * (len(columns) - 1)))
+            continue
+        age = f'{now - state["updated"]:.1f}' if state['updated'] > 0 else '-'
+        if state['stale']:
+            age = f'{age} (writer stopped)'
+        rows.append(html.Tr([html.Td(cell) for cell in [
+            symbol, formatNumber(state['price']), formatNumber(state['buy_threshold']),
+            formatNumber(state['sell_threshold']), formatNumber(state['stoploss_price']), state['active_trades'],
+            f'{formatNumber(state["total_amount"])} {state["trade_coin"]}',
+            f'{formatNumber(state["stake_balance"])} {state["stake_currency"]}',
+            f'{formatNumber(state["trade_balance"])} {state["trade_coin"]}', age
+        ]], style={'fontWeight': 'bold'} if symbol == selected else None))
+    table = html.Table([html.Thead(html.Tr([html.Th(column) for column in columns])), html.Tbody(rows)])
+    state = states.get(selected)
+    if state is None or state['n_positions'] == 0:
+        return(html.Div([table]))
+    positions = ', '.join(
+        f'{formatNumber(amount)} @ {formatNumber(price)}'
+        for amount, price in zip(state['position_amounts'], state['position_prices'])
+    )
+    hidden = state['n_positions'] - len(state['position_amounts'])
+    if hidden > 0:
+        positions = f'({hidden} older) {positions}'
+    return(html.Div([table, html.P(f'open positions of {selected} (oldest first): {positions}')]))
+
+def createApp(db_file, symbols, live=False, interval=5, live_state=None):
+
+    template = 'plotly_dark'
+
+    # wallet rows and profits of each pair, loaded on first display
+    wallet_data = {}
+    wallet_data_lock = threading.Lock()
+
+    def getData(symbol) -> WalletData:
+        with wallet_data_lock:
+            if symbol not in wallet_data:
+                wallet_data[symbol] = WalletData(db_file, symbol, symbols[symbol])
+            return(wallet_data[symbol])
+
     app = Dash(__name__)
 
     app.layout = html.Div([
         html.H1('Binance Grid Bot'),
+        dcc.Dropdown(
+            id='symbol',
+            options=sorted(symbols),
+            value=sorted(symbols)[0],
+            clearable=False
+        ),
+        dcc.Interval(id='live_interval', interval=interval * 1000, disabled=not live),
+        dcc.Interval(id='live_state_interval', interval=1000, disabled=live_state is None),
+        html.Div([html.H2('Live grid'), html.Div(id='live_state_table')], hidden=live_state is None),
+        dcc.Store(id='wallet_last_row'),
+        dcc.Store(id='profit_last_row'),
         html.H2('Full transactions history'),
         dcc.RadioItems(
             id='radio_wallet',
@@ -89,82 +433,127 @@ if __name__ == '__main__':
         dcc.Graph(id="profit_graph")
     ])
 
-    @app.callback(
-        Output("wallet_graph", "figure"), 
-        Input('radio_wallet', "value"))
-    def display_trades(radio_value):
+    def triggeredBy(component_id) -> bool:
+        return(any(t['prop_id'].split('.')[0] == component_id for t in callback_context.triggered))
 
-        # Create figure with secondary y-axis
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
+    def triggeredByInterval() -> bool:
+        return(triggeredBy('live_interval'))
 
-        # Add traces
-        fig.add_trace(
-            go.Scatter(x=df_wallet['local_time'], y=df_wallet['BUSD'], name="BUSD"),
-            secondary_y=False
-        )
+    # the live view only reads the memory-mapped state written by the bot workers
+    live_state_reader = LiveStateReader(live_state) if live_state is not None else None
 
-        fig.add_trace(
-            go.Scatter(x=df_wallet['local_time'], y=df_wallet['XRP'], name="XRP"),
-            secondary_y = radio_value == 'Two axis'
-        )
+    @app.callback(
+        Output('live_state_table', 'children'),
+        Input('live_state_interval', 'n_intervals'),
+        Input('symbol', 'value'))
+    def display_live_state(n_intervals, symbol):
 
-        # Add figure title
-        fig.update_layout(
-            title_text="Wallet",
-            template=template
-        )
+        if live_state_reader is None:
+            return(no_update)
+        return(liveStateTable(live_state_reader.read(), symbol))
 
-        # Set x-axis title
-        fig.update_xaxes(title_text="local time")
+    @app.callback(
+        Output("wallet_graph", "figure"),
+        Output("wallet_graph", "extendData"),
+        Output("wallet_last_row", "data"),
+        Input('radio_wallet', "value"),
+        Input('symbol', "value"),
+        Input('live_interval', "n_intervals"),
+        Input('wallet_graph', "relayoutData"),
+        State('wallet_last_row', "data"))
+    def display_trades(radio_value, symbol, n_intervals, relayout_data, last_row):
 
-        # Set y-axes titles
-        if radio_value == 'Two axis':
-            fig.update_yaxes(title_text="<b>BUSD</b> in wallet", secondary_y=False)
-            fig.update_yaxes(title_text="<b>XRP</b> in wallet", secondary_y=True)
-        else:
-            fig.update_yaxes(title_text="amount in wallet", secondary_y=False)
+        data = getData(symbol)
+        if not triggeredByInterval() or last_row is None or last_row['symbol'] != symbol:
+            # redraw the visible range at a resolution bounded by max_points; a new pair is shown in full
+            x0, x1 = xRange(relayout_data) if not triggeredBy('symbol') else (None, None)
+            fig = walletFigure(data, radio_value, template, x0, x1)
+            return(fig, no_update, {'symbol': symbol, 'row_id': data.lastRowId(), 'n_points': 0})
 
-        return fig
+        # append the new rows to the existing traces, reduced as in a redraw; once the appended
+        # points outnumber a redraw, the figure is drawn again instead
+        data.tail()
+        extension, row_id = data.extension(['stake_balance', 'trade_balance'], last_row['row_id'], method='minmax')
+        if extension is None:
+            return(no_update, no_update, no_update)
+        n_points = last_row['n_points'] + max(len(x) for x in extension['x'])
+        if n_points > data.max_points:
+            fig = walletFigure(data, radio_value, template, *xRange(relayout_data))
+            return(fig, no_update, {'symbol': symbol, 'row_id': data.lastRowId(), 'n_points': 0})
+        return(no_update, (extension, [0, 1]), {'symbol': symbol, 'row_id': row_id, 'n_points': n_points})
 
     @app.callback(
-        Output("profit_graph", "figure"), 
-        Input('radio_profits', "value"))
-    def display_profits(radio_value):
-
-        fig = make_subplots()
-
-        if radio_value == 'Absolute':
-            bot_column='unrealized_profit'
-            market_column='price_change'
-            title='Unrealized profit'
-            y_label='unrealized profit in BUSD'
-        elif radio_value == 'Percentage':
-            bot_column='unrealized_profit_percent'
-            title='Unrealized profit (%)'
-            y_label='unrealized profit in BUSD (%)'
-            market_column='price_change_percent'
+        Output("profit_graph", "figure"),
+        Output("profit_graph", "extendData"),
+        Output("profit_last_row", "data"),
+        Input('radio_profits', "value"),
+        Input('symbol', "value"),
+        Input('live_interval', "n_intervals"),
+        Input('profit_graph', "relayoutData"),
+        State('profit_last_row', "data"))
+    def display_profits(radio_value, symbol, n_intervals, relayout_data, last_row):
 
-        fig.add_trace(
-            go.Scatter(x=df_profit['local_time'], y=df_profit[bot_column], name="Bot")
-        )
+        data = getData(symbol)
+        if not triggeredByInterval() or last_row is None or last_row['symbol'] != symbol:
+            # redraw the visible range at a resolution bounded by max_points; a new pair is shown in full
+            x0, x1 = xRange(relayout_data) if not triggeredBy('symbol') else (None, None)
+            fig = profitFigure(data, radio_value, template, x0, x1)
+            return(fig, no_update, {'symbol': symbol, 'row_id': data.lastRowId(), 'n_points': 0})
+
+        # append the new rows to the existing traces, reduced as in a redraw; once the appended
+        # points outnumber a redraw, the figure is drawn again instead
+        data.tail()
+        columns = profitColumns(radio_value)
+        extension, row_id = data.extension(columns, last_row['row_id'], method='lttb', profit=True)
+        if extension is None:
+            return(no_update, no_update, no_update)
+        n_points = last_row['n_points'] + max(len(x) for x in extension['x'])
+        if n_points > data.max_points:
+            fig = profitFigure(data, radio_value, template, *xRange(relayout_data))
+            return(fig, no_update, {'symbol': symbol, 'row_id': data.lastRowId(), 'n_points': 0})
+        return(no_update, (extension, list(range(len(columns)))), {'symbol': symbol, 'row_id': row_id, 'n_points': n_points})
+
+    return(app)
 
-        if radio_value == 'Percentage':
-            fig.add_trace(
-                go.Scatter(x=df_profit['local_time'], y=df_profit[market_column], name="Market")
-            )
+def serve(db_file, symbol=None, live=False, interval=5, live_state=None, production=False, host='0.0.0.0', port=9050):
 
-        fig.update_layout(
-            title_text=title,
-            template=template
+    cnx_wallet = connect(db_file)
+    symbols = discoverSymbols(cnx_wallet)
+    cnx_wallet.close()
+    if symbol is not None:
+        symbols = {symbol: symbols[symbol]}
+
+    app = createApp(db_file, symbols, live=live, interval=interval, live_state=live_state)
+
+    if not production:
+        app.run_server(
+            debug=True,
+            port=port,
+            host=host,
+            use_reloader=True
         )
-        fig.update_xaxes(title_text="local time")
-        fig.update_yaxes(title_text=y_label)
+        return
 
-        return(fig)
+    # a single process without debugger and reloader: waitress when installed, the threaded
+    # development server otherwise
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+    if waitress is not None:
+        waitress.serve(app.server, host=host, port=port, threads=8)
+    else:
+        app.run_server(
+            debug=False,
+            port=port,
+            host=host,
+            use_reloader=False,
+            threaded=True
+        )
 
-    app.run_server(
-        debug=True,
-        port=9050,
-        host='0.0.0.0',
-        use_reloader=True
-    )
\ No newline at end of file
+if __name__ == '__main__':
+    args = parseArgs()
+    serve(
+        args.db, symbol=args.symbol, live=args.live, interval=args.interval, live_state=args.live_state,
+        production=args.production, host=args.host, port=args.port
+    )
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# downsample.py
+
+# server-side downsampling of long time series for the dashboard charts
+
+import numpy as np
+
+def lttb(x, y, n_out) -> np.ndarray:
+
+    # indices of the points kept by the Largest-Triangle-Three-Buckets algorithm
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return(np.arange(n))
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # the first and last points are kept, the others are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+
+        # average point of the next bucket
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # keep the point forming the largest triangle with the previous kept point and the average
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return(selected)
+
+def bucketIndices(x, y, width) -> np.ndarray:
+
+    # indices of the minimum, maximum and last point of every time bucket of the given width
+    n = len(x)
+    if n == 0:
+        return(np.arange(0))
+    bucket = (x - x[0]) // width
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # x is sorted, so buckets are contiguous
+    ends = np.append(np.flatnonzero(np.diff(bucket)) + 1, n)
+    starts = np.insert(ends[:-1], 0, 0)
+
+    # first occurrence of the minimum and maximum value of each bucket
+    sizes = ends - starts
+    segment = np.repeat(np.arange(len(starts)), sizes)
+    minima = np.flatnonzero(y == np.repeat(np.minimum.reduceat(y, starts), sizes))
+    minima = minima[np.unique(segment[minima], return_index=True)[1]]
+    maxima = np.flatnonzero(y == np.repeat(np.maximum.reduceat(y, starts), sizes))
+    maxima = maxima[np.unique(segment[maxima], return_index=True)[1]]
+    lasts = ends - 1
+    return(np.unique(np.concatenate([minima, maxima, lasts])))
+
+def reduceIndices(x, y, indices, max_points, method='lttb') -> np.ndarray:
+
+    # about max_points of the given sorted indices, for points not covered by the tiers
+    if len(indices) <= max_points:
+        return(indices)
+    if method == 'lttb':
+        return(indices[lttb(x[indices], y[indices], max_points)])
+    span = int(x[indices[-1]] - x[indices[0]])
+    width = max(1, span // max(1, max_points // 3))
+    return(indices[bucketIndices(x[indices], y[indices], width)])
+
+class TieredSeries:
+
+    def __init__(self, x, y, max_points=2000, factor=4):
+
+        # x as int64 epoch nanoseconds, sorted
+        self.x = np.asarray(x, dtype=np.int64)
+        self.y = np.asarray(y, dtype=float)
+        self.max_points = max_points # points shipped per redraw
+        self.factor = factor # resolution ratio between consecutive tiers
+
+        # tiers from the finest (all points) to the coarsest (about max_points buckets over the
+        # whole history); each tier is computed from the previous one, which keeps its extremes
+        self.tiers = [np.arange(len(self.x))]
+        span = int(self.x[-1] - self.x[0]) if len(self.x) > 1 else 0
+        n_buckets = max_points
+        widths = []
+        while span > 0 and 3 * n_buckets * factor <= len(self.x):
+            widths.append(max(1, span // n_buckets))
+            n_buckets *= factor
+        for width in reversed(widths):
+            finer = self.tiers[-1]
+            self.tiers.append(finer[bucketIndices(self.x[finer], self.y[finer], width)])
+
+    def query(self, x0=None, x1=None, method='lttb'):
+
+        # points within [x0, x1] from the finest tier that keeps the payload bounded
+        x0 = self.x[0] if x0 is None else x0
+        x1 = self.x[-1] if x1 is None else x1
+        for tier in self.tiers:
+            tier_x = self.x[tier]
+            lo = np.searchsorted(tier_x, x0, side='left')
+            hi = np.searchsorted(tier_x, x1, side='right')
+            if hi - lo <= self.max_points * self.factor or tier is self.tiers[-1]:
+                break
+
+        # include one point on each side so the lines reach the edges of the view
+        indices = tier[max(lo - 1, 0):min(hi + 1, len(tier))]
+        if method == 'lttb' and len(indices) > self.max_points:
+            indices = indices[lttb(self.x[indices], self.y[indices], self.max_points)]
+        return(indices)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+# eventlog.py
+
+# structured JSON-lines log of the bot events (ticks, orders, fills, grid moves, wallet changes
+# and errors): the trading loop only timestamps and queues each event, and a background thread
+# writes it to a rotating log file and its message to the console; the log can be replayed into
+# the backtester and into a wallet database for the dashboard
+
+import argparse as ap
+import atexit
+import datetime
+import glob
+import json
+import logging
+import logging.handlers
+import math
+import queue
+import sys
+import time
+
+EVENT_TYPES = ('tick', 'order', 'fill', 'grid', 'wallet', 'error', 'info')
+
+class EventQueueHandler(logging.handlers.QueueHandler):
+
+    # records are created for the queue only, so they are passed on unformatted and uncopied
+    def prepare(self, record):
+
+        return(record)
+
+class JsonLinesFormatter(logging.Formatter):
+
+    def format(self, record) -> str:
+
+        return(json.dumps(record.event, separators=(',', ':'), default=str))
+
+class ConsoleFormatter(logging.Formatter):
+
+    # the messages printed by the bot, stamped with the local time the event was queued at
+    def format(self, record) -> str:
+
+        local_time = datetime.datetime.fromtimestamp(record.event['ts'] / 1000)
+        lines = [f'[{local_time}]: {line}' for line in record.lines]
+        if record.separator:
+            lines.insert(0, '---')
+        return('\n'.join(lines))
+
+class HasLines(logging.Filter):
+
+    def filter(self, record) -> bool:
+
+        return(bool(record.lines))
+
+def finite(value):
+
+    # infinite thresholds, e.g. the stoploss price without positions, are written as null
+    if isinstance(value, float) and not math.isfinite(value):
+        return(None)
+    return(value)
+
+class EventLog:
+
+    def __init__(self):
+
+        self.queue = queue.SimpleQueue() # unbounded, so emitting never blocks
+        self.logger = logging.getLogger('gridbot.events')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(EventQueueHandler(self.queue))
+        self.listener = None
+        self.log_file = None
+        self.tick_sample = 0.0 # share of the ticks logged
+        self.tick_credit = {} # symbol -> sampling credit, so that every symbol is sampled evenly
+
+    def configure(self, log_file=None, max_bytes=50 * 1024 * 1024, backup_count=10, tick_sample=0.0, console=True):
+
+        # (re)start the writer thread with a rotating JSON-lines file and/or the console
+        self.stop()
+        handlers = []
+        if log_file is not None:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+            )
+            file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(ConsoleFormatter())
+            console_handler.addFilter(HasLines())
+            handlers.append(console_handler)
+        self.log_file = log_file
+        self.tick_sample = tick_sample
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+
+        # write the queued events and close the log file
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def emit(self, event, symbol=None, lines=(), separator=False, **fields):
+
+        # queue an event with its console message lines; without configure() the events are
+        # only printed to the console
+        if self.listener is None:
+            self.configure()
+        record = {'ts': int(time.time() * 1000), 'event': event, 'symbol': symbol}
+        record.update(fields)
+        self.logger.info(event, extra={'event': record, 'lines': lines, 'separator': separator})
+
+    def tick(self, symbol, price, event_time=None):
+
+        # every 1 / tick_sample-th tick of each symbol
+        if self.tick_sample <= 0:
+            return
+        credit = self.tick_credit.get(symbol, 1.0) + self.tick_sample
+        if credit >= 1:
+            credit -= 1
+            self.emit('tick', symbol, price=price, event_time=event_time)
+        self.tick_credit[symbol] = credit
+
+# event log shared by all the bots of the process
+eventlog = EventLog()
+atexit.register(eventlog.stop)
+
+def logFiles(log_file) -> list:
+
+    # the rotated files from the oldest (highest suffix) to the current one
+    rotated = glob.glob(f'{glob.escape(log_file)}.[0-9]*')
+    rotated = [path for path in rotated if path.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda path: int(path.rsplit('.', 1)[1]), reverse=True)
+    return(rotated + [log_file])
+
+def readEvents(log_file, event_types=None, symbol=None):
+
+    # events of the given types and symbol in the order they were logged, including the
+    # rotated files; a line cut short by a crash is skipped
+    for path in logFiles(log_file):
+        try:
+            log_fh = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with log_fh:
+            for line in log_fh:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event_types is not None and event['event'] not in event_types:
+                    continue
+                if symbol is not None and event['symbol'] != symbol:
+                    continue
+                yield(event)
+
+def readEventFrame(log_file, event_types=None, symbol=None):
+
+    # pandas is only needed for the replay, not by the bot
+    import pandas as pd
+
+    return(pd.DataFrame.from_records(list(readEvents(log_file, event_types, symbol))))
+
+def replayWallet(log_file, db_file) -> int:
+
+    # write the wallet events of the log to a wallet database that the dashboard can display;
+    # returns the number of rows written
+    from storage import connect, bulkInsertWallet
+
+    cnx = connect(db_file)
+    rows = []
+    for event in readEvents(log_file, ('wallet',)):
+        if not event['changed']:
+            continue
+        if event.get('trade_coin') is not None:
+            cnx.execute(
+                'INSERT OR REPLACE INTO symbols (symbol, trade_coin, stake_currency) VALUES (?, ?, ?)',
+                (event['symbol'], event['trade_coin'], event['stake_currency'])
+            )
+        rows.append((event['symbol'], event['ts'], event['stake_balance'], event['trade_balance'], event['price']))
+    bulkInsertWallet(cnx, rows)
+    cnx.close()
+    return(len(rows))
+
+def parseArgs():
+
+    # ./eventlog.py --log events.jsonl --db replay.db
+    parser = ap.ArgumentParser(description='Replay a grid bot event log into a wallet database')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '--log', metavar='FILE', type=str, required=True,
+        help='JSON-lines event log written with bot.py --event_log, with its rotated files')
+    requiredNamed.add_argument(
+        '--db', metavar='DB', type=str, required=True,
+        help='wallet database to write, readable by dashboard.py --db')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    args = parseArgs()
+    n_rows = replayWallet(args.log, args.db)
+
+    # log
+    local_time = datetime.datetime.now()
+    print(f'[{local_time}]: {n_rows} wallet rows replayed from {args.log} into {args.db}')
+
+if __name__ == '__main__':
+    main()
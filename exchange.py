@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+
+# exchange.py
+
+# exchange metadata and account state shared by the grid bots
+
+import json
+import os
+import tempfile
+import threading
+import time
+from binance import AsyncClient, BinanceSocketManager, Client, ThreadedWebsocketManager
+from eventlog import eventlog
+
+# REST API of the exchange, also used for the price requests made outside of the client
+DEFAULT_API_URL = 'https://api.binance.com/api'
+
+def useEndpoint(endpoint) -> str:
+
+    # send the REST requests and websocket connections of every client of the process to another
+    # server, such as the local simulator (simulator.py); returns the REST API url
+    api_url = f'{endpoint.rstrip("/")}/api'
+    stream_url = endpoint.rstrip('/').replace('http', 'ws', 1) + '/'
+    for client_class in (Client, AsyncClient):
+        client_class.API_URL = api_url
+        client_class.API_TESTNET_URL = api_url
+        client_class.MARGIN_API_URL = f'{endpoint.rstrip("/")}/sapi'
+    BinanceSocketManager.STREAM_URL = stream_url
+    BinanceSocketManager.STREAM_TESTNET_URL = stream_url
+    return(api_url)
+
+def parseOrderFills(order) -> dict:
+
+    # execution details of an order response (newOrderRespType FULL)
+    executed_qty = float(order.get('executedQty', 0))
+    quote_qty = float(order.get('cummulativeQuoteQty', 0))
+    commission = {}
+    for fill in order.get('fills', []):
+        commission[fill['commissionAsset']] = commission.get(fill['commissionAsset'], 0) + float(fill['commission'])
+    return({
+        'order_id': order.get('orderId'),
+        'client_order_id': order.get('clientOrderId'),
+        'status': order.get('status'),
+        'transact_time': order.get('transactTime'),
+        'executed_qty': executed_qty,
+        'quote_qty': quote_qty,
+        'fill_price': quote_qty / executed_qty if executed_qty > 0 else None,
+        'commission': commission
+    })
+
+def splitOrderFills(fills, share) -> dict:
+
+    # share of the execution details of an order placed for several grid levels
+    split = dict(fills)
+    split['executed_qty'] = fills['executed_qty'] * share
+    split['quote_qty'] = fills['quote_qty'] * share
+    split['commission'] = {asset: amount * share for asset, amount in fills['commission'].items()}
+    return(split)
+
+class SymbolInfoCache:
+
+    def __init__(self, client, symbols, cache_file='exchange_info.json', ttl=3600, refresh_interval=3600):
+
+        self.client = client
+        self.symbols = list(symbols)
+        self.cache_file = cache_file # on-disk copy of the symbol filters, None to disable
+        self.ttl = ttl # seconds before the on-disk copy is considered stale
+        self.refresh_interval = refresh_interval # seconds between background refreshes
+        self.filters = {} # symbol -> parsed filters
+        self.callbacks = [] # functions called with the symbols whose filters changed
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+
+    def parseFilters(self, symbol_info) -> dict:
+
+        filters_dict = {}
+        for filter in symbol_info['filters']:
+            filters_dict[filter['filterType']] = filter
+
+        # MIN_NOTIONAL has been replaced by NOTIONAL on some markets
+        notional = filters_dict.get('MIN_NOTIONAL', filters_dict.get('NOTIONAL', {}))
+
+        return({
+            'min_qty': float(filters_dict['LOT_SIZE']['minQty']),
+            'step_size': float(filters_dict['LOT_SIZE']['stepSize']),
+            'tick_size': float(filters_dict['PRICE_FILTER']['tickSize']),
+            'min_notional': float(notional.get('minNotional', 0))
+        })
+
+    def fetch(self) -> dict:
+
+        # one exchangeInfo request for all the traded symbols
+        exchange_info = self.client.get_exchange_info()
+        filters = {}
+        for symbol_info in exchange_info['symbols']:
+            if symbol_info['symbol'] in self.symbols:
+                filters[symbol_info['symbol']] = self.parseFilters(symbol_info)
+        missing = set(self.symbols) - set(filters)
+        if missing:
+            raise ValueError(f'symbols not listed by the exchange: {sorted(missing)}')
+        return(filters)
+
+    def readCache(self):
+
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return(None)
+        if time.time() - os.path.getmtime(self.cache_file) > self.ttl:
+            return(None)
+        with open(self.cache_file) as cache_fh:
+            filters = json.load(cache_fh)
+        if not set(self.symbols).issubset(filters):
+            return(None)
+        return(filters)
+
+    def writeCache(self):
+
+        if self.cache_file is None:
+            return
+        # keep the filters of symbols cached by other processes
+        filters = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file) as cache_fh:
+                    filters = json.load(cache_fh)
+            except ValueError:
+                filters = {}
+        filters.update(self.filters)
+        # a temporary file of this process, as other workers of the supervisor write the cache too
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.cache_file)), suffix='.tmp', delete=False) as cache_fh:
+            json.dump(filters, cache_fh)
+        try:
+            os.replace(cache_fh.name, self.cache_file)
+        except OSError:
+            os.remove(cache_fh.name)
+            raise
+
+    def load(self):
+
+        filters = self.readCache()
+        if filters is None:
+            self.filters = self.fetch()
+            self.writeCache()
+        else:
+            self.filters = {symbol: filters[symbol] for symbol in self.symbols}
+
+    def refresh(self):
+
+        filters = self.fetch()
+        changed = [symbol for symbol in self.symbols if filters[symbol] != self.filters.get(symbol)]
+        self.filters = filters
+        self.writeCache()
+        if changed:
+            # log
+            eventlog.emit('info', None, [f'exchange filters changed for {changed}'], True, symbols=changed)
+            for callback in self.callbacks:
+                callback(changed)
+
+    def refreshLoop(self):
+
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                eventlog.emit(
+                    'error', None, ['cannot refresh exchange filters; the error message is displayed below:', str(e)],
+                    message=str(e)
+                )
+
+    def startRefresh(self):
+
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.refreshLoop, daemon=True)
+            self.refresh_thread.start()
+
+    def stopRefresh(self):
+
+        self.stop_event.set()
+
+    def get(self, symbol) -> dict:
+
+        if not self.filters:
+            self.load()
+        return(self.filters[symbol])
+
+    def getMinQty(self, symbol) -> float:
+
+        return(self.get(symbol)['min_qty'])
+
+    def getStepSize(self, symbol) -> float:
+
+        return(self.get(symbol)['step_size'])
+
+    def getTickSize(self, symbol) -> float:
+
+        return(self.get(symbol)['tick_size'])
+
+    def getMinNotional(self, symbol) -> float:
+
+        return(self.get(symbol)['min_notional'])
+
+class CommissionRates:
+
+    def __init__(self, client, bnb_discount=0.25, refresh_interval=3600):
+
+        self.client = client
+        self.bnb_discount = bnb_discount # share of the commission waived when paid in BNB
+        self.refresh_interval = refresh_interval # seconds between background refreshes
+        self.rates = {} # 'maker' and 'taker' -> commission rate, after the BNB discount
+        self.callbacks = [] # functions called with the rates when they change
+        self.refresh_thread = None
+        self.stop_event = threading.Event()
+
+    def bnbBurnEnabled(self) -> bool:
+
+        # the testnet and the simulator have no margin API; commissions are then paid in full
+        try:
+            return(bool(self.client.get_bnb_burn_spot_margin().get('spotBNBBurn')))
+        except Exception:
+            return(False)
+
+    def fetch(self) -> dict:
+
+        # account-wide rates, as decimals since commissionRates was added to the account endpoint
+        account = self.client.get_account()
+        if 'commissionRates' in account:
+            maker = float(account['commissionRates']['maker'])
+            taker = float(account['commissionRates']['taker'])
+        else:
+            maker = account['makerCommission'] / 10000
+            taker = account['takerCommission'] / 10000
+        if self.bnb_discount > 0 and self.bnbBurnEnabled():
+            maker *= 1 - self.bnb_discount
+            taker *= 1 - self.bnb_discount
+        return({'maker': maker, 'taker': taker})
+
+    def load(self):
+
+        self.rates = self.fetch()
+
+        # log
+        eventlog.emit(
+            'info', None, [f'commission rates: maker {self.rates["maker"]} | taker {self.rates["taker"]}'], True,
+            maker=self.rates['maker'], taker=self.rates['taker']
+        )
+
+    def refresh(self):
+
+        rates = self.fetch()
+        changed = rates != self.rates
+        self.rates = rates
+        if changed:
+            # log
+            eventlog.emit(
+                'info', None, [f'commission rates changed: maker {rates["maker"]} | taker {rates["taker"]}'], True,
+                maker=rates['maker'], taker=rates['taker']
+            )
+            for callback in self.callbacks:
+                callback(rates)
+
+    def refreshLoop(self):
+
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                eventlog.emit(
+                    'error', None, ['cannot refresh commission rates; the error message is displayed below:', str(e)],
+                    message=str(e)
+                )
+
+    def startRefresh(self):
+
+        if self.refresh_thread is None:
+            self.refresh_thread = threading.Thread(target=self.refreshLoop, daemon=True)
+            self.refresh_thread.start()
+
+    def stopRefresh(self):
+
+        self.stop_event.set()
+
+    def get(self, liquidity) -> float:
+
+        # liquidity is 'maker' or 'taker'
+        if not self.rates:
+            self.load()
+        return(self.rates[liquidity])
+
+class WalletLedger:
+
+    def __init__(self, client, key, secret, test=True, reconcile_interval=60, drift_tolerance=1e-8):
+
+        self.client = client
+        self.key = key
+        self.secret = secret
+        self.test_mode = test
+        self.reconcile_interval = reconcile_interval # seconds between REST reconciliations
+        self.drift_tolerance = drift_tolerance # balance difference tolerated before logging a drift
+
+        # asset -> {'free': float, 'locked': float}, updated from the user-data stream
+        self.balances = {}
+        self.update_time = 0 # exchange time (ms) of the last balance update
+        self.condition = threading.Condition()
+        self.stream_alive = False
+
+        # functions called with every executionReport message
+        self.execution_callbacks = []
+
+        self.socket_manager = None
+        self.reconcile_thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+
+        # initial snapshot, then keep the ledger current from the user-data stream
+        self.reconcile()
+        self.socket_manager = ThreadedWebsocketManager(self.key, self.secret, testnet=self.test_mode)
+        self.socket_manager.start()
+        self.socket_manager.start_user_socket(callback=self.handleMessage)
+        self.stream_alive = True
+        self.reconcile_thread = threading.Thread(target=self.reconcileLoop, daemon=True)
+        self.reconcile_thread.start()
+
+        # log
+        eventlog.emit('info', None, ['wallet ledger listening to the user-data stream'], True)
+
+    def stop(self):
+
+        self.stop_event.set()
+        if self.socket_manager is not None:
+            self.socket_manager.stop()
+
+    def handleMessage(self, msg):
+
+        event = msg.get('e')
+        if event == 'outboundAccountPosition':
+            with self.condition:
+                for balance in msg['B']:
+                    self.balances[balance['a']] = {'free': float(balance['f']), 'locked': float(balance['l'])}
+                self.update_time = max(self.update_time, msg['u'])
+                self.stream_alive = True
+                self.condition.notify_all()
+        elif event == 'executionReport':
+            for callback in self.execution_callbacks:
+                callback(msg)
+        elif event == 'error':
+            # read balances from REST until the stream delivers again
+            with self.condition:
+                self.stream_alive = False
+                self.condition.notify_all()
+
+            # log
+            eventlog.emit('error', None, [f'user-data stream error: {msg.get("m")}'], message=msg.get('m'))
+
+    def reconcile(self):
+
+        account = self.client.get_account()
+        balances = {}
+        for balance in account['balances']:
+            balances[balance['asset']] = {'free': float(balance['free']), 'locked': float(balance['locked'])}
+
+        with self.condition:
+            # the stream already delivered a more recent state
+            if account['updateTime'] < self.update_time:
+                return
+            drifted = []
+            for asset, balance in self.balances.items():
+                rest_balance = balances.get(asset, {'free': 0.0, 'locked': 0.0})
+                if abs(balance['free'] - rest_balance['free']) > self.drift_tolerance \
+                        or abs(balance['locked'] - rest_balance['locked']) > self.drift_tolerance:
+                    drifted.append(asset)
+            self.balances = balances
+            self.update_time = account['updateTime']
+            self.condition.notify_all()
+
+        if drifted:
+            # log
+            eventlog.emit('info', None, [f'wallet ledger drift corrected for {drifted}'], assets=drifted)
+
+    def reconcileLoop(self):
+
+        while not self.stop_event.wait(self.reconcile_interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                eventlog.emit(
+                    'error', None, ['cannot reconcile the wallet ledger; the error message is displayed below:', str(e)],
+                    message=str(e)
+                )
+
+    def applyOrder(self, base_asset, quote_asset, side, fills, locked=False):
+
+        # apply the fills of an order to the balances right away instead of waiting for the stream;
+        # the next stream update or reconciliation replaces them with the exchange balances
+        with self.condition:
+            # the stream already reported the balances following the order
+            if self.update_time >= fills['transact_time']:
+                return
+            if side == 'BUY':
+                spent, spent_qty, received, received_qty = quote_asset, fills['quote_qty'], base_asset, fills['executed_qty']
+            else:
+                spent, spent_qty, received, received_qty = base_asset, fills['executed_qty'], quote_asset, fills['quote_qty']
+
+            # the funds of a limit order were locked when it was placed
+            self.adjustBalance(spent, 'locked' if locked else 'free', -spent_qty)
+            self.adjustBalance(received, 'free', received_qty)
+            for asset, commission in fills['commission'].items():
+                self.adjustBalance(asset, 'free', -commission)
+
+    def adjustBalance(self, asset, field, amount):
+
+        balance = self.balances.setdefault(asset, {'free': 0.0, 'locked': 0.0})
+        balance[field] = max(balance[field] + amount, 0.0)
+
+    def getFreeBalance(self, asset) -> float:
+
+        if not self.stream_alive:
+            self.reconcile()
+        with self.condition:
+            return(self.balances.get(asset, {'free': 0.0})['free'])
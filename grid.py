@@ -0,0 +1,567 @@
+#!/usr/bin/env python
+
+# grid.py
+
+# exchange-agnostic grid strategy shared by the live bot and the backtester
+
+import bisect
+import itertools
+from collections import deque
+import numpy as np
+
+class Position:
+
+    __slots__ = ('amount', 'price', 'order_id', 'fill_price', 'fees', 'time', 'expected_pnl')
+
+    def __init__(self, amount, price, order_id=None, fill_price=None, fees=None, time=None, expected_pnl=None):
+
+        self.amount = amount # amount of trade coin held
+        self.price = price # grid price the position was opened at
+        self.order_id = order_id
+        self.fill_price = fill_price # average execution price of the buy order
+        self.fees = fees # commission paid, asset -> amount
+        self.time = time # transaction time of the buy order (ms)
+        self.expected_pnl = expected_pnl # stake currency netted after fees if sold at the sell threshold
+
+    def toDict(self) -> dict:
+
+        return({slot: getattr(self, slot) for slot in self.__slots__})
+
+class PositionBook:
+
+    # open positions from the oldest to the newest, with O(1) access to both ends and running
+    # totals of the amount held and of its cost at the grid prices
+    def __init__(self):
+
+        self.positions = deque()
+        self.total_amount = 0.0
+        self.cost_basis = 0.0
+
+    def __len__(self) -> int:
+
+        return(len(self.positions))
+
+    def __iter__(self):
+
+        return(iter(self.positions))
+
+    def push(self, position):
+
+        self.positions.append(position)
+        self.total_amount += position.amount
+        self.cost_basis += position.amount * position.price
+
+    def remove(self, position):
+
+        # totals are recomputed from scratch when the book empties, which discards rounding drift
+        if not self.positions:
+            self.total_amount = 0.0
+            self.cost_basis = 0.0
+        else:
+            self.total_amount -= position.amount
+            self.cost_basis -= position.amount * position.price
+        return(position)
+
+    def popLast(self) -> Position:
+
+        return(self.remove(self.positions.pop()))
+
+    def popFirst(self) -> Position:
+
+        return(self.remove(self.positions.popleft()))
+
+    def popPosition(self, position) -> Position:
+
+        # any open position, e.g. of a ladder level; linear in the number of positions
+        self.positions.remove(position)
+        return(self.remove(position))
+
+    def reduceLast(self, amount, ndecimal_precision):
+
+        position = self.positions[-1]
+        reduced = round(position.amount - amount, ndecimal_precision)
+        self.total_amount += reduced - position.amount
+        self.cost_basis += (reduced - position.amount) * position.price
+        position.amount = reduced
+
+    @property
+    def last(self) -> Position:
+
+        return(self.positions[-1])
+
+    @property
+    def first(self) -> Position:
+
+        return(self.positions[0])
+
+    def exposure(self, price) -> float:
+
+        # value of the open positions at the given price
+        return(self.total_amount * price)
+
+    def amounts(self) -> list:
+
+        return([position.amount for position in self.positions])
+
+    def prices(self) -> list:
+
+        return([position.price for position in self.positions])
+
+class GridStrategy:
+
+    def __init__(self, grid_step=0.01, max_open_trades=5, tradeable_stake=0.8, stoploss=None, fee_rate=0.0):
+
+        # grid parameters
+        self.grid_step = grid_step
+        self.fee_rate = fee_rate # commission rate charged on every buy and sell
+        self.max_open_trades = max_open_trades
+        self.tradeable_stake = tradeable_stake # proportion of tradeable stake currency
+        self.sell_threshold = None
+        self.buy_threshold = None
+        self.positions = PositionBook() # active trades; sells close the newest, stoplosses the oldest
+        self.active_trades = 0  # number of active trades
+        if stoploss is None:
+            stoploss = self.grid_step * (self.max_open_trades + 1)
+        self.stoploss = stoploss # loss tolerance for a position before triggering sell order
+        self.stoploss_price = -np.inf # price that will trigger the stoploss for the oldest position
+
+    def setGrid(self, price):
+
+        # set buy and sell thresholds around the price; the sell threshold also covers the
+        # commissions of the buy and of the sell, so that a round trip nets grid_step
+        self.buy_threshold = round(price * (1 - self.grid_step), 5)
+        self.sell_threshold = round(price * (1 + self.grid_step) * (1 + self.fee_rate) / (1 - self.fee_rate), 5)
+
+    def expectedPnl(self, amount, price) -> float:
+
+        # stake currency netted after fees by a position bought at price and sold at the sell threshold
+        return((self.sell_threshold * (1 - self.fee_rate) - price * (1 + self.fee_rate)) * amount)
+
+    def decide(self, price):
+
+        # decide whether to trigger a stoploss, place a sell/buy order, reset the grid, or do nothing
+        if self.active_trades > 0 and price > self.sell_threshold:
+            return('sell')
+        elif self.active_trades > 0 and price < self.stoploss_price:
+            return('stoploss')
+        elif self.active_trades < self.max_open_trades and price < self.buy_threshold:
+            return('buy')
+        elif self.active_trades == 0 and price > self.sell_threshold:
+            return('reset')
+        return(None)
+
+    def band(self):
+
+        # prices strictly inside (lower, upper) cannot trigger any action
+        lower = -np.inf
+        if self.active_trades < self.max_open_trades:
+            lower = self.buy_threshold
+        if self.active_trades > 0 and self.stoploss_price > lower:
+            lower = self.stoploss_price
+        return(lower, self.sell_threshold)
+
+    @property
+    def trades_amount(self) -> list:
+
+        return(self.positions.amounts())
+
+    @property
+    def trades_price(self) -> list:
+
+        return(self.positions.prices())
+
+    def buyAmount(self, stake_balance, ndecimal_precision) -> float:
+
+        # determine the amount to buy from the total stake, including the open positions
+        total_stake = stake_balance + self.positions.cost_basis
+        stake_amount = total_stake * self.tradeable_stake / self.max_open_trades
+        amount = round(stake_amount / self.buy_threshold, ndecimal_precision)
+        return(amount)
+
+    def openPosition(self, amount, price, order_id=None, fill_price=None, fees=None, time=None):
+
+        # update the amount of active trades
+        self.active_trades += 1
+
+        # move grid
+        self.setGrid(price)
+
+        # add the position to the book of active trades
+        expected_pnl = self.expectedPnl(amount, fill_price if fill_price is not None else price)
+        self.positions.push(Position(amount, price, order_id, fill_price, fees, time, expected_pnl))
+
+        # set stoploss price if no older positions exist
+        if self.active_trades == 1:
+            self.stoploss_price = price * (1 - self.stoploss)
+
+    def closeLastPosition(self, price):
+
+        # determine the amount to sell from the newest active trade
+        position = self.positions.popLast()
+
+        # move grid
+        self.setGrid(price)
+
+        # update the number of active trades
+        self.active_trades -= 1
+
+        return(position.amount, position.price)
+
+    def closeOldestPosition(self):
+
+        # determine the amount to sell from the oldest active trade
+        position = self.positions.popFirst()
+
+        # update the amount of active trades
+        self.active_trades -= 1
+
+        # update stoploss trigger price
+        if self.active_trades > 0:
+            self.stoploss_price = self.positions.first.price * (1 - self.stoploss)
+        else:
+            self.stoploss_price = -np.inf
+
+        return(position.amount, position.price)
+
+    def reduceLastPosition(self, amount, ndecimal_precision):
+
+        # part of the last position was sold; the grid does not move
+        self.positions.reduceLast(amount, ndecimal_precision)
+
+    def reset_grid(self, price):
+
+        # set new buy and sell thresholds
+        self.setGrid(price)
+
+    def getState(self) -> dict:
+
+        return({
+            'grid_step': self.grid_step,
+            'max_open_trades': self.max_open_trades,
+            'tradeable_stake': self.tradeable_stake,
+            'stoploss': self.stoploss,
+            'fee_rate': self.fee_rate,
+            'buy_threshold': self.buy_threshold,
+            'sell_threshold': self.sell_threshold,
+            'positions': [position.toDict() for position in self.positions],
+            'stoploss_price': self.stoploss_price
+        })
+
+    def setState(self, state):
+
+        # the grid parameters of the current run take precedence over the saved ones
+        self.buy_threshold = state['buy_threshold']
+        self.sell_threshold = state['sell_threshold']
+        self.positions = PositionBook()
+        if 'positions' in state:
+            for position in state['positions']:
+                self.positions.push(Position(**position))
+        else:
+            # snapshots written before positions carried their order details
+            for amount, price in zip(state['trades_amount'], state['trades_price']):
+                self.positions.push(Position(amount, price))
+        self.active_trades = len(self.positions)
+        if self.active_trades > 0:
+            self.stoploss_price = self.positions.first.price * (1 - self.stoploss)
+        else:
+            self.stoploss_price = -np.inf
+
+    def replayEvent(self, event, amount, price, order_id=None, fill_price=None, fees=None, time=None):
+
+        # apply a journaled event, with the details of its fill, to the grid state
+        if event == 'buy':
+            self.openPosition(amount, price, order_id, fill_price, fees, time)
+        elif event == 'sell':
+            self.closeLastPosition(price)
+        elif event in ('stoploss', 'drop'):
+            self.closeOldestPosition()
+        elif event == 'partial_sell':
+            self.reduceLastPosition(amount, 8)
+        elif event in ('reset', 'start'):
+            self.setGrid(price)
+
+class LadderStrategy:
+
+    def __init__(self, n_levels=100, lower=None, upper=None, width=0.1, spacing='arithmetic', tradeable_stake=0.8,
+            stoploss=None, fee_rate=0.0):
+
+        # static ladder of n_levels prices between lower and upper, evenly spaced ('arithmetic')
+        # or with a constant ratio ('geometric'); without bounds the ladder spans width on both
+        # sides of the first reference price
+        if spacing not in ('arithmetic', 'geometric'):
+            raise ValueError(f'unknown ladder spacing: {spacing}')
+        self.n_levels = n_levels
+        self.lower = lower
+        self.upper = upper
+        self.width = width
+        self.spacing = spacing
+        self.fee_rate = fee_rate # commission rate charged on every buy and sell
+        self.tradeable_stake = tradeable_stake # proportion of tradeable stake currency
+        self.max_open_trades = n_levels - 1 # one position per level below the top one
+        self.levels = None # ascending ladder prices
+        self.cursor = None # number of levels below the last price: nothing happens between levels[cursor - 1] and levels[cursor]
+        self.positions = PositionBook() # active trades from the oldest to the newest
+        self.held = {} # level -> position bought at it
+        self.held_levels = [] # sorted levels of the held positions
+        self.active_trades = 0
+        self.stoploss = stoploss # loss tolerance below the lowest level before selling all the positions, None for none
+        self.stoploss_price = -np.inf
+        if lower is not None and upper is not None:
+            self.buildLevels(lower, upper)
+
+    def buildLevels(self, lower, upper):
+
+        if self.spacing == 'geometric':
+            levels = np.geomspace(lower, upper, self.n_levels)
+        else:
+            levels = np.linspace(lower, upper, self.n_levels)
+        self.levels = np.round(levels, 8).tolist()
+
+    def setGrid(self, price):
+
+        # build the ladder around the first reference price, then only move the cursor
+        if self.levels is None:
+            lower = self.lower if self.lower is not None else price * (1 - self.width)
+            upper = self.upper if self.upper is not None else price * (1 + self.width)
+            self.buildLevels(lower, upper)
+        self.cursor = bisect.bisect_left(self.levels, price)
+
+    @property
+    def buy_threshold(self):
+
+        # next level crossed downwards, which buys a position if it is free
+        if self.cursor is None:
+            return(None)
+        return(self.levels[self.cursor - 1] if self.cursor > 0 else -np.inf)
+
+    @property
+    def sell_threshold(self):
+
+        # next level crossed upwards
+        if self.cursor is None:
+            return(None)
+        return(self.levels[self.cursor] if self.cursor < self.n_levels else np.inf)
+
+    def sellLevel(self, level) -> int:
+
+        # first level above which a position bought at level nets a profit after the commissions
+        # of the buy and of the sell; n_levels if there is none
+        return(bisect.bisect_right(self.levels, self.levels[level] * (1 + self.fee_rate) / (1 - self.fee_rate)))
+
+    def soldBelow(self, cursor) -> int:
+
+        # number of levels whose sell level is below the cursor, i.e. crossed upwards by a price
+        # above levels[cursor - 1]
+        if cursor == 0:
+            return(0)
+        return(bisect.bisect_left(self.levels, self.levels[cursor - 1] * (1 - self.fee_rate) / (1 + self.fee_rate)))
+
+    def buyableLevels(self) -> int:
+
+        # number of levels, from the lowest, with a sell level above them
+        return(self.soldBelow(self.n_levels))
+
+    def expectedPnl(self, amount, price, level):
+
+        # stake currency netted after fees by a position bought at price and sold at its sell
+        # level; None if no level is high enough
+        sell_level = self.sellLevel(level)
+        if sell_level >= self.n_levels:
+            return(None)
+        return((self.levels[sell_level] * (1 - self.fee_rate) - price * (1 + self.fee_rate)) * amount)
+
+    def updateStoploss(self):
+
+        if self.stoploss is not None and self.active_trades > 0:
+            self.stoploss_price = self.levels[0] * (1 - self.stoploss)
+        else:
+            self.stoploss_price = -np.inf
+
+    def band(self):
+
+        # prices strictly inside (lower, upper) cross no level; the sell level of the lowest
+        # position is below the cursor while buys left untraded hold the cursor up
+        lower = self.buy_threshold
+        upper = self.sell_threshold
+        if self.active_trades > 0 and self.stoploss_price > lower:
+            lower = self.stoploss_price
+        if self.held_levels:
+            sell_level = self.sellLevel(self.held_levels[0])
+            if sell_level < self.n_levels and self.levels[sell_level] < upper:
+                upper = self.levels[sell_level]
+        return(lower, upper)
+
+    def decide(self, price):
+
+        # the levels crossed are found by cross(), and the cursor moved by moveCursor()
+        lower, upper = self.band()
+        if price < lower or price > upper:
+            return('ladder')
+        return(None)
+
+    def cross(self, price) -> tuple:
+
+        # levels to trade at the price, in ascending order, with their trigger: all the levels held
+        # on a 'stoploss', the levels whose position is above its sell level to 'sell', or the
+        # free levels crossed downwards to 'buy'; (None, []) if there are none. Sells, which free
+        # stake, come first when levels left untraded make both possible
+        cursor = bisect.bisect_left(self.levels, price)
+        if self.active_trades > 0 and price < self.stoploss_price:
+            return('stoploss', list(self.held_levels))
+        sells = self.held_levels[:bisect.bisect_left(self.held_levels, self.soldBelow(cursor))]
+        if sells:
+            return('sell', sells)
+        if cursor < self.cursor:
+            top = min(self.cursor, self.buyableLevels())
+            buys = [level for level in range(bisect.bisect_right(self.levels, price), top) if level not in self.held]
+            if buys:
+                return('buy', buys)
+        return(None, [])
+
+    def moveCursor(self, price, trigger=None, levels=()):
+
+        # move the cursor to the price once the levels returned by cross() were traded; the
+        # cursor stays above the buys left untraded, and is not lowered by sells, which come
+        # before the buys of the same tick, so that the next tick below them buys them; the
+        # positions left unsold keep the band below their sell level
+        cursor = bisect.bisect_left(self.levels, price)
+        if trigger == 'buy':
+            untraded = [level for level in levels if level not in self.held]
+            if untraded:
+                cursor = max(cursor, untraded[-1] + 1)
+        elif trigger == 'sell':
+            cursor = max(cursor, self.cursor)
+        self.cursor = cursor
+
+    @property
+    def trades_amount(self) -> list:
+
+        return(self.positions.amounts())
+
+    @property
+    def trades_price(self) -> list:
+
+        return(self.positions.prices())
+
+    def buyAmount(self, stake_balance, ndecimal_precision, level=None) -> float:
+
+        # the same stake for every level, from the total stake including the open positions
+        if level is None:
+            level = self.cursor - 1
+        total_stake = stake_balance + self.positions.cost_basis
+        stake_amount = total_stake * self.tradeable_stake / self.max_open_trades
+        amount = round(stake_amount / self.levels[level], ndecimal_precision)
+        return(amount)
+
+    def openLevel(self, level, amount, order_id=None, fill_price=None, fees=None, time=None):
+
+        price = self.levels[level]
+        expected_pnl = self.expectedPnl(amount, fill_price if fill_price is not None else price, level)
+        position = Position(amount, price, order_id, fill_price, fees, time, expected_pnl)
+        self.held[level] = position
+        bisect.insort(self.held_levels, level)
+        self.positions.push(position)
+        self.active_trades += 1
+        self.updateStoploss()
+
+    def closeLevel(self, level):
+
+        self.held_levels.remove(level)
+        position = self.positions.popPosition(self.held.pop(level))
+        self.active_trades -= 1
+        self.updateStoploss()
+        return(position.amount, position.price)
+
+    def levelOf(self, price) -> int:
+
+        # level of a position, whose price is a ladder price
+        return(bisect.bisect_left(self.levels, price))
+
+    def freeLevel(self, price):
+
+        # highest free level with a sell level at or below the price, otherwise the lowest one
+        # above it; for the positions of another ladder or of a band grid
+        top = self.buyableLevels()
+        start = min(max(bisect.bisect_right(self.levels, price) - 1, 0), top - 1)
+        for level in itertools.chain(range(start, -1, -1), range(start + 1, top)):
+            if level not in self.held:
+                return(level)
+        return(None)
+
+    def openPosition(self, amount, price, order_id=None, fill_price=None, fees=None, time=None):
+
+        level = self.freeLevel(price)
+        if level is not None:
+            self.openLevel(level, amount, order_id, fill_price, fees, time)
+
+    def closeOldestPosition(self):
+
+        return(self.closeLevel(self.levelOf(self.positions.first.price)))
+
+    def reset_grid(self, price):
+
+        self.setGrid(price)
+
+    def getState(self) -> dict:
+
+        return({
+            'strategy': 'ladder',
+            'n_levels': self.n_levels,
+            'lower': self.levels[0],
+            'upper': self.levels[-1],
+            'spacing': self.spacing,
+            'tradeable_stake': self.tradeable_stake,
+            'stoploss': self.stoploss,
+            'fee_rate': self.fee_rate,
+            'cursor': self.cursor,
+            'buy_threshold': self.buy_threshold,
+            'sell_threshold': self.sell_threshold,
+            'positions': [position.toDict() for position in self.positions],
+            'stoploss_price': self.stoploss_price
+        })
+
+    def setState(self, state):
+
+        # the ladder of the current run takes precedence; without bounds the saved ladder is
+        # rebuilt, and the positions of another ladder or of a band grid are moved to free levels
+        saved_ladder = state.get('strategy') == 'ladder'
+        thresholds = [price for price in (state['buy_threshold'], state['sell_threshold']) if np.isfinite(price)]
+        if self.levels is None and saved_ladder:
+            self.buildLevels(state['lower'], state['upper'])
+        elif self.levels is None:
+            self.setGrid(sum(thresholds) / len(thresholds))
+        if saved_ladder and (state['n_levels'], state['lower'], state['upper']) == (self.n_levels, self.levels[0], self.levels[-1]):
+            self.cursor = state['cursor']
+        else:
+            self.cursor = bisect.bisect_left(self.levels, sum(thresholds) / len(thresholds))
+        self.positions = PositionBook()
+        self.held = {}
+        self.held_levels = []
+        self.active_trades = 0
+        if 'positions' in state:
+            positions = [Position(**position) for position in state['positions']]
+        else:
+            positions = [Position(amount, price) for amount, price in zip(state['trades_amount'], state['trades_price'])]
+        for position in positions:
+            level = self.freeLevel(position.price)
+            if level is None:
+                continue
+            position.price = self.levels[level]
+            self.held[level] = position
+            bisect.insort(self.held_levels, level)
+            self.positions.push(position)
+            self.active_trades += 1
+        self.updateStoploss()
+
+    def replayEvent(self, event, amount, price, order_id=None, fill_price=None, fees=None, time=None):
+
+        # apply a journaled event, with the details of its fill, to the ladder; sells and
+        # stoplosses are journaled at the level of their position
+        if event == 'buy':
+            self.openPosition(amount, price, order_id, fill_price, fees, time)
+        elif event in ('sell', 'stoploss') and self.levelOf(price) in self.held:
+            self.closeLevel(self.levelOf(price))
+        elif event == 'drop':
+            self.closeOldestPosition()
+        elif event in ('reset', 'start'):
+            self.setGrid(price)
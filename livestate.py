@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+# livestate.py
+
+# live grid state of every pair (last price, thresholds, open positions and balances) in a
+# memory-mapped file, written by the bot workers and read by the dashboard without queries
+
+import itertools
+import os
+import time
+import numpy as np
+
+MAGIC = b'GRIDLIVE'
+HEADER_SIZE = 64 # bytes before the first slot
+MAX_POSITIONS = 64 # newest positions stored per pair; the totals cover all of them
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('n_slots', '<i8')])
+
+# one slot per pair; sequence is odd while the slot is being written (seqlock)
+SLOT_DTYPE = np.dtype([
+    ('sequence', '<u8'),
+    ('symbol', 'S16'),
+    ('trade_coin', 'S12'),
+    ('stake_currency', 'S12'),
+    ('pid', '<i8'),
+    ('updated', '<f8'),
+    ('price', '<f8'),
+    ('buy_threshold', '<f8'),
+    ('sell_threshold', '<f8'),
+    ('stoploss_price', '<f8'),
+    ('active_trades', '<i8'),
+    ('total_amount', '<f8'),
+    ('cost_basis', '<f8'),
+    ('stake_balance', '<f8'),
+    ('trade_balance', '<f8'),
+    ('n_positions', '<i8'),
+    ('position_amounts', '<f8', (MAX_POSITIONS,)),
+    ('position_prices', '<f8', (MAX_POSITIONS,))
+])
+
+def orNan(value) -> float:
+
+    return(np.nan if value is None else value)
+
+class LiveState:
+
+    def __init__(self, path, readonly=True):
+
+        header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))[0]
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{path} is not a live state file')
+        n_slots = int(header['n_slots'])
+        self.path = path
+        self.inode = os.stat(path).st_ino
+        self.readonly = readonly
+        self.slots = np.memmap(path, dtype=SLOT_DTYPE, mode='r' if readonly else 'r+', offset=HEADER_SIZE, shape=(n_slots,))
+
+        # one view per field, so that a write does not build a view of the whole slot
+        self.fields = {name: self.slots[name] for name in SLOT_DTYPE.names}
+        self.index = {symbol.decode(): i for i, symbol in enumerate(self.slots['symbol'])}
+        self.positions_written = {} # slot -> (number of positions, total amount) last written
+        self.last_read = {} # slot -> last consistent state read, returned while the slot stays torn
+
+    @staticmethod
+    def create(path, pairs):
+
+        # pairs maps each symbol to its (trade coin, stake currency); the file is written aside
+        # and moved in place, so that readers never see it half initialized
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as state_fh:
+            state_fh.truncate(HEADER_SIZE + SLOT_DTYPE.itemsize * len(pairs))
+        header = np.memmap(tmp_path, dtype=HEADER_DTYPE, mode='r+', shape=(1,))
+        header[0] = (MAGIC, len(pairs))
+        header.flush()
+        slots = np.memmap(tmp_path, dtype=SLOT_DTYPE, mode='r+', offset=HEADER_SIZE, shape=(len(pairs),))
+        for i, (symbol, (trade_coin, stake_currency)) in enumerate(pairs.items()):
+            slots['symbol'][i] = symbol.encode()
+            slots['trade_coin'][i] = trade_coin.encode()
+            slots['stake_currency'][i] = stake_currency.encode()
+            for name in ('price', 'buy_threshold', 'sell_threshold', 'stoploss_price', 'stake_balance', 'trade_balance'):
+                slots[name][i] = np.nan
+        slots.flush()
+        del header, slots
+        os.replace(tmp_path, path)
+        return(LiveState(path, readonly=False))
+
+    def claim(self, symbols):
+
+        # a writer killed inside publish() leaves the sequence of its slot odd; the worker
+        # restarted on the same pairs makes it even again before its first write
+        sequence = self.fields['sequence']
+        for symbol in symbols:
+            i = self.index[symbol]
+            if sequence[i] % 2 == 1:
+                sequence[i] += 1
+
+    def replaced(self) -> bool:
+
+        # the supervisor recreates the file on restart
+        try:
+            return(os.stat(self.path).st_ino != self.inode)
+        except FileNotFoundError:
+            return(False)
+
+    def publish(self, symbol, price, grid, stake_balance, trade_balance):
+
+        i = self.index[symbol]
+        fields = self.fields
+        positions = grid.positions
+        fields['sequence'][i] += 1
+        fields['pid'][i] = os.getpid()
+        fields['updated'][i] = time.time()
+        fields['price'][i] = orNan(price)
+        fields['buy_threshold'][i] = orNan(grid.buy_threshold)
+        fields['sell_threshold'][i] = orNan(grid.sell_threshold)
+        fields['stoploss_price'][i] = grid.stoploss_price
+        fields['active_trades'][i] = grid.active_trades
+        fields['total_amount'][i] = positions.total_amount
+        fields['cost_basis'][i] = positions.cost_basis
+        fields['stake_balance'][i] = orNan(stake_balance)
+        fields['trade_balance'][i] = orNan(trade_balance)
+
+        # the positions are only rewritten when the book changed
+        book = (len(positions), positions.total_amount)
+        if self.positions_written.get(i) != book:
+            newest = list(itertools.islice(reversed(positions.positions), MAX_POSITIONS))[::-1]
+            fields['n_positions'][i] = len(positions)
+            fields['position_amounts'][i, :len(newest)] = [position.amount for position in newest]
+            fields['position_prices'][i, :len(newest)] = [position.price for position in newest]
+            self.positions_written[i] = book
+        fields['sequence'][i] += 1
+
+    def readSlot(self, i, retries=100):
+
+        # consistent copy of a slot, retried while a writer is inside it; when the retries run
+        # out, e.g. after its writer died, the last consistent copy is returned with stale set,
+        # or None if there is none
+        sequence = self.fields['sequence']
+        slot = None
+        for attempt in range(retries):
+            before = int(sequence[i])
+            if before % 2 == 0:
+                copy = self.slots[i].copy()
+                if int(sequence[i]) == before:
+                    slot = copy
+                    break
+            time.sleep(0)
+        if slot is None:
+            if i not in self.last_read:
+                return(None)
+            return(dict(self.last_read[i], stale=True))
+        n_kept = min(int(slot['n_positions']), MAX_POSITIONS)
+        state = {name: slot[name].item() for name in SLOT_DTYPE.names if not name.startswith('position_')}
+        for name in ('symbol', 'trade_coin', 'stake_currency'):
+            state[name] = state[name].decode()
+        state['position_amounts'] = slot['position_amounts'][:n_kept].tolist()
+        state['position_prices'] = slot['position_prices'][:n_kept].tolist()
+        state['stale'] = False
+        self.last_read[i] = state
+        return(state)
+
+    def read(self) -> dict:
+
+        # symbol -> state of all the pairs, None for a slot never read consistently
+        return({symbol: self.readSlot(i) for symbol, i in self.index.items()})
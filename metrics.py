@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# metrics.py
+
+# latency histograms of the trading loop, served over HTTP and dumped to the wallet database
+
+import datetime
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from eventlog import eventlog
+
+class Histogram:
+
+    # log-linear buckets as in HdrHistogram: each power of two is split into
+    # 2 ** sub_bucket_bits linear sub-buckets, giving a bounded relative error
+    def __init__(self, sub_bucket_bits=7, unit=1e-6):
+
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.unit = unit # smallest resolved value, in seconds
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def bucketIndex(self, value) -> int:
+
+        units = int(value / self.unit)
+        if units < self.sub_buckets:
+            return(units)
+        exponent = units.bit_length() - self.sub_bucket_bits
+        return((exponent << self.sub_bucket_bits) + (units >> exponent))
+
+    def bucketValue(self, index) -> float:
+
+        # upper bound of a bucket, in seconds
+        exponent = index >> self.sub_bucket_bits
+        sub_bucket = index & (self.sub_buckets - 1)
+        return(((sub_bucket + 1) << exponent) * self.unit)
+
+    def record(self, value):
+
+        value = max(value, 0.0)
+        index = self.bucketIndex(value)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def percentile(self, p) -> float:
+
+        with self.lock:
+            if self.count == 0:
+                return(0.0)
+            rank = max(1, math.ceil(self.count * p / 100))
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return(min(self.bucketValue(index), self.max))
+            return(self.max)
+
+    def summary(self) -> dict:
+
+        return({
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        })
+
+class Metrics:
+
+    def __init__(self):
+
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.dump_thread = None
+        self.stop_event = threading.Event()
+
+    def histogram(self, name) -> Histogram:
+
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return(histogram)
+
+    def record(self, name, seconds):
+
+        self.histogram(name).record(seconds)
+
+    @contextmanager
+    def span(self, name):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+
+        return({name: histogram.summary() for name, histogram in sorted(self.histograms.items())})
+
+    def prometheus(self) -> str:
+
+        lines = [
+            '# HELP gridbot_latency_seconds latency of the grid bot operations',
+            '# TYPE gridbot_latency_seconds summary'
+        ]
+        for name, summary in self.summary().items():
+            for quantile in ('50', '90', '99'):
+                lines.append(f'gridbot_latency_seconds{{span="{name}",quantile="0.{quantile}"}} {summary["p" + quantile]}')
+            lines.append(f'gridbot_latency_seconds_sum{{span="{name}"}} {summary["mean"] * summary["count"]}')
+            lines.append(f'gridbot_latency_seconds_count{{span="{name}"}} {summary["count"]}')
+            lines.append(f'gridbot_latency_seconds_max{{span="{name}"}} {summary["max"]}')
+        return('\n'.join(lines) + '\n')
+
+    def serve(self, port, host='127.0.0.1'):
+
+        # /metrics in the Prometheus text format, /metrics.json as JSON
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.summary()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        # log
+        eventlog.emit('info', None, [f'serving latency metrics at http://{host}:{port}/metrics'], True, host=host, port=port)
+
+    def dump(self, wallet_writer):
+
+        # one row per span, in the latency table of the wallet database
+        local_time = str(datetime.datetime.now())
+        for name, summary in self.summary().items():
+            wallet_writer.write(
+                'latency',
+                ['local_time', 'span', 'count', 'mean', 'p50', 'p90', 'p99', 'max'],
+                [local_time, name, summary['count'], summary['mean'], summary['p50'], summary['p90'], summary['p99'], summary['max']]
+            )
+
+    def startDump(self, wallet_writer, interval=60):
+
+        def dumpLoop():
+            while not self.stop_event.wait(interval):
+                self.dump(wallet_writer)
+
+        if self.dump_thread is None:
+            self.dump_thread = threading.Thread(target=dumpLoop, daemon=True)
+            self.dump_thread.start()
+
+    def stop(self):
+
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+
+# registry shared by all the bots of the process
+metrics = Metrics()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+# scheduler.py
+
+# shared HTTP layer of the bots: keep-alive connection pooling, a token bucket of request
+# weight fed by the X-MBX-USED-WEIGHT-1M headers, order requests ahead of informational
+# ones, and backoff on 429/418 responses
+
+import heapq
+import itertools
+import threading
+import time
+import urllib.parse
+import requests
+from eventlog import eventlog
+from metrics import metrics
+
+# request priorities, lower first
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET_DATA = 2
+
+# (method, path) -> request weight; None as method matches any method
+REQUEST_WEIGHTS = {
+    (None, '/api/v3/ping'): 1,
+    (None, '/api/v3/time'): 1,
+    (None, '/api/v3/exchangeInfo'): 20,
+    (None, '/api/v3/ticker/price'): 2,
+    (None, '/api/v3/avgPrice'): 2,
+    (None, '/api/v3/klines'): 2,
+    (None, '/api/v3/aggTrades'): 2,
+    (None, '/api/v3/account'): 20,
+    (None, '/api/v3/account/commission'): 20,
+    (None, '/api/v3/openOrders'): 6,
+    ('GET', '/api/v3/order'): 4,
+    ('POST', '/api/v3/order'): 1,
+    ('DELETE', '/api/v3/order'): 1,
+    (None, '/api/v3/order/test'): 1,
+    (None, '/api/v3/order/cancelReplace'): 1,
+    (None, '/api/v3/userDataStream'): 2
+}
+
+def requestWeight(method, url) -> int:
+
+    parsed = urllib.parse.urlsplit(url)
+    path = parsed.path
+    weight = REQUEST_WEIGHTS.get((method, path), REQUEST_WEIGHTS.get((None, path), 1))
+
+    # requests covering several or all the symbols cost more
+    if path == '/api/v3/ticker/price' and 'symbol=' not in parsed.query:
+        weight = 4
+    elif path == '/api/v3/openOrders' and 'symbol=' not in parsed.query:
+        weight = 80
+    return(weight)
+
+def requestPriority(method, url) -> int:
+
+    path = urllib.parse.urlsplit(url).path
+    if path.startswith('/api/v3/order') and method in ('POST', 'DELETE'):
+        return(PRIORITY_ORDER)
+    if path in ('/api/v3/account', '/api/v3/openOrders', '/api/v3/userDataStream', '/api/v3/account/commission'):
+        return(PRIORITY_ACCOUNT)
+    return(PRIORITY_MARKET_DATA)
+
+class WeightBudget:
+
+    def __init__(self, weight_limit=1200, order_reserve=0.2, max_backoff=60, share=1.0):
+
+        # tokens refill at weight_limit per minute; requests other than orders leave
+        # order_reserve of the limit untouched; processes sharing the IP address each get a
+        # share of the exchange's limit
+        self.share = share
+        weight_limit = weight_limit * share
+        self.weight_limit = weight_limit
+        self.order_reserve = order_reserve
+        self.tokens = float(weight_limit)
+        self.refill_time = time.monotonic()
+        self.max_backoff = max_backoff # seconds, for 429 responses without Retry-After
+
+        self.paused_until = 0.0 # monotonic time before which no request is sent
+        self.backoff_count = 0
+        self.waiters = [] # heap of (priority, sequence) of the requests waiting for weight
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def setLimit(self, weight_limit):
+
+        weight_limit = weight_limit * self.share
+        with self.condition:
+            self.tokens = min(self.tokens, weight_limit) + max(weight_limit - self.weight_limit, 0)
+            self.weight_limit = weight_limit
+            self.condition.notify_all()
+
+    def refill(self, now):
+
+        self.tokens = min(self.weight_limit, self.tokens + (now - self.refill_time) * self.weight_limit / 60)
+        self.refill_time = now
+
+    def acquire(self, weight, priority=PRIORITY_MARKET_DATA):
+
+        # block until the request can be sent without exceeding the budget, serving the
+        # waiting requests by priority, then in arrival order
+        floor = 0 if priority == PRIORITY_ORDER else self.weight_limit * self.order_reserve
+        start = time.monotonic()
+        with self.condition:
+            ticket = (priority, next(self.sequence))
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    if now < self.paused_until:
+                        wait = self.paused_until - now
+                    elif self.waiters[0] != ticket:
+                        wait = None
+                    elif self.tokens - weight >= floor or self.tokens >= self.weight_limit:
+                        self.tokens -= weight
+                        break
+                    else:
+                        wait = (weight + floor - self.tokens) * 60 / self.weight_limit
+                    self.condition.wait(wait)
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            metrics.record('weight_wait', waited)
+
+    def update(self, used_weight):
+
+        # the exchange's count of the weight used in the current minute, by all the processes
+        # sharing the IP address, is authoritative
+        with self.condition:
+            self.refill(time.monotonic())
+            self.tokens = min(self.tokens, self.weight_limit - used_weight * self.share)
+
+    def pause(self, retry_after=None) -> float:
+
+        # stop all the requests for retry_after seconds, or an exponential backoff without it
+        with self.condition:
+            self.backoff_count += 1
+            if retry_after is None:
+                retry_after = min(2 ** self.backoff_count, self.max_backoff)
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.tokens = min(self.tokens, 0)
+            self.condition.notify_all()
+        return(retry_after)
+
+    def resetBackoff(self):
+
+        with self.condition:
+            self.backoff_count = 0
+
+class RestSession(requests.Session):
+
+    def __init__(self, budget=None, pool_maxsize=10, max_retries=3):
+
+        # keep-alive connections, reused by the price requests and the binance client
+        super().__init__()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.budget = budget if budget is not None else WeightBudget()
+        self.max_retries = max_retries # retries of informational requests rejected with 429
+
+    def attach(self, client):
+
+        # route the requests of a binance Client through this session, keeping its API key header
+        self.headers.update(client.session.headers)
+        client.session = self
+
+    def request(self, method, url, *args, **kwargs):
+
+        # the binance client passes the query string of GET requests as params
+        method = method.upper()
+        full_url = url
+        if kwargs.get('params'):
+            full_url = requests.Request(method, url, params=kwargs['params']).prepare().url
+        weight = requestWeight(method, full_url)
+        priority = requestPriority(method, full_url)
+        for attempt in range(self.max_retries + 1):
+            self.budget.acquire(weight, priority)
+            response = super().request(method, url, *args, **kwargs)
+
+            used_weight = response.headers.get('X-MBX-USED-WEIGHT-1M')
+            if used_weight is not None:
+                self.budget.update(int(used_weight))
+            if response.status_code not in (418, 429):
+                self.budget.resetBackoff()
+                if response.ok and url.endswith('/exchangeInfo'):
+                    self.readRateLimits(response)
+                return(response)
+
+            retry_after = response.headers.get('Retry-After')
+            pause = self.budget.pause(int(retry_after) if retry_after is not None else None)
+
+            # log
+            eventlog.emit(
+                'error', None,
+                [f'request weight limit hit ({response.status_code}); pausing requests for {pause} seconds'],
+                status_code=response.status_code, pause=pause, url=url
+            )
+
+            # an order rejected for its rate is not retried: the price it was meant for is gone
+            if priority == PRIORITY_ORDER or response.status_code == 418:
+                return(response)
+        return(response)
+
+    def readRateLimits(self, response):
+
+        for rate_limit in response.json().get('rateLimits', []):
+            if rate_limit['rateLimitType'] == 'REQUEST_WEIGHT' and rate_limit['interval'] == 'MINUTE' \
+                    and rate_limit['intervalNum'] == 1:
+                self.budget.setLimit(rate_limit['limit'])
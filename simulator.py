@@ -0,0 +1,1123 @@
+#!/usr/bin/env python
+
+# simulator.py
+
+# local stand-in for the Binance spot REST API and websocket streams used by the bot,
+# driven by scripted price paths, for offline and load tests
+
+import argparse as ap
+import asyncio
+import base64
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import secrets
+import struct
+import threading
+import time
+import urllib.parse
+import numpy as np
+
+# magic string of the websocket opening handshake (RFC 6455)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found', 418: "I'm a teapot", 429: 'Too Many Requests'}
+
+def formatAmount(value) -> str:
+
+    return(f'{value:.8f}')
+
+def roundDown(value, step) -> float:
+
+    # round a quantity down to a multiple of the step size
+    return(round(math.floor(round(value / step, 8)) * step, 8))
+
+def pricePath(spec, rng) -> np.ndarray:
+
+    # prices of a symbol from a scenario entry: an explicit list, a trades or klines file,
+    # a seeded random walk, or linear segments between target prices
+    if 'prices' in spec:
+        return(np.asarray(spec['prices'], dtype=float))
+    if 'data' in spec:
+        from backtest import loadPrices
+        return(loadPrices(spec['data']))
+    if 'random_walk' in spec:
+        walk = spec['random_walk']
+        steps = rng.normal(0, walk.get('volatility', 0.001), walk.get('ticks', 100000) - 1)
+        return(walk['start'] * np.exp(np.concatenate([[0.0], np.cumsum(steps)])))
+    if 'segments' in spec:
+        prices = [np.asarray([spec['start']], dtype=float)]
+        for target, ticks in spec['segments']:
+            prices.append(np.linspace(prices[-1][-1], target, ticks + 1)[1:])
+        return(np.concatenate(prices))
+    raise ValueError('a symbol needs prices, data, random_walk or segments')
+
+class SimulatorError(Exception):
+
+    # error returned to the client in the Binance format {"code": ..., "msg": ...}
+    def __init__(self, status, code, msg, retry_after=None):
+
+        super().__init__(msg)
+        self.status = status
+        self.code = code
+        self.msg = msg
+        self.retry_after = retry_after
+
+    def body(self) -> dict:
+
+        return({'code': self.code, 'msg': self.msg})
+
+class Exchange:
+
+    def __init__(self, symbols, balances, maker_commission=0.001, taker_commission=0.001,
+            partial_fill_ratio=1.0, rate_limit_error_rate=0.0, weight_limit=1200,
+            ban_after=3, ban_duration=120, loop=True, seed=0):
+
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+
+        # symbol -> trade coin, stake currency, filters and price path
+        self.symbols = {}
+        for symbol, spec in symbols.items():
+            prices = np.round(pricePath(spec, self.rng) / spec['tick_size']) * spec['tick_size']
+            self.symbols[symbol] = {
+                'trade_coin': spec['trade_coin'],
+                'stake_currency': spec['stake_currency'],
+                'tick_size': spec['tick_size'],
+                'step_size': spec.get('step_size', 0.1),
+                'min_qty': spec.get('min_qty', spec.get('step_size', 0.1)),
+                'min_notional': spec.get('min_notional', 10.0),
+                'prices': prices
+            }
+        self.cursor = {symbol: 0 for symbol in self.symbols} # index of the current price of each symbol
+        self.kline_ticks = 60 # ticks of the price paths per one-minute kline
+        self.loop = loop # restart the price paths from the beginning when they end
+
+        # starting balances of every new API key
+        self.default_balances = {asset: float(amount) for asset, amount in balances.items()}
+        self.accounts = {} # API key -> {'balances': {asset: {'free', 'locked'}}, 'update_time'}
+
+        self.maker_commission = maker_commission
+        self.taker_commission = taker_commission
+        self.partial_fill_ratio = partial_fill_ratio # largest share of an order filled by one tick
+
+        # open limit orders, and per symbol a max-heap of buy prices and a min-heap of sell prices
+        self.orders = {} # order id -> order
+        self.buy_book = {symbol: [] for symbol in self.symbols}
+        self.sell_book = {symbol: [] for symbol in self.symbols}
+        self.order_ids = itertools.count(1)
+        self.trade_ids = itertools.count(1)
+
+        # request weight per client and minute, as reported in X-MBX-USED-WEIGHT-1M
+        self.weight_limit = weight_limit
+        self.rate_limit_error_rate = rate_limit_error_rate # share of requests answered with an injected 429
+        self.ban_after = ban_after # 429 responses in a minute before the client gets a 418
+        self.ban_duration = ban_duration # seconds
+        self.weights = {} # client -> (minute, used weight, 429 responses)
+        self.bans = {} # client -> time the ban is lifted
+
+        # functions called with (symbol, price, qty, event time) on every tick,
+        # and with (API key, message) for every user-data event
+        self.market_callbacks = []
+        self.user_callbacks = []
+
+    def now(self) -> int:
+
+        return(int(time.time() * 1000))
+
+    def price(self, symbol) -> float:
+
+        info = self.symbols.get(symbol)
+        if info is None:
+            raise SimulatorError(400, -1121, 'Invalid symbol.')
+        return(float(info['prices'][self.cursor[symbol]]))
+
+    def account(self, key) -> dict:
+
+        account = self.accounts.get(key)
+        if account is None:
+            account = {
+                'balances': {asset: {'free': amount, 'locked': 0.0} for asset, amount in self.default_balances.items()},
+                'update_time': self.now()
+            }
+            self.accounts[key] = account
+        return(account)
+
+    def balance(self, key, asset) -> dict:
+
+        return(self.account(key)['balances'].setdefault(asset, {'free': 0.0, 'locked': 0.0}))
+
+    def chargeWeight(self, client, weight) -> int:
+
+        # fixed one-minute windows; a client ignoring the 429 responses is banned with 418
+        now = time.time()
+        with self.lock:
+            banned_until = self.bans.get(client, 0)
+            if now < banned_until:
+                raise SimulatorError(418, -1003, f'Way too many requests; IP banned until {int(banned_until * 1000)}.',
+                    retry_after=math.ceil(banned_until - now))
+            minute = int(now // 60)
+            window, used, rejected = self.weights.get(client, (minute, 0, 0))
+            if window != minute:
+                used, rejected = 0, 0
+            used += weight
+            over_limit = used > self.weight_limit
+            injected = not over_limit and self.rate_limit_error_rate > 0 and self.rng.random() < self.rate_limit_error_rate
+            if over_limit:
+                rejected += 1
+            self.weights[client] = (minute, used, rejected)
+            if rejected > self.ban_after:
+                self.bans[client] = now + self.ban_duration
+                raise SimulatorError(418, -1003, 'Way too many requests; IP banned.', retry_after=self.ban_duration)
+            if over_limit or injected:
+                raise SimulatorError(429, -1003,
+                    f'Too many requests; current limit is {self.weight_limit} request weight per 1 MINUTE.',
+                    retry_after=math.ceil(60 - now % 60))
+            return(used)
+
+    def usedWeight(self, client) -> int:
+
+        window, used, _ = self.weights.get(client, (0, 0, 0))
+        return(used if window == int(time.time() // 60) else 0)
+
+    def step(self) -> bool:
+
+        # advance every price path by one tick and fill the limit orders it crosses;
+        # returns False once the paths ended and loop is off
+        with self.lock:
+            advanced = False
+            event_time = self.now()
+            for symbol, info in self.symbols.items():
+                cursor = self.cursor[symbol] + 1
+                if cursor >= len(info['prices']):
+                    if not self.loop:
+                        continue
+                    cursor = 0
+                self.cursor[symbol] = cursor
+                advanced = True
+                price = float(info['prices'][cursor])
+                self.matchOrders(symbol, price, event_time)
+                for callback in self.market_callbacks:
+                    callback(symbol, price, info['step_size'], event_time)
+            return(advanced)
+
+    def exchangeInfo(self) -> dict:
+
+        symbols = []
+        for symbol, info in self.symbols.items():
+            symbols.append({
+                'symbol': symbol,
+                'status': 'TRADING',
+                'baseAsset': info['trade_coin'],
+                'baseAssetPrecision': 8,
+                'quoteAsset': info['stake_currency'],
+                'quotePrecision': 8,
+                'orderTypes': ['LIMIT', 'LIMIT_MAKER', 'MARKET'],
+                'isSpotTradingAllowed': True,
+                'cancelReplaceAllowed': True,
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': formatAmount(info['tick_size']),
+                        'maxPrice': '1000000.00000000', 'tickSize': formatAmount(info['tick_size'])},
+                    {'filterType': 'LOT_SIZE', 'minQty': formatAmount(info['min_qty']),
+                        'maxQty': '9000000.00000000', 'stepSize': formatAmount(info['step_size'])},
+                    {'filterType': 'NOTIONAL', 'minNotional': formatAmount(info['min_notional']),
+                        'applyMinToMarket': True, 'maxNotional': '9000000.00000000', 'applyMaxToMarket': False,
+                        'avgPriceMins': 5}
+                ]
+            })
+        return({
+            'timezone': 'UTC',
+            'serverTime': self.now(),
+            'rateLimits': [
+                {'rateLimitType': 'REQUEST_WEIGHT', 'interval': 'MINUTE', 'intervalNum': 1, 'limit': self.weight_limit}
+            ],
+            'exchangeFilters': [],
+            'symbols': symbols
+        })
+
+    def tickerPrice(self, symbol=None, symbols=None):
+
+        with self.lock:
+            if symbol is not None:
+                return({'symbol': symbol, 'price': formatAmount(self.price(symbol))})
+            symbols = json.loads(symbols) if symbols is not None else list(self.symbols)
+            return([{'symbol': s, 'price': formatAmount(self.price(s))} for s in symbols])
+
+    def klines(self, symbol, interval='1m', limit=500) -> list:
+
+        # klines of the price path up to the current tick, one per kline_ticks ticks and
+        # ending at the current minute; every tick trades step_size
+        if interval != '1m':
+            raise SimulatorError(400, -1120, 'Invalid interval.')
+        with self.lock:
+            info = self.symbols.get(symbol)
+            if info is None:
+                raise SimulatorError(400, -1121, 'Invalid symbol.')
+            limit = min(int(limit), 1000)
+            end = self.cursor[symbol] + 1
+            start = max(0, end - limit * self.kline_ticks)
+            prices = info['prices'][start:end]
+            open_time = (self.now() // 60000 - (len(prices) - 1) // self.kline_ticks) * 60000
+            klines = []
+            for i in range(0, len(prices), self.kline_ticks):
+                chunk = prices[-(i + self.kline_ticks):len(prices) - i]
+                volume = len(chunk) * info['step_size']
+                quote_volume = float(chunk.sum()) * info['step_size']
+                klines.append([0, formatAmount(chunk[0]), formatAmount(chunk.max()), formatAmount(chunk.min()),
+                    formatAmount(chunk[-1]), formatAmount(volume), 0, formatAmount(quote_volume), len(chunk),
+                    '0', '0', '0'])
+            klines.reverse()
+            for i, kline in enumerate(klines):
+                kline[0] = open_time + i * 60000
+                kline[6] = kline[0] + 59999
+            return(klines)
+
+    def accountInfo(self, key) -> dict:
+
+        with self.lock:
+            account = self.account(key)
+            return({
+                'makerCommission': int(self.maker_commission * 10000),
+                'takerCommission': int(self.taker_commission * 10000),
+                'buyerCommission': 0,
+                'sellerCommission': 0,
+                'commissionRates': {
+                    'maker': formatAmount(self.maker_commission),
+                    'taker': formatAmount(self.taker_commission),
+                    'buyer': formatAmount(0),
+                    'seller': formatAmount(0)
+                },
+                'canTrade': True,
+                'canWithdraw': True,
+                'canDeposit': True,
+                'updateTime': account['update_time'],
+                'accountType': 'SPOT',
+                'balances': [
+                    {'asset': asset, 'free': formatAmount(balance['free']), 'locked': formatAmount(balance['locked'])}
+                    for asset, balance in account['balances'].items()
+                ],
+                'permissions': ['SPOT']
+            })
+
+    def orderResponse(self, order, fills=None) -> dict:
+
+        response = {
+            'symbol': order['symbol'],
+            'orderId': order['id'],
+            'orderListId': -1,
+            'clientOrderId': order['client_id'],
+            'transactTime': order['update_time'],
+            'price': formatAmount(order['price'] or 0),
+            'origQty': formatAmount(order['quantity']),
+            'executedQty': formatAmount(order['executed_qty']),
+            'cummulativeQuoteQty': formatAmount(order['quote_qty']),
+            'status': order['status'],
+            'timeInForce': order['time_in_force'],
+            'type': order['type'],
+            'side': order['side'],
+            'workingTime': order['time'],
+            'selfTradePreventionMode': 'NONE'
+        }
+        if fills is not None:
+            response['fills'] = fills
+        return(response)
+
+    def queryResponse(self, order) -> dict:
+
+        # order as listed by openOrders and cancel responses
+        response = self.orderResponse(order)
+        response['time'] = order['time']
+        response['updateTime'] = response.pop('transactTime')
+        response['isWorking'] = True
+        return(response)
+
+    def checkFilters(self, info, quantity, price):
+
+        if quantity < info['min_qty'] - 1e-12:
+            raise SimulatorError(400, -1013, 'Filter failure: LOT_SIZE')
+        if abs(quantity / info['step_size'] - round(quantity / info['step_size'])) > 1e-6:
+            raise SimulatorError(400, -1013, 'Filter failure: LOT_SIZE')
+        if abs(price / info['tick_size'] - round(price / info['tick_size'])) > 1e-6:
+            raise SimulatorError(400, -1013, 'Filter failure: PRICE_FILTER')
+        if quantity * price < info['min_notional'] - 1e-12:
+            raise SimulatorError(400, -1013, 'Filter failure: NOTIONAL')
+
+    def createOrder(self, key, params, test=False) -> dict:
+
+        with self.lock:
+            symbol = params.get('symbol')
+            info = self.symbols.get(symbol)
+            if info is None:
+                raise SimulatorError(400, -1121, 'Invalid symbol.')
+            side = params.get('side')
+            order_type = params.get('type')
+            if side not in ('BUY', 'SELL') or order_type not in ('MARKET', 'LIMIT', 'LIMIT_MAKER'):
+                raise SimulatorError(400, -1102, 'Mandatory parameter side or type was not sent, was empty/null, or malformed.')
+            market_price = self.price(symbol)
+
+            # quantity, or for market orders the quote order quantity
+            if 'quantity' in params:
+                quantity = float(params['quantity'])
+            elif order_type == 'MARKET' and 'quoteOrderQty' in params:
+                quantity = roundDown(float(params['quoteOrderQty']) / market_price, info['step_size'])
+            else:
+                raise SimulatorError(400, -1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+            price = float(params['price']) if order_type != 'MARKET' else None
+            self.checkFilters(info, quantity, price if price is not None else market_price)
+
+            # LIMIT_MAKER orders that would trade immediately are rejected
+            crosses = price is None or (price >= market_price if side == 'BUY' else price <= market_price)
+            if order_type == 'LIMIT_MAKER' and crosses:
+                raise SimulatorError(400, -2010, 'Order would immediately match and take.')
+
+            # the funds of the whole order must be available
+            stake = self.balance(key, info['stake_currency'])
+            trade = self.balance(key, info['trade_coin'])
+            if side == 'BUY' and stake['free'] < quantity * (price if price is not None else market_price) - 1e-12:
+                raise SimulatorError(400, -2010, 'Account has insufficient balance for requested action.')
+            if side == 'SELL' and trade['free'] < quantity - 1e-12:
+                raise SimulatorError(400, -2010, 'Account has insufficient balance for requested action.')
+            if test:
+                return({})
+
+            now = self.now()
+            order = {
+                'id': next(self.order_ids),
+                'key': key,
+                'symbol': symbol,
+                'client_id': params.get('newClientOrderId') or f'sim{secrets.token_hex(8)}',
+                'side': side,
+                'type': order_type,
+                'time_in_force': params.get('timeInForce', 'GTC'),
+                'price': price,
+                'quantity': quantity,
+                'executed_qty': 0.0,
+                'quote_qty': 0.0,
+                'status': 'NEW',
+                'time': now,
+                'update_time': now
+            }
+
+            if order_type == 'MARKET':
+                # partial_fill_ratio < 1 leaves the rest of a market order unfilled, as with thin books
+                fill_qty = quantity
+                if self.partial_fill_ratio < 1:
+                    fill_qty = max(roundDown(quantity * self.partial_fill_ratio, info['step_size']), info['step_size'])
+                fill = self.fill(order, fill_qty, market_price, maker=False, now=now)
+                order['status'] = 'FILLED' if order['executed_qty'] >= quantity - 1e-12 else 'EXPIRED'
+                self.emitExecutionReport(order, 'TRADE', fill)
+                self.emitAccountPosition(key, info)
+                return(self.orderResponse(order, [fill]))
+
+            # limit orders lock their funds, take immediately if they cross and rest otherwise
+            if side == 'BUY':
+                stake['free'] -= quantity * price
+                stake['locked'] += quantity * price
+            else:
+                trade['free'] -= quantity
+                trade['locked'] += quantity
+            self.orders[order['id']] = order
+            self.emitExecutionReport(order, 'NEW')
+            fills = []
+            if crosses:
+                fills = self.matchOrder(order, market_price, maker=False, now=now)
+            if order['status'] in ('NEW', 'PARTIALLY_FILLED'):
+                book = self.buy_book[symbol] if side == 'BUY' else self.sell_book[symbol]
+                heapq.heappush(book, (-price if side == 'BUY' else price, order['id']))
+            self.emitAccountPosition(key, info)
+            return(self.orderResponse(order, fills))
+
+    def fill(self, order, quantity, price, maker, now) -> dict:
+
+        # execute part of an order and move the balances; the commission is paid in the received asset
+        info = self.symbols[order['symbol']]
+        stake = self.balance(order['key'], info['stake_currency'])
+        trade = self.balance(order['key'], info['trade_coin'])
+        rate = self.maker_commission if maker else self.taker_commission
+        quote_qty = quantity * price
+        if order['side'] == 'BUY':
+            commission, commission_asset = quantity * rate, info['trade_coin']
+            if order['type'] == 'MARKET':
+                stake['free'] -= quote_qty
+            else:
+                # release the funds locked at the limit price
+                stake['locked'] -= quantity * order['price']
+                stake['free'] += quantity * (order['price'] - price)
+            trade['free'] += quantity - commission
+        else:
+            commission, commission_asset = quote_qty * rate, info['stake_currency']
+            if order['type'] == 'MARKET':
+                trade['free'] -= quantity
+            else:
+                trade['locked'] -= quantity
+            stake['free'] += quote_qty - commission
+        for balance in (stake, trade):
+            balance['free'] = round(balance['free'], 8)
+            balance['locked'] = round(max(balance['locked'], 0.0), 8)
+        order['executed_qty'] = round(order['executed_qty'] + quantity, 8)
+        order['quote_qty'] = round(order['quote_qty'] + quote_qty, 8)
+        order['update_time'] = now
+        self.account(order['key'])['update_time'] = now
+        return({
+            'price': formatAmount(price),
+            'qty': formatAmount(quantity),
+            'commission': formatAmount(commission),
+            'commissionAsset': commission_asset,
+            'tradeId': next(self.trade_ids),
+            'maker': maker
+        })
+
+    def matchOrder(self, order, price, maker, now) -> list:
+
+        # fill a crossed limit order, by at most partial_fill_ratio of its quantity per tick
+        info = self.symbols[order['symbol']]
+        remaining = round(order['quantity'] - order['executed_qty'], 8)
+        fill_qty = remaining
+        if self.partial_fill_ratio < 1:
+            fill_qty = min(remaining, max(roundDown(order['quantity'] * self.partial_fill_ratio, info['step_size']), info['step_size']))
+        fill_price = order['price'] if maker else price
+        fill = self.fill(order, fill_qty, fill_price, maker, now)
+        if order['executed_qty'] >= order['quantity'] - 1e-12:
+            order['status'] = 'FILLED'
+            del self.orders[order['id']]
+        else:
+            order['status'] = 'PARTIALLY_FILLED'
+        self.emitExecutionReport(order, 'TRADE', fill)
+        return([fill])
+
+    def matchOrders(self, symbol, price, now):
+
+        # resting orders crossed by the new price fill at their limit price, as makers
+        info = self.symbols[symbol]
+        touched = set()
+        for book, crossed in ((self.buy_book[symbol], lambda key: -key >= price), (self.sell_book[symbol], lambda key: key <= price)):
+            partial = []
+            while book and crossed(book[0][0]):
+                entry = heapq.heappop(book)
+                order = self.orders.get(entry[1])
+                if order is None:
+                    continue # cancelled or filled
+                self.matchOrder(order, price, maker=True, now=now)
+                touched.add(order['key'])
+                if order['status'] == 'PARTIALLY_FILLED':
+                    partial.append(entry)
+            for entry in partial:
+                heapq.heappush(book, entry)
+        for key in touched:
+            self.emitAccountPosition(key, info)
+
+    def findOrder(self, key, symbol, order_id=None, client_id=None) -> dict:
+
+        # open order of the account, by order id or client order id
+        order = self.orders.get(order_id)
+        if order is None and client_id is not None:
+            order = next((order for order in self.orders.values() if order['client_id'] == client_id and order['key'] == key), None)
+        if order is None or order['key'] != key or order['symbol'] != symbol:
+            raise SimulatorError(400, -2011, 'Unknown order sent.')
+        return(order)
+
+    def cancelOrder(self, key, params) -> dict:
+
+        with self.lock:
+            order_id = int(params['orderId']) if 'orderId' in params else None
+            order = self.findOrder(key, params.get('symbol'), order_id, params.get('origClientOrderId'))
+            self.cancel(order)
+            self.emitAccountPosition(key, self.symbols[order['symbol']])
+            response = self.queryResponse(order)
+            response['origClientOrderId'] = order['client_id']
+            return(response)
+
+    def cancel(self, order):
+
+        # release the locked funds; the heap entry is dropped lazily by matchOrders
+        info = self.symbols[order['symbol']]
+        remaining = round(order['quantity'] - order['executed_qty'], 8)
+        if order['side'] == 'BUY':
+            balance = self.balance(order['key'], info['stake_currency'])
+            amount = remaining * order['price']
+        else:
+            balance = self.balance(order['key'], info['trade_coin'])
+            amount = remaining
+        balance['free'] = round(balance['free'] + amount, 8)
+        balance['locked'] = round(max(balance['locked'] - amount, 0.0), 8)
+        order['status'] = 'CANCELED'
+        order['update_time'] = self.now()
+        self.account(order['key'])['update_time'] = order['update_time']
+        del self.orders[order['id']]
+        self.emitExecutionReport(order, 'CANCELED')
+
+    def openOrders(self, key, symbol=None) -> list:
+
+        with self.lock:
+            return([
+                self.queryResponse(order) for order in self.orders.values()
+                if order['key'] == key and (symbol is None or order['symbol'] == symbol)
+            ])
+
+    def cancelReplace(self, key, params) -> dict:
+
+        # cancel an order and place a new one; with STOP_ON_FAILURE nothing is placed if the cancel fails
+        with self.lock:
+            order_id = int(params['cancelOrderId']) if 'cancelOrderId' in params else None
+            try:
+                order = self.findOrder(key, params.get('symbol'), order_id, params.get('cancelOrigClientOrderId'))
+                self.cancel(order)
+                cancel_response = self.queryResponse(order)
+                cancel_result = 'SUCCESS'
+            except SimulatorError as e:
+                cancel_response = e.body()
+                cancel_result = 'FAILURE'
+            if cancel_result == 'FAILURE' and params.get('cancelReplaceMode', 'STOP_ON_FAILURE') == 'STOP_ON_FAILURE':
+                error = SimulatorError(400, -2022, 'Order cancel-replace failed.')
+                error.data = {
+                    'cancelResult': 'FAILURE',
+                    'newOrderResult': 'NOT_ATTEMPTED',
+                    'cancelResponse': cancel_response,
+                    'newOrderResponse': None
+                }
+                raise error
+            new_params = {name: value for name, value in params.items() if not name.startswith('cancel')}
+            try:
+                new_order = self.createOrder(key, new_params)
+                new_result = 'SUCCESS'
+            except SimulatorError as e:
+                new_order = e.body()
+                new_result = 'FAILURE'
+            return({
+                'cancelResult': cancel_result,
+                'newOrderResult': new_result,
+                'cancelResponse': cancel_response,
+                'newOrderResponse': new_order
+            })
+
+    def emitExecutionReport(self, order, execution_type, fill=None):
+
+        if not self.user_callbacks:
+            return
+        msg = {
+            'e': 'executionReport',
+            'E': self.now(),
+            's': order['symbol'],
+            'c': order['client_id'],
+            'S': order['side'],
+            'o': order['type'],
+            'f': order['time_in_force'],
+            'q': formatAmount(order['quantity']),
+            'p': formatAmount(order['price'] or 0),
+            'x': execution_type,
+            'X': order['status'],
+            'r': 'NONE',
+            'i': order['id'],
+            'l': fill['qty'] if fill else formatAmount(0),
+            'z': formatAmount(order['executed_qty']),
+            'L': fill['price'] if fill else formatAmount(0),
+            'n': fill['commission'] if fill else formatAmount(0),
+            'N': fill['commissionAsset'] if fill else None,
+            'T': order['update_time'],
+            't': fill['tradeId'] if fill else -1,
+            'w': order['status'] in ('NEW', 'PARTIALLY_FILLED'),
+            'm': fill['maker'] if fill else False,
+            'O': order['time'],
+            'Z': formatAmount(order['quote_qty']),
+            'Y': formatAmount(float(fill['price']) * float(fill['qty'])) if fill else formatAmount(0),
+            'Q': formatAmount(0)
+        }
+        for callback in self.user_callbacks:
+            callback(order['key'], msg)
+
+    def emitAccountPosition(self, key, info):
+
+        if not self.user_callbacks:
+            return
+        account = self.account(key)
+        msg = {
+            'e': 'outboundAccountPosition',
+            'E': self.now(),
+            'u': account['update_time'],
+            'B': [
+                {'a': asset, 'f': formatAmount(account['balances'][asset]['free']), 'l': formatAmount(account['balances'][asset]['locked'])}
+                for asset in (info['trade_coin'], info['stake_currency']) if asset in account['balances']
+            ]
+        }
+        for callback in self.user_callbacks:
+            callback(key, msg)
+
+class SimulatedClient:
+
+    # in-process replacement for the binance Client methods used by the bot, without HTTP;
+    # errors are raised as BinanceAPIException
+    def __init__(self, exchange, api_key='simulated', client=None):
+
+        self.exchange = exchange
+        self.api_key = api_key
+        self.client = client if client is not None else api_key # rate-limit identity, like the IP address
+
+    def call(self, weight, function, *args):
+
+        try:
+            self.exchange.chargeWeight(self.client, weight)
+            return(function(*args))
+        except SimulatorError as e:
+            from binance.exceptions import BinanceAPIException
+            raise BinanceAPIException(None, e.status, json.dumps(e.body()))
+
+    def ping(self) -> dict:
+
+        return(self.call(1, dict))
+
+    def get_server_time(self) -> dict:
+
+        return(self.call(1, lambda: {'serverTime': self.exchange.now()}))
+
+    def get_exchange_info(self) -> dict:
+
+        return(self.call(20, self.exchange.exchangeInfo))
+
+    def get_symbol_ticker(self, symbol=None):
+
+        return(self.call(2 if symbol is not None else 4, self.exchange.tickerPrice, symbol))
+
+    def get_klines(self, **params) -> list:
+
+        return(self.call(2, self.exchange.klines, params.get('symbol'), params.get('interval', '1m'), params.get('limit', 500)))
+
+    def get_account(self, **params) -> dict:
+
+        return(self.call(20, self.exchange.accountInfo, self.api_key))
+
+    def create_order(self, **params) -> dict:
+
+        return(self.call(1, self.exchange.createOrder, self.api_key, params))
+
+    def create_test_order(self, **params) -> dict:
+
+        return(self.call(1, self.exchange.createOrder, self.api_key, params, True))
+
+    def get_open_orders(self, **params) -> list:
+
+        return(self.call(6 if 'symbol' in params else 80, self.exchange.openOrders, self.api_key, params.get('symbol')))
+
+    def cancel_order(self, **params) -> dict:
+
+        return(self.call(1, self.exchange.cancelOrder, self.api_key, params))
+
+    def cancel_replace_order(self, **params) -> dict:
+
+        return(self.call(1, self.exchange.cancelReplace, self.api_key, params))
+
+    def close_connection(self):
+
+        pass
+
+class SimulatedResponse:
+
+    def __init__(self, status_code, data, headers):
+
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers
+
+    def json(self):
+
+        return(self.data)
+
+    def raise_for_status(self):
+
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f'{self.status_code}: {self.data}', response=self)
+
+class SimulatedSession:
+
+    # in-process replacement for the requests.Session used for price and klines requests
+    def __init__(self, exchange, client='simulated'):
+
+        self.exchange = exchange
+        self.client = client
+
+    def get(self, url, **kwargs) -> SimulatedResponse:
+
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+        params.update(kwargs.get('params') or {})
+        try:
+            if urllib.parse.urlsplit(url).path.endswith('/klines'):
+                used = self.exchange.chargeWeight(self.client, 2)
+                data = self.exchange.klines(params.get('symbol'), params.get('interval', '1m'), params.get('limit', 500))
+            else:
+                used = self.exchange.chargeWeight(self.client, 2 if 'symbol' in params else 4)
+                data = self.exchange.tickerPrice(params.get('symbol'), params.get('symbols'))
+            return(SimulatedResponse(200, data, {'X-MBX-USED-WEIGHT-1M': str(used)}))
+        except SimulatorError as e:
+            headers = {'X-MBX-USED-WEIGHT-1M': str(self.exchange.usedWeight(self.client))}
+            if e.retry_after is not None:
+                headers['Retry-After'] = str(e.retry_after)
+            return(SimulatedResponse(e.status, e.body(), headers))
+
+class WebsocketConnection:
+
+    def __init__(self, reader, writer, combined, max_queue=10000):
+
+        self.reader = reader
+        self.writer = writer
+        self.combined = combined # messages wrapped as {"stream": ..., "data": ...}
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def send(self, frame):
+
+        # a client that does not keep up is disconnected, as the exchange does
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.close()
+
+    def close(self):
+
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+    @staticmethod
+    def frame(payload, opcode=0x1) -> bytes:
+
+        # unmasked server frame
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        return(header + payload)
+
+    async def readFrame(self):
+
+        header = await self.reader.readexactly(2)
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+        mask = await self.reader.readexactly(4) if header[1] & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask is not None:
+            payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        return(opcode, payload)
+
+    async def writeLoop(self):
+
+        while True:
+            frame = await self.queue.get()
+            if frame is None or self.closed:
+                return
+            self.writer.write(frame)
+            await self.writer.drain()
+
+class SimulatorServer:
+
+    def __init__(self, exchange, host='127.0.0.1', port=8765, tick_interval=0.1, latency=0.0, jitter=0.0, seed=0):
+
+        self.exchange = exchange
+        self.host = host
+        self.port = port
+        self.tick_interval = tick_interval # seconds between price ticks
+        self.latency = latency # seconds added to every REST response
+        self.jitter = jitter # random extra latency, up to this many seconds
+        self.rng = np.random.default_rng(seed)
+        self.loop = None
+
+        self.streams = {} # stream name -> connections subscribed to it
+        self.listen_keys = {} # listen key -> API key
+        self.user_connections = {} # API key -> user-data connections
+        self.exchange.market_callbacks.append(self.onTick)
+        self.exchange.user_callbacks.append(self.onUserEvent)
+
+        # (method, path) -> (handler, request weight)
+        self.routes = {
+            ('GET', '/api/v3/ping'): (lambda key, params: {}, 1),
+            ('GET', '/api/v3/time'): (lambda key, params: {'serverTime': self.exchange.now()}, 1),
+            ('GET', '/api/v3/exchangeInfo'): (lambda key, params: self.exchange.exchangeInfo(), 20),
+            ('GET', '/api/v3/ticker/price'): (lambda key, params: self.exchange.tickerPrice(params.get('symbol'), params.get('symbols')), 2),
+            ('GET', '/api/v3/klines'): (lambda key, params: self.exchange.klines(params.get('symbol'), params.get('interval', '1m'), params.get('limit', 500)), 2),
+            ('GET', '/api/v3/account'): (lambda key, params: self.exchange.accountInfo(self.requireKey(key)), 20),
+            ('POST', '/api/v3/order'): (lambda key, params: self.exchange.createOrder(self.requireKey(key), params), 1),
+            ('POST', '/api/v3/order/test'): (lambda key, params: self.exchange.createOrder(self.requireKey(key), params, True), 1),
+            ('DELETE', '/api/v3/order'): (lambda key, params: self.exchange.cancelOrder(self.requireKey(key), params), 1),
+            ('GET', '/api/v3/openOrders'): (lambda key, params: self.exchange.openOrders(self.requireKey(key), params.get('symbol')), 6),
+            ('POST', '/api/v3/order/cancelReplace'): (lambda key, params: self.exchange.cancelReplace(self.requireKey(key), params), 1),
+            ('POST', '/api/v3/userDataStream'): (lambda key, params: self.newListenKey(self.requireKey(key)), 2),
+            ('PUT', '/api/v3/userDataStream'): (lambda key, params: {}, 2),
+            ('DELETE', '/api/v3/userDataStream'): (lambda key, params: self.closeListenKey(params.get('listenKey')), 2)
+        }
+
+    def requireKey(self, key) -> str:
+
+        if not key:
+            raise SimulatorError(401, -2014, 'API-key format invalid.')
+        return(key)
+
+    def newListenKey(self, key) -> dict:
+
+        listen_key = secrets.token_hex(32)
+        self.listen_keys[listen_key] = key
+        return({'listenKey': listen_key})
+
+    def closeListenKey(self, listen_key) -> dict:
+
+        self.listen_keys.pop(listen_key, None)
+        return({})
+
+    def onTick(self, symbol, price, qty, event_time):
+
+        # serialize each stream message once, for all its subscribers
+        for stream_type in ('trade', 'bookTicker'):
+            stream = f'{symbol.lower()}@{stream_type}'
+            connections = self.streams.get(stream)
+            if not connections:
+                continue
+            if stream_type == 'trade':
+                data = {'e': 'trade', 'E': event_time, 's': symbol, 't': next(self.exchange.trade_ids), 'p': formatAmount(price),
+                    'q': formatAmount(qty), 'T': event_time, 'm': False, 'M': True}
+            else:
+                tick_size = self.exchange.symbols[symbol]['tick_size']
+                data = {'u': event_time, 's': symbol, 'b': formatAmount(price - tick_size / 2), 'B': formatAmount(qty),
+                    'a': formatAmount(price + tick_size / 2), 'A': formatAmount(qty)}
+            frames = {}
+            for connection in list(connections):
+                if connection.combined not in frames:
+                    message = {'stream': stream, 'data': data} if connection.combined else data
+                    frames[connection.combined] = WebsocketConnection.frame(json.dumps(message).encode())
+                connection.send(frames[connection.combined])
+
+    def onUserEvent(self, key, msg):
+
+        connections = self.user_connections.get(key)
+        if not connections:
+            return
+        frame = WebsocketConnection.frame(json.dumps(msg).encode())
+        for connection in list(connections):
+            connection.send(frame)
+
+    async def readRequest(self, reader):
+
+        request_line = await reader.readline()
+        if not request_line:
+            return(None)
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        body = b''
+        if 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        return(method, target, headers, body)
+
+    async def handleConnection(self, reader, writer):
+
+        # HTTP/1.1 with keep-alive, upgraded to a websocket on request
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else 'local'
+        try:
+            while True:
+                request = await self.readRequest(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self.handleWebsocket(reader, writer, target, headers)
+                    return
+                status, response_headers, response_body = await self.handleRest(client, method, target, headers, body)
+                lines = [f'HTTP/1.1 {status} {HTTP_REASONS.get(status, "")}']
+                response_headers['Content-Type'] = 'application/json;charset=UTF-8'
+                response_headers['Content-Length'] = str(len(response_body))
+                lines += [f'{name}: {value}' for name, value in response_headers.items()]
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + response_body)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handleRest(self, client, method, target, headers, body):
+
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if body and 'json' not in headers.get('content-type', ''):
+            params.update(urllib.parse.parse_qsl(body.decode()))
+        key = headers.get('x-mbx-apikey')
+        response_headers = {}
+        if self.latency > 0 or self.jitter > 0:
+            await asyncio.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        try:
+            route = self.routes.get((method, url.path))
+            if route is None:
+                raise SimulatorError(404, -1, f'{method} {url.path} is not simulated.')
+            handler, weight = route
+            if url.path == '/api/v3/ticker/price' and 'symbol' not in params:
+                weight = 4
+            used = self.exchange.chargeWeight(client, weight)
+            response_headers['X-MBX-USED-WEIGHT-1M'] = str(used)
+            status, data = 200, handler(key, params)
+        except SimulatorError as e:
+            response_headers['X-MBX-USED-WEIGHT-1M'] = str(self.exchange.usedWeight(client))
+            if e.retry_after is not None:
+                response_headers['Retry-After'] = str(e.retry_after)
+            status, data = e.status, e.body()
+            if getattr(e, 'data', None) is not None:
+                data['data'] = e.data
+        return(status, response_headers, json.dumps(data).encode())
+
+    async def handleWebsocket(self, reader, writer, target, headers):
+
+        # /ws/<stream or listen key> and /stream?streams=<stream>/<stream>
+        url = urllib.parse.urlsplit(target)
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+        ).encode())
+        await writer.drain()
+
+        connection = WebsocketConnection(reader, writer, combined=url.path.startswith('/stream'))
+        user_key = None
+        streams = []
+        if connection.combined:
+            streams = urllib.parse.parse_qs(url.query).get('streams', [''])[0].split('/')
+        else:
+            name = url.path[len('/ws/'):]
+            if name in self.listen_keys:
+                user_key = self.listen_keys[name]
+                self.user_connections.setdefault(user_key, set()).add(connection)
+            elif name:
+                streams = [name]
+        for stream in streams:
+            self.streams.setdefault(stream, set()).add(connection)
+
+        write_task = asyncio.ensure_future(connection.writeLoop())
+        try:
+            while not connection.closed:
+                opcode, payload = await connection.readFrame()
+                if opcode == 0x8:
+                    connection.send(WebsocketConnection.frame(payload[:2], opcode=0x8))
+                    break
+                elif opcode == 0x9:
+                    connection.send(WebsocketConnection.frame(payload, opcode=0xA))
+                elif opcode == 0x1:
+                    # live SUBSCRIBE / UNSUBSCRIBE requests
+                    request = json.loads(payload)
+                    for stream in request.get('params', []):
+                        if request.get('method') == 'SUBSCRIBE':
+                            self.streams.setdefault(stream, set()).add(connection)
+                        elif request.get('method') == 'UNSUBSCRIBE':
+                            self.streams.get(stream, set()).discard(connection)
+                    connection.send(WebsocketConnection.frame(json.dumps({'result': None, 'id': request.get('id')}).encode()))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            for connections in self.streams.values():
+                connections.discard(connection)
+            if user_key is not None:
+                self.user_connections[user_key].discard(connection)
+            # send what is queued, including the close frame, then hang up
+            connection.send(None)
+            try:
+                await asyncio.wait_for(write_task, timeout=5)
+            except Exception:
+                pass
+            connection.close()
+
+    async def tickLoop(self):
+
+        while self.exchange.step():
+            await asyncio.sleep(self.tick_interval)
+
+        # log
+        local_time = datetime.datetime.now()
+        print(f'[{local_time}]: price paths ended; prices are frozen')
+
+    async def serve(self):
+
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handleConnection, self.host, self.port, limit=1 << 20, backlog=4096)
+
+        # log
+        local_time = datetime.datetime.now()
+        print('---')
+        print(f'[{local_time}]: simulated exchange listening at http://{self.host}:{self.port} (websockets at ws://{self.host}:{self.port}/ws/)')
+        print(f'[{local_time}]: symbols: {", ".join(self.exchange.symbols)} | tick interval: {self.tick_interval} s | latency: {self.latency} s (+{self.jitter} s)')
+
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.tickLoop())
+
+def readScenario(scenario_file) -> dict:
+
+    with open(scenario_file) as scenario_fh:
+        return(json.load(scenario_fh))
+
+def createExchange(scenario) -> Exchange:
+
+    return(Exchange(
+        scenario['symbols'],
+        scenario.get('balances', {}),
+        maker_commission=scenario.get('maker_commission', 0.001),
+        taker_commission=scenario.get('taker_commission', 0.001),
+        partial_fill_ratio=scenario.get('partial_fill_ratio', 1.0),
+        rate_limit_error_rate=scenario.get('rate_limit_error_rate', 0.0),
+        weight_limit=scenario.get('weight_limit', 1200),
+        loop=scenario.get('loop', True),
+        seed=scenario.get('seed', 0)
+    ))
+
+def parseArgs():
+
+    # ./simulator.py --scenario scenario.example.json --port 8765
+    parser = ap.ArgumentParser(description='Simulated Binance spot exchange for the grid bot')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '--scenario', metavar='FILE', type=str,
+        help='JSON file with the symbols, their price paths, the starting balances and the injected faults',
+        required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument('--host', type=str, default='127.0.0.1')
+    optional.add_argument('--port', type=int, default=8765)
+    optional.add_argument('--tick_interval', type=float, default=None, help='seconds between price ticks')
+    optional.add_argument('--latency', type=float, default=None, help='seconds added to every REST response')
+    optional.add_argument('--jitter', type=float, default=None, help='random extra latency, up to this many seconds')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    args = parseArgs()
+    scenario = readScenario(args.scenario)
+    for name in ('tick_interval', 'latency', 'jitter'):
+        if getattr(args, name) is not None:
+            scenario[name] = getattr(args, name)
+    server = SimulatorServer(
+        createExchange(scenario),
+        host=args.host,
+        port=args.port,
+        tick_interval=scenario.get('tick_interval', 0.1),
+        latency=scenario.get('latency', 0.0),
+        jitter=scenario.get('jitter', 0.0),
+        seed=scenario.get('seed', 0)
+    )
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
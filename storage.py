@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+
+# storage.py
+
+# SQLite persistence of the wallet history, the order journal and the grid state
+
+import atexit
+import datetime
+import json
+import queue
+import sqlite3
+import threading
+import time
+import numpy as np
+from eventlog import eventlog
+
+# schema version stored in PRAGMA user_version
+SCHEMA_VERSION = 2
+
+# rollup tables and their bucket width in milliseconds
+ROLLUPS = {
+    'wallet_1m': 60 * 1000,
+    'wallet_1h': 60 * 60 * 1000,
+    'wallet_1d': 24 * 60 * 60 * 1000
+}
+
+def rollupTrigger(table, width) -> str:
+
+    # keep the OHLC price and the last balances of each bucket current on every insert;
+    # max() and min() return NULL with a NULL argument, hence the COALESCE
+    return(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON wallet
+        BEGIN
+            INSERT INTO {table} (
+                symbol, bucket, first_ts, last_ts, open, high, low, close,
+                stake_balance, trade_balance, n
+            ) VALUES (
+                NEW.symbol, NEW.ts / {width} * {width}, NEW.ts, NEW.ts, NEW.price, NEW.price, NEW.price, NEW.price,
+                NEW.stake_balance, NEW.trade_balance, 1
+            )
+            ON CONFLICT (symbol, bucket) DO UPDATE SET
+                open = CASE WHEN excluded.first_ts < first_ts OR open IS NULL THEN COALESCE(excluded.open, open) ELSE open END,
+                first_ts = min(first_ts, excluded.first_ts),
+                high = max(COALESCE(high, excluded.high), COALESCE(excluded.high, high)),
+                low = min(COALESCE(low, excluded.low), COALESCE(excluded.low, low)),
+                close = CASE WHEN excluded.last_ts >= last_ts THEN COALESCE(excluded.close, close) ELSE close END,
+                stake_balance = CASE WHEN excluded.last_ts >= last_ts THEN excluded.stake_balance ELSE stake_balance END,
+                trade_balance = CASE WHEN excluded.last_ts >= last_ts THEN excluded.trade_balance ELSE trade_balance END,
+                last_ts = max(last_ts, excluded.last_ts),
+                n = n + 1;
+        END''')
+
+def legacyWalletTables(cnx) -> dict:
+
+    # tables written by pandas.DataFrame.to_sql before schema version 1: named after their symbol,
+    # with the stake currency, trade coin and {symbol}_price columns, in this order
+    legacy = {}
+    tables = [row[0] for row in cnx.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table in tables:
+        columns = [row[1] for row in cnx.execute(f'PRAGMA table_info("{table}")')]
+        price_column = f'{table}_price'
+        if price_column not in columns:
+            continue
+        currencies = [column for column in columns if column not in ('index', 'local_time', price_column)]
+        legacy[table] = {'stake_currency': currencies[0], 'trade_coin': currencies[1]}
+    return(legacy)
+
+def migrate(cnx):
+
+    # bring the database to SCHEMA_VERSION; safe to call from several connections
+    if cnx.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
+    cnx.execute('BEGIN IMMEDIATE')
+    try:
+        version = cnx.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            migrateToVersion1(cnx)
+        if version < 2:
+            migrateToVersion2(cnx)
+        cnx.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        cnx.execute('COMMIT')
+    except:
+        cnx.execute('ROLLBACK')
+        raise
+
+def migrateToVersion1(cnx):
+
+    # one wallet table for all the symbols, with epoch millisecond timestamps
+    cnx.execute('''
+        CREATE TABLE IF NOT EXISTS symbols (
+            symbol TEXT PRIMARY KEY,
+            trade_coin TEXT NOT NULL,
+            stake_currency TEXT NOT NULL
+        )''')
+    cnx.execute('''
+        CREATE TABLE IF NOT EXISTS wallet (
+            id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            stake_balance REAL,
+            trade_balance REAL,
+            price REAL
+        )''')
+    cnx.execute('CREATE INDEX IF NOT EXISTS wallet_symbol_ts ON wallet (symbol, ts)')
+    cnx.execute('CREATE INDEX IF NOT EXISTS wallet_symbol_id ON wallet (symbol, id)')
+    for table, width in ROLLUPS.items():
+        cnx.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                symbol TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                first_ts INTEGER NOT NULL,
+                last_ts INTEGER NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                stake_balance REAL,
+                trade_balance REAL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (symbol, bucket)
+            ) WITHOUT ROWID''')
+
+    # copy the legacy per-symbol tables, whose local_time is local time text, then keep them
+    # under another name; the rollups of the copied rows are computed in bulk
+    legacy = legacyWalletTables(cnx)
+    for table, currencies in legacy.items():
+        cnx.execute(
+            'INSERT OR REPLACE INTO symbols (symbol, trade_coin, stake_currency) VALUES (?, ?, ?)',
+            (table, currencies['trade_coin'], currencies['stake_currency'])
+        )
+        cnx.execute(f'''
+            INSERT INTO wallet (symbol, ts, stake_balance, trade_balance, price)
+            SELECT
+                ?,
+                CAST(ROUND((julianday(local_time, 'utc') - 2440587.5) * 86400000) AS INTEGER),
+                "{currencies['stake_currency']}",
+                "{currencies['trade_coin']}",
+                "{table}_price"
+            FROM "{table}"
+            ORDER BY rowid''', (table,))
+        cnx.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_legacy"')
+    for symbol in legacy:
+        rebuildRollups(cnx, symbol)
+    for table, width in ROLLUPS.items():
+        cnx.execute(rollupTrigger(table, width))
+
+def migrateToVersion2(cnx):
+
+    # expected net pnl of the position opened or closed by a journaled order
+    if cnx.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal'").fetchone() is not None:
+        cnx.execute('ALTER TABLE journal ADD COLUMN expected_pnl REAL')
+
+def rebuildRollups(cnx, symbol, start_ts=0):
+
+    # recompute the rollup buckets of a symbol from start_ts on, with the same open/close/last
+    # balance rules as the triggers; one read of the rows in time order, aggregated with numpy
+    bucket_start = start_ts // max(ROLLUPS.values()) * max(ROLLUPS.values())
+    rows = cnx.execute(
+        'SELECT ts, price, stake_balance, trade_balance FROM wallet WHERE symbol = ? AND ts >= ? ORDER BY ts, id',
+        (symbol, bucket_start)
+    ).fetchall()
+    for table in ROLLUPS:
+        cnx.execute(f'DELETE FROM {table} WHERE symbol = ? AND bucket >= ?', (symbol, bucket_start))
+    if not rows:
+        return
+    ts, price, stake_balance, trade_balance = (np.array(column, dtype=float) for column in zip(*rows))
+    ts = ts.astype(np.int64)
+    valid = np.flatnonzero(~np.isnan(price))
+
+    def nullable(values):
+        return([None if np.isnan(value) else float(value) for value in values])
+
+    for table, width in ROLLUPS.items():
+        bucket = ts // width * width
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(bucket)) + 1])
+        ends = np.append(starts[1:], len(ts))
+
+        # first and last non-null price of each bucket
+        first = np.searchsorted(valid, starts)
+        has_open = first < len(valid)
+        has_open[has_open] = valid[first[has_open]] < ends[has_open]
+        last = np.searchsorted(valid, ends) - 1
+        has_close = last >= 0
+        has_close[has_close] = valid[last[has_close]] >= starts[has_close]
+        open_ = np.full(len(starts), np.nan)
+        open_[has_open] = price[valid[first[has_open]]]
+        close = np.full(len(starts), np.nan)
+        close[has_close] = price[valid[last[has_close]]]
+        with np.errstate(invalid='ignore'):
+            high = np.fmax.reduceat(price, starts)
+            low = np.fmin.reduceat(price, starts)
+
+        cnx.executemany(
+            f'''INSERT INTO {table} (
+                symbol, bucket, first_ts, last_ts, open, high, low, close,
+                stake_balance, trade_balance, n
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            zip(
+                [symbol] * len(starts), bucket[starts].tolist(), ts[starts].tolist(), ts[ends - 1].tolist(),
+                nullable(open_), nullable(high), nullable(low), nullable(close),
+                nullable(stake_balance[ends - 1]), nullable(trade_balance[ends - 1]), (ends - starts).tolist()
+            )
+        )
+
+def bulkInsertWallet(cnx, rows):
+
+    # insert many (symbol, ts, stake_balance, trade_balance, price) rows, e.g. imported history,
+    # without the per-row cost of the rollup triggers
+    rows = list(rows)
+    if not rows:
+        return
+    starts = {}
+    for row in rows:
+        starts[row[0]] = min(starts.get(row[0], row[1]), row[1])
+    cnx.execute('BEGIN IMMEDIATE')
+    try:
+        for table in ROLLUPS:
+            cnx.execute(f'DROP TRIGGER IF EXISTS {table}_insert')
+        cnx.executemany(
+            'INSERT INTO wallet (symbol, ts, stake_balance, trade_balance, price) VALUES (?, ?, ?, ?, ?)', rows
+        )
+        for symbol, start_ts in starts.items():
+            rebuildRollups(cnx, symbol, start_ts)
+        for table, width in ROLLUPS.items():
+            cnx.execute(rollupTrigger(table, width))
+        cnx.execute('COMMIT')
+    except:
+        cnx.execute('ROLLBACK')
+        raise
+
+def queryRollup(cnx, symbol, resolution='1h', start_ts=None, end_ts=None) -> list:
+
+    # rows of a rollup table ('1m', '1h' or '1d') between two epoch millisecond timestamps
+    return(cnx.execute(
+        f'''SELECT bucket, open, high, low, close, stake_balance, trade_balance, n
+        FROM wallet_{resolution}
+        WHERE symbol = ? AND bucket >= ? AND bucket <= ?
+        ORDER BY bucket''',
+        (symbol, start_ts if start_ts is not None else 0, end_ts if end_ts is not None else 2 ** 62)
+    ).fetchall())
+
+def connect(db_file, synchronous='NORMAL', check_same_thread=True) -> sqlite3.Connection:
+
+    # connection in autocommit mode to a database migrated to the current schema
+    cnx = sqlite3.connect(db_file, isolation_level=None, check_same_thread=check_same_thread)
+    cnx.execute('PRAGMA journal_mode=WAL')
+    cnx.execute(f'PRAGMA synchronous={synchronous}')
+    migrate(cnx)
+    return(cnx)
+
+class WalletWriter:
+
+    def __init__(self, db_file, flush_interval=1.0, max_queue=10000, put_timeout=0.1):
+
+        self.db_file = db_file
+        self.flush_interval = flush_interval # seconds between batched commits
+        self.put_timeout = put_timeout # seconds to wait for room in a full queue before dropping a row
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = None
+        self.tables = set() # tables known to exist
+        self.closed = False
+
+    def start(self):
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+
+    def write(self, table, columns, row, replace=False):
+
+        # enqueue a row; the order path never waits on the database
+        try:
+            self.queue.put((table, tuple(columns), tuple(row), replace), timeout=self.put_timeout)
+        except queue.Full:
+            eventlog.emit('error', None, [f'database write queue full; dropping row for table {table}'], table=table)
+
+    def writeWallet(self, symbol, ts, stake_balance, trade_balance, price):
+
+        self.write(
+            'wallet',
+            ['symbol', 'ts', 'stake_balance', 'trade_balance', 'price'],
+            [symbol, ts, stake_balance, trade_balance, price]
+        )
+
+    def registerSymbol(self, symbol, trade_coin, stake_currency):
+
+        self.write(
+            'symbols',
+            ['symbol', 'trade_coin', 'stake_currency'],
+            [symbol, trade_coin, stake_currency],
+            replace=True
+        )
+
+    def close(self):
+
+        # flush pending rows and stop the writer thread
+        if self.closed or self.thread is None:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def connect(self) -> sqlite3.Connection:
+
+        cnx = connect(self.db_file)
+        self.tables = {row[0] for row in cnx.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return(cnx)
+
+    def columnType(self, column, value) -> str:
+
+        # same layout as the tables written by pandas.DataFrame.to_sql
+        if column in ('index', 'local_time'):
+            return('TIMESTAMP')
+        if isinstance(value, str):
+            return('TEXT')
+        return('REAL')
+
+    def createTable(self, cnx, table, columns, row):
+
+        column_types = ', '.join(f'"{column}" {self.columnType(column, value)}' for column, value in zip(columns, row))
+        cnx.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({column_types})')
+        self.tables.add(table)
+
+    def flush(self, cnx, batch):
+
+        # one prepared statement per table and column layout, in a single transaction
+        groups = {}
+        for table, columns, row, replace in batch:
+            groups.setdefault((table, columns, replace), []).append(row)
+        cnx.execute('BEGIN')
+        try:
+            for (table, columns, replace), rows in groups.items():
+                if table not in self.tables:
+                    self.createTable(cnx, table, columns, rows[0])
+                column_names = ', '.join(f'"{column}"' for column in columns)
+                placeholders = ', '.join('?' for column in columns)
+                verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+                cnx.executemany(f'{verb} INTO "{table}" ({column_names}) VALUES ({placeholders})', rows)
+            cnx.execute('COMMIT')
+        except:
+            cnx.execute('ROLLBACK')
+            raise
+
+    def run(self):
+
+        cnx = self.connect()
+        stop = False
+        while not stop:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.flush(cnx, batch)
+                except Exception as e:
+                    eventlog.emit(
+                        'error', None,
+                        [f'cannot write {len(batch)} rows to {self.db_file}; the error message is displayed below:', str(e)],
+                        db_file=self.db_file, n_rows=len(batch), message=str(e)
+                    )
+        cnx.close()
+
+class Journal:
+
+    def __init__(self, db_file, snapshot_every=100):
+
+        self.db_file = db_file
+        self.snapshot_every = snapshot_every # journal entries per symbol between state snapshots
+        self.entries_since_snapshot = {} # symbol -> number of entries not covered by a snapshot
+        self.lock = threading.Lock()
+
+        # orders are rare, so every entry is committed before the bot moves on
+        self.cnx = connect(db_file, synchronous='FULL', check_same_thread=False)
+        with self.cnx:
+            self.cnx.execute('''
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    symbol TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    grid_price REAL,
+                    amount REAL,
+                    order_id INTEGER,
+                    client_order_id TEXT,
+                    status TEXT,
+                    transact_time INTEGER,
+                    executed_qty REAL,
+                    quote_qty REAL,
+                    fill_price REAL,
+                    commission TEXT,
+                    local_time TIMESTAMP,
+                    expected_pnl REAL
+                )''')
+            self.cnx.execute('CREATE INDEX IF NOT EXISTS journal_symbol_id ON journal (symbol, id)')
+            self.cnx.execute('''
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    symbol TEXT PRIMARY KEY,
+                    journal_id INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    local_time TIMESTAMP
+                )''')
+
+    def record(self, symbol, event, grid_price, amount=None, fills=None, expected_pnl=None) -> bool:
+
+        # append an event and its fill details; returns True when a snapshot is due
+        fills = fills if fills is not None else {}
+        commission = fills.get('commission')
+        with self.lock, self.cnx:
+            self.cnx.execute(
+                '''INSERT INTO journal (
+                    symbol, event, grid_price, amount, order_id, client_order_id, status,
+                    transact_time, executed_qty, quote_qty, fill_price, commission, local_time, expected_pnl
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (
+                    symbol, event, grid_price, amount,
+                    fills.get('order_id'), fills.get('client_order_id'), fills.get('status'),
+                    fills.get('transact_time'), fills.get('executed_qty'), fills.get('quote_qty'),
+                    fills.get('fill_price'), json.dumps(commission) if commission else None,
+                    str(datetime.datetime.now()), expected_pnl
+                )
+            )
+            self.entries_since_snapshot[symbol] = self.entries_since_snapshot.get(symbol, 0) + 1
+            return(self.entries_since_snapshot[symbol] >= self.snapshot_every)
+
+    def snapshot(self, symbol, state):
+
+        # save the grid state as of the last journal entry of the symbol
+        with self.lock, self.cnx:
+            journal_id = self.cnx.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM journal WHERE symbol = ?', (symbol,)
+            ).fetchone()[0]
+            self.cnx.execute(
+                '''INSERT INTO snapshots (symbol, journal_id, state, local_time) VALUES (?, ?, ?, ?)
+                ON CONFLICT(symbol) DO UPDATE SET
+                    journal_id = excluded.journal_id, state = excluded.state, local_time = excluded.local_time''',
+                (symbol, journal_id, json.dumps(state), str(datetime.datetime.now()))
+            )
+            self.entries_since_snapshot[symbol] = 0
+
+    def load(self, symbol):
+
+        # latest snapshot of the symbol, if any, and the events journaled after it as
+        # (event, amount, grid_price, order_id, fill_price, commission, transact_time)
+        with self.lock:
+            row = self.cnx.execute(
+                'SELECT journal_id, state FROM snapshots WHERE symbol = ?', (symbol,)
+            ).fetchone()
+            journal_id, state = (row[0], json.loads(row[1])) if row is not None else (0, None)
+            rows = self.cnx.execute(
+                '''SELECT event, amount, grid_price, order_id, fill_price, commission, transact_time
+                FROM journal WHERE symbol = ? AND id > ? ORDER BY id''',
+                (symbol, journal_id)
+            ).fetchall()
+        events = [
+            (event, amount, grid_price, order_id, fill_price, json.loads(commission) if commission else None, transact_time)
+            for event, amount, grid_price, order_id, fill_price, commission, transact_time in rows
+        ]
+        return(state, events)
+
+    def close(self):
+
+        with self.lock:
+            self.cnx.close()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+# supervisor.py
+
+# production launch: the pairs of the config are split into groups traded by one worker process
+# each, which publish their live grid state to a memory-mapped file read by the dashboard,
+# served from another process; workers that die are restarted
+
+import argparse as ap
+import datetime
+import multiprocessing
+import os
+import time
+from livestate import LiveState
+from storage import connect
+
+def splitPairs(pairs, n_workers) -> list:
+
+    # pairs with a 'group' stay together; the others are dealt round-robin to the workers
+    groups = {}
+    ungrouped = []
+    for pair in pairs:
+        if pair.get('group') is not None:
+            groups.setdefault(f'group {pair["group"]}', []).append(pair)
+        else:
+            ungrouped.append(pair)
+    n_workers = max(1, min(n_workers - len(groups), len(ungrouped))) if ungrouped else 0
+    for i, pair in enumerate(ungrouped):
+        groups.setdefault(f'worker {i % n_workers}', []).append(pair)
+    return(list(groups.values()))
+
+def runWorker(key, secret, config, poll):
+
+    # worker process: a MultiGridBot trading one group of pairs
+    from bot import MultiGridBot
+    from eventlog import eventlog
+
+    eventlog.configure(config.get('event_log'), tick_sample=config.get('tick_sample', 0.0))
+    bot = MultiGridBot(key, secret, config)
+    if poll:
+        bot.start()
+    else:
+        bot.startStream()
+
+def runDashboard(db_file, live_state, host, port):
+
+    import dashboard
+
+    dashboard.serve(db_file, live=True, live_state=live_state, production=True, host=host, port=port)
+
+class Supervisor:
+
+    def __init__(self, key, secret, config, n_workers=None, live_state_file='live_state.bin', poll=False,
+            dashboard=True, dashboard_host='0.0.0.0', dashboard_port=9050, restart_delay=5):
+
+        self.key = key
+        self.secret = secret
+        self.config = config
+        self.poll = poll
+        self.live_state_file = live_state_file
+        self.restart_delay = restart_delay # seconds before a dead worker is restarted
+        self.dashboard = dashboard
+        self.dashboard_host = dashboard_host
+        self.dashboard_port = dashboard_port
+
+        # spawned processes start clean, without the threads and sockets of the supervisor
+        self.context = multiprocessing.get_context('spawn')
+
+        # one worker config per group of pairs; the request weight limit of the IP address is
+        # split between the workers, and every worker writes its own event log
+        groups = splitPairs(config['pairs'], n_workers or os.cpu_count())
+        self.worker_configs = []
+        for i, pairs in enumerate(groups):
+            worker_config = dict(config, pairs=pairs, live_state=live_state_file, weight_share=1 / len(groups))
+            if config.get('event_log') is not None:
+                worker_config['event_log'] = f'{config["event_log"]}.worker{i}'
+            self.worker_configs.append(worker_config)
+        self.workers = [None] * len(groups)
+        self.dashboard_process = None
+
+    def prepare(self):
+
+        # live state slots and symbols table of all the pairs, before any process reads them
+        pairs = {pair['symbol']: (pair['trade_coin'], pair['stake_currency']) for pair in self.config['pairs']}
+        LiveState.create(self.live_state_file, pairs)
+        cnx = connect(self.config.get('db_file', 'wallet.db'))
+        for symbol, (trade_coin, stake_currency) in pairs.items():
+            cnx.execute(
+                'INSERT OR REPLACE INTO symbols (symbol, trade_coin, stake_currency) VALUES (?, ?, ?)',
+                (symbol, trade_coin, stake_currency)
+            )
+        cnx.close()
+
+    def startWorker(self, i):
+
+        worker_config = self.worker_configs[i]
+        worker = self.context.Process(
+            target=runWorker,
+            args=(self.key, self.secret, worker_config, self.poll),
+            name=f'gridbot-worker{i}'
+        )
+        worker.start()
+        self.workers[i] = worker
+
+        # log
+        local_time = datetime.datetime.now()
+        symbols = [pair['symbol'] for pair in worker_config['pairs']]
+        print(f'[{local_time}]: worker {i} (pid {worker.pid}) trading {", ".join(symbols)}')
+
+    def startDashboard(self):
+
+        self.dashboard_process = self.context.Process(
+            target=runDashboard,
+            args=(self.config.get('db_file', 'wallet.db'), self.live_state_file, self.dashboard_host, self.dashboard_port),
+            name='gridbot-dashboard'
+        )
+        self.dashboard_process.start()
+
+        # log
+        local_time = datetime.datetime.now()
+        print(f'[{local_time}]: dashboard (pid {self.dashboard_process.pid}) serving at http://{self.dashboard_host}:{self.dashboard_port}')
+
+    def stop(self, timeout=10):
+
+        # the workers save their grid state on SIGINT (KeyboardInterrupt); those still running
+        # after the timeout are terminated
+        processes = [worker for worker in self.workers if worker is not None] + \
+            ([self.dashboard_process] if self.dashboard_process is not None else [])
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+        # log
+        local_time = datetime.datetime.now()
+        print(f'[{local_time}]: supervisor terminated')
+
+    def run(self):
+
+        self.prepare()
+
+        # log
+        local_time = datetime.datetime.now()
+        print('---')
+        print(f'[{local_time}]: starting {len(self.workers)} workers for {len(self.config["pairs"])} pairs; live state in {self.live_state_file}')
+
+        for i in range(len(self.workers)):
+            self.startWorker(i)
+        if self.dashboard:
+            self.startDashboard()
+
+        # restart the processes that exited with an error
+        try:
+            while True:
+                time.sleep(1)
+                for i, worker in enumerate(self.workers):
+                    if worker.is_alive() or worker.exitcode == 0:
+                        continue
+
+                    # log
+                    local_time = datetime.datetime.now()
+                    print(f'[{local_time}]: worker {i} exited with code {worker.exitcode}; restarting in {self.restart_delay} seconds')
+
+                    time.sleep(self.restart_delay)
+                    self.startWorker(i)
+                if self.dashboard_process is not None and not self.dashboard_process.is_alive():
+                    local_time = datetime.datetime.now()
+                    print(f'[{local_time}]: dashboard exited with code {self.dashboard_process.exitcode}; restarting')
+                    self.startDashboard()
+        except KeyboardInterrupt:
+            self.stop()
+
+def parseArgs():
+
+    # ./supervisor.py --api_key testnet_api_key --api_secret testnet_secret_key --config pairs.json
+    parser = ap.ArgumentParser(description='Binance Grid Bot supervisor')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '-k', '--api_key', metavar='KEY', type=str, help='API key file path',
+        required=True)
+    requiredNamed.add_argument(
+        '-s', '--api_secret', metavar='SECRET', type=str,
+        help='API secret key file path', required=True)
+    requiredNamed.add_argument(
+        '-c', '--config', metavar='CONFIG', type=str, required=True,
+        help='JSON file with the pairs to trade and their grid parameters')
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument(
+        '--workers', metavar='N', type=int, default=None,
+        help='worker processes, each trading a group of pairs (default: number of cores, at most one per pair)')
+    optional.add_argument(
+        '--live_state', metavar='FILE', type=str, default='live_state.bin',
+        help='memory-mapped file holding the live grid state of every pair (default: live_state.bin)')
+    optional.add_argument(
+        '--poll', action='store_true',
+        help='poll the REST price endpoint instead of streaming prices from the websocket')
+    optional.add_argument(
+        '--no_dashboard', action='store_true',
+        help='do not serve the dashboard')
+    optional.add_argument(
+        '--dashboard_port', metavar='PORT', type=int, default=9050,
+        help='port of the dashboard (default: 9050)')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    from bot import readConfig, readKeys
+
+    args = parseArgs()
+    key, secret = readKeys(args.api_key, args.api_secret)
+    config = readConfig(args.config)
+    supervisor = Supervisor(
+        key, secret, config,
+        n_workers=args.workers,
+        live_state_file=args.live_state,
+        poll=args.poll,
+        dashboard=not args.no_dashboard,
+        dashboard_port=args.dashboard_port
+    )
+    supervisor.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# sweep.py
+
+# evaluate many grid configurations over the same price history across all cores
+
+import argparse as ap
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from backtest import backtest, loadPrices
+
+# report columns where lower is better, ranked in ascending order by default
+ASCENDING_COLUMNS = ('max_drawdown', 'max_drawdown_percent', 'stoplosses', 'open_trades', 'elapsed')
+
+# price history shared by the worker processes
+_prices = None
+_shm = None
+
+def initWorker(shm_name, n_prices):
+
+    global _prices, _shm
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _prices = np.ndarray((n_prices,), dtype=np.float64, buffer=_shm.buf)
+
+def runConfig(config) -> dict:
+
+    grid_step, max_open_trades, tradeable_stake, stoploss, kwargs = config
+    report = backtest(
+        _prices,
+        grid_step=grid_step,
+        max_open_trades=max_open_trades,
+        tradeable_stake=tradeable_stake,
+        stoploss=stoploss,
+        **kwargs
+    )
+    report.update({
+        'grid_step': grid_step,
+        'max_open_trades': max_open_trades,
+        'tradeable_stake': tradeable_stake,
+        'stoploss': stoploss if stoploss is not None else grid_step * (max_open_trades + 1)
+    })
+    return(report)
+
+def parseRange(values, cast=float) -> list:
+
+    # values are either explicit numbers or start:stop:num linear ranges
+    parsed = []
+    for value in values:
+        if value == 'auto':
+            parsed.append(None)
+        elif ':' in value:
+            start, stop, num = value.split(':')
+            parsed.extend(cast(x) for x in np.linspace(float(start), float(stop), int(num)))
+        else:
+            parsed.append(cast(value))
+    return(parsed)
+
+def sweep(prices, grid_steps, max_open_trades, tradeable_stakes, stoplosses, workers=None, **kwargs) -> pd.DataFrame:
+
+    configs = [
+        (grid_step, n_trades, stake, stoploss, kwargs)
+        for grid_step, n_trades, stake, stoploss
+        in itertools.product(grid_steps, max_open_trades, tradeable_stakes, stoplosses)
+    ]
+    workers = workers or os.cpu_count()
+
+    # copy the prices once into shared memory instead of pickling them for every task
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=initWorker,
+                initargs=(shm.name, len(prices))) as executor:
+            chunksize = max(1, len(configs) // (workers * 4))
+            reports = list(executor.map(runConfig, configs, chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return(pd.DataFrame(reports))
+
+def parseArgs():
+
+    # ./sweep.py --data XRPBUSD-trades-2022-06.csv --grid_step 0.002:0.03:15 --max_open_trades 3 5 10
+    parser = ap.ArgumentParser(description='Binance Grid Bot parameter sweep')
+    requiredNamed = parser.add_argument_group('required named arguments')
+    requiredNamed.add_argument(
+        '--data', metavar='FILE', type=str,
+        help='CSV or Parquet file of trades (price) or klines (open, high, low, close)',
+        required=True)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument(
+        '--grid_step', type=str, nargs='+', default=['0.01'],
+        help='values or start:stop:num ranges')
+    optional.add_argument('--max_open_trades', type=str, nargs='+', default=['5'])
+    optional.add_argument('--tradeable_stake', type=str, nargs='+', default=['0.8'])
+    optional.add_argument(
+        '--stoploss', type=str, nargs='+', default=['auto'],
+        help='values, ranges or auto for grid_step * (max_open_trades + 1)')
+    optional.add_argument('--stake_balance', type=float, default=1000)
+    optional.add_argument('--fee', type=float, default=0.001, help='commission rate per fill')
+    optional.add_argument('--slippage', type=float, default=0.0, help='relative slippage per fill')
+    optional.add_argument(
+        '--fee_aware', action='store_true',
+        help='widen the sell threshold by the fees of the round trip, as the bot does')
+    optional.add_argument('--precision', type=int, default=5, help='number of decimals of the order quantity')
+    optional.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    optional.add_argument('--rank_by', type=str, default='pnl', help='column used to rank the results')
+    optional.add_argument(
+        '--rank_order', type=str, default='auto', choices=['auto', 'ascending', 'descending'],
+        help='ranking order; auto ranks drawdowns, stoplosses, open trades and elapsed time ascending, the rest descending')
+    optional.add_argument('--output', type=str, default='sweep_results.csv', help='ranked results table')
+    args = parser.parse_args()
+    return(args)
+
+def main():
+
+    args = parseArgs()
+    prices = loadPrices(args.data)
+
+    start = time.perf_counter()
+    results = sweep(
+        prices,
+        grid_steps=parseRange(args.grid_step),
+        max_open_trades=parseRange(args.max_open_trades, cast=lambda x: int(round(float(x)))),
+        tradeable_stakes=parseRange(args.tradeable_stake),
+        stoplosses=parseRange(args.stoploss),
+        workers=args.workers,
+        stake_balance=args.stake_balance,
+        fee=args.fee,
+        slippage=args.slippage,
+        ndecimal_precision=args.precision,
+        fee_aware=args.fee_aware
+    )
+    elapsed = time.perf_counter() - start
+
+    # rank and write the results table
+    if args.rank_order == 'auto':
+        ascending = args.rank_by in ASCENDING_COLUMNS
+    else:
+        ascending = args.rank_order == 'ascending'
+    results = results.sort_values(args.rank_by, ascending=ascending).reset_index(drop=True)
+    results.index.name = 'rank'
+    columns = ['grid_step', 'max_open_trades', 'tradeable_stake', 'stoploss']
+    results = results[columns + [c for c in results.columns if c not in columns]]
+    results.to_csv(args.output)
+
+    print(f'{len(results)} configurations x {len(prices)} ticks evaluated in {elapsed:.2f} s')
+    print(f'results written to {args.output}')
+    print(results[columns + ['pnl_percent', 'trades', 'max_drawdown_percent']].head(10).to_string())
+
+if __name__ == '__main__':
+    main()
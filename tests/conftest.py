@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+
+# tests/conftest.py
+
+# the modules of the bot are imported from the repository root, which is not a package
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
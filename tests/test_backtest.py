@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# tests/test_backtest.py
+
+# replay of price paths through the grid with the simulated fill model
+
+import numpy as np
+import pandas as pd
+import pytest
+from backtest import Backtester, FillModel, backtest, klinesToTicks, nextCrossing
+from grid import GridStrategy, LadderStrategy
+
+def randomWalk(n, seed=0) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    return(0.5 * np.exp(np.cumsum(rng.normal(0, 0.002, n))))
+
+def testRoundTripPnl():
+
+    report = backtest([1.0, 0.985, 1.0], grid_step=0.01, fee=0.0)
+    amount = round(1000 * 0.8 / 5 / 0.99, 5)
+    assert (report['buys'], report['sells'], report['trades']) == (1, 1, 2)
+    assert report['pnl'] == pytest.approx(amount * (1.0 - 0.985))
+    assert report['open_trades'] == 0
+
+def testFeesChargedOnBothFills():
+
+    fee = 0.001
+    report = backtest([1.0, 0.985, 1.0], grid_step=0.01, fee=fee)
+    amount = round(1000 * 0.8 / 5 / 0.99, 5)
+    assert report['pnl'] == pytest.approx(amount * (1.0 * (1 - fee) - 0.985 * (1 + fee)))
+
+def testMaxDrawdown():
+
+    report = backtest([1.0, 0.985, 0.95, 1.0], grid_step=0.01, max_open_trades=1, stoploss=0.5, fee=0.0)
+    amount = round(1000 * 0.8 / 0.99, 5)
+    assert report['max_drawdown'] == pytest.approx(amount * (0.985 - 0.95))
+    assert report['max_drawdown_percent'] == pytest.approx(amount * (0.985 - 0.95) / 1000 * 100)
+
+def testStoplossSellsOldest():
+
+    report = backtest([1.0, 0.985, 0.9], grid_step=0.01, max_open_trades=1, stoploss=0.05, fee=0.0)
+    assert report['stoplosses'] == 1
+    assert report['open_trades'] == 0
+
+def testSkippingQuietTicksMatchesTickByTick():
+
+    # the band skipped by run() cannot trigger anything, so every tick gives the same result
+    prices = randomWalk(20000)
+    fast = Backtester(GridStrategy(grid_step=0.005), FillModel()).run(prices)
+    slow = Backtester(GridStrategy(grid_step=0.005), FillModel())
+    slow.grid.setGrid(prices[0])
+    for price in prices:
+        action = slow.grid.decide(price)
+        if action == 'sell':
+            amount, _ = slow.grid.closeLastPosition(price)
+            slow.sell(amount, price)
+        elif action == 'stoploss':
+            amount, _ = slow.grid.closeOldestPosition()
+            slow.sell(amount, price)
+        elif action == 'buy':
+            slow.buy(price)
+        elif action == 'reset':
+            slow.grid.reset_grid(price)
+    assert fast['end_equity'] == pytest.approx(slow.stake_balance + slow.trade_balance * prices[-1])
+    assert fast['buys'] == slow.n_buys
+
+def testLadderBalancesMatchPositions():
+
+    prices = randomWalk(20000, seed=1)
+    backtester = Backtester(LadderStrategy(n_levels=50, width=0.05), FillModel())
+    report = backtester.run(prices)
+    assert report['buys'] > 0 and report['sells'] > 0
+    assert backtester.trade_balance == pytest.approx(backtester.grid.positions.total_amount)
+    assert report['open_trades'] == len(backtester.grid.held_levels)
+
+def testNextCrossing():
+
+    prices = np.full(100000, 1.0)
+    prices[70000] = 1.2
+    assert nextCrossing(prices, 0, 0.9, 1.1) == 70000
+    assert nextCrossing(prices, 70001, 0.9, 1.1) == len(prices)
+
+def testKlinesReplayOrder():
+
+    df = pd.DataFrame({'open': [1.0, 2.0], 'high': [3.0, 4.0], 'low': [0.5, 1.0], 'close': [2.0, 1.5]})
+    assert klinesToTicks(df).tolist() == [1.0, 0.5, 3.0, 2.0, 2.0, 4.0, 1.0, 1.5]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# tests/test_bot.py
+
+# the bot on the in-process simulator, which takes the commissions in the received asset as
+# the exchange does: its trading thread, and trading a random walk
+
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('binance')
+
+from bench import simulatedBot, tradeSimulated
+from eventlog import eventlog, readEvents
+
+def randomWalk(n, seed=0) -> np.ndarray:
+
+    rng = np.random.default_rng(seed)
+    return(0.5 * np.exp(np.cumsum(rng.normal(0, 0.002, n))))
+
+@pytest.fixture
+def log_file(tmp_path):
+
+    log_file = str(tmp_path / 'events.jsonl')
+    eventlog.configure(log_file, console=False)
+    yield(log_file)
+    eventlog.stop()
+
+@pytest.mark.parametrize('strategy', ['band', 'ladder'])
+def testPositionsNetOfCommission(tmp_path, log_file, strategy):
+
+    prices = randomWalk(3000)
+    exchange, bot = simulatedBot(prices, str(tmp_path / 'wallet.db'), strategy)
+    tradeSimulated(exchange, bot, len(prices) - 1)
+    eventlog.stop()
+
+    # every position can be sold again: no order is rejected for the balance
+    assert [event for event in readEvents(log_file, ('error',))] == []
+    assert any(event['side'] == 'SELL' for event in readEvents(log_file, ('fill',)))
+    balance = exchange.balance(bot.client.api_key, bot.trade_coin)
+    assert bot.grid.positions.total_amount <= balance['free'] + balance['locked']
+    for amount in bot.grid.trades_amount:
+        assert amount == bot.roundQuantity(amount)
+
+    # the commission is paid in the trade coin, below the quantity bought
+    buy = next(readEvents(log_file, ('fill',)))
+    assert buy['commission'][bot.trade_coin] > 0
+
+def waitFor(condition, timeout=5.0):
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def testTickMailbox(tmp_path, log_file):
+
+    exchange, bot = simulatedBot(randomWalk(10), str(tmp_path / 'wallet.db'))
+    price = exchange.price(bot.trade_symbol)
+
+    # ticks arriving while the trading thread is busy are replaced by the newest one
+    for i, event_time in enumerate((1000, 2000, 3000)):
+        bot.submitPrice(price * (1 + i * 1e-4), event_time)
+    assert bot.pending_tick == (price * (1 + 2e-4), 3000)
+    assert bot.ticks_dropped == 2
+    bot.startTrading()
+    waitFor(lambda: bot.price == price * (1 + 2e-4))
+    assert bot.last_event_time == 3000
+
+    # a streamed tick older than the last one evaluated is dropped, a polled price is not
+    bot.submitPrice(price * 1.001, 2500)
+    waitFor(lambda: bot.ticks_dropped == 3)
+    bot.submitPrice(price * 1.002)
+    waitFor(lambda: bot.price == price * 1.002)
+    assert bot.last_event_time == 3000
+    bot.stopTrading()
+    assert bot.trading_thread is None
+    bot.wallet_writer.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# tests/test_dashboard.py
+
+# wallet and profit series of the dashboard, from the first records of a pair
+
+import numpy as np
+import pandas as pd
+import pytest
+from dashboard import WalletData, computeProfit, startValues, walletFigure, profitFigure
+from storage import connect
+
+COLUMNS = {'stake_currency': 'BUSD', 'trade_coin': 'XRP'}
+
+def writeRows(db_file, rows):
+
+    cnx = connect(db_file)
+    cnx.execute("INSERT OR REPLACE INTO symbols (symbol, trade_coin, stake_currency) VALUES ('XRPBUSD', 'XRP', 'BUSD')")
+    cnx.executemany(
+        "INSERT INTO wallet (symbol, ts, stake_balance, trade_balance, price) VALUES ('XRPBUSD', ?, ?, ?, ?)", rows)
+    cnx.commit()
+    cnx.close()
+
+def testStartPriceFromFirstPricedRecord():
+
+    df = pd.DataFrame({
+        'row_id': [1, 2, 3], 'ts': [0, 1000, 2000],
+        'stake_balance': [1000.0, 900.0, 900.0], 'trade_balance': [0.0, 200.0, 200.0], 'price': [None, 0.5, 0.55]
+    })
+    start = startValues(df)
+    assert (start['row_id'], start['stake_amount'], start['price']) == (1, 1000.0, 0.5)
+    df_profit = computeProfit(df, start)
+    assert df_profit['unrealized_profit'].tolist() == pytest.approx([0.0, 0.0, 10.0])
+    assert df_profit['price_change'].tolist() == pytest.approx([0.0, 0.0, 0.05])
+
+    # a first record with a price is its own start
+    start = startValues(df.iloc[1:])
+    assert (start['row_id'], start['price']) == (2, 0.5)
+
+def testStartPlaceholders():
+
+    df = pd.DataFrame({'row_id': [1], 'ts': [0], 'stake_balance': [1000.0], 'trade_balance': [0.0], 'price': [None]})
+    assert np.isnan(startValues(df)['price'])
+    assert np.isnan(startValues(df.iloc[:0])['stake_amount'])
+    assert len(computeProfit(df.iloc[:0], startValues(df.iloc[:0]))) == 0
+
+@pytest.mark.parametrize('n_rows, profit', [(0, 0.0), (1, 10.0)])
+def testPairWithoutPrices(tmp_path, n_rows, profit):
+
+    db_file = str(tmp_path / 'wallet.db')
+    writeRows(db_file, [(1700000000000, 1000.0, 0.0, None)][:n_rows])
+    data = WalletData(db_file, 'XRPBUSD', COLUMNS)
+    assert data.lastRowId() == n_rows
+    walletFigure(data, 'One axis', 'plotly_dark')
+    profitFigure(data, 'Absolute', 'plotly_dark')
+
+    # the profits are computed again once the first price is known
+    writeRows(db_file, [(1700000030000, 900.0, 200.0, 0.5), (1700000060000, 900.0, 200.0, 0.55)])
+    data.tail()
+    assert data.start['price'] == 0.5
+    assert data.df_profit['unrealized_profit'].iloc[-1] == pytest.approx(profit)
+    assert len(data.df_profit) == len(data.df_wallet)
+
+def testLiveExtensionBounded(tmp_path):
+
+    db_file = str(tmp_path / 'wallet.db')
+    writeRows(db_file, [(1700000000000, 1000.0, 0.0, 0.5), (1700000001000, 1000.0, 0.0, 0.5)])
+    data = WalletData(db_file, 'XRPBUSD', COLUMNS, max_points=100)
+    assert data.extension(['stake_balance'], data.lastRowId()) == (None, 2)
+
+    # a burst of rows between two checks is reduced as a redraw would be
+    rng = np.random.default_rng(0)
+    prices = 0.5 + np.cumsum(rng.normal(0, 1e-3, 5000))
+    writeRows(db_file, [(1700000002000 + i * 1000, 1000.0 - i, float(i), price) for i, price in enumerate(prices)])
+    data.tail()
+    extension, row_id = data.extension(['stake_balance', 'trade_balance'], 2, method='minmax')
+    assert row_id == 5002
+    assert all(len(x) <= 100 for x in extension['x'])
+    assert [len(x) for x in extension['x']] == [len(y) for y in extension['y']]
+    assert extension['x'][0][-1] == str(pd.Timestamp(1700000002000 + 4999 * 1000, unit='ms'))
+    extension, _ = data.extension(['unrealized_profit'], 2, profit=True)
+    assert len(extension['y'][0]) == 100
+    assert max(extension['y'][0]) == data.df_profit['unrealized_profit'].iloc[2:].max()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# tests/test_downsample.py
+
+# bounded payloads of the dashboard charts that keep the extremes of the series
+
+import numpy as np
+import pytest
+from downsample import TieredSeries, bucketIndices, lttb, reduceIndices
+
+def series(n, seed=0):
+
+    # one point per second as epoch nanoseconds, and a random walk
+    rng = np.random.default_rng(seed)
+    x = 1700000000 * 10 ** 9 + np.arange(n, dtype=np.int64) * 10 ** 9
+    y = np.cumsum(rng.normal(0, 1, n))
+    return(x, y)
+
+def testLttbKeepsEndsAndCount():
+
+    x, y = series(10000)
+    indices = lttb(x, y, 500)
+    assert len(indices) == 500
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+def testLttbShortSeriesUnchanged():
+
+    x, y = series(100)
+    assert np.array_equal(lttb(x, y, 500), np.arange(100))
+
+def testLttbKeepsSpike():
+
+    x, y = series(10000)
+    y[5000] = y.max() + 1000
+    assert 5000 in lttb(x, y, 200)
+
+def testBucketIndicesKeepExtremes():
+
+    x, y = series(10000)
+    width = 100 * 10 ** 9
+    indices = bucketIndices(x, y, width)
+    bucket = (x - x[0]) // width
+    for b in np.unique(bucket):
+        members = np.flatnonzero(bucket == b)
+        assert members[np.argmin(y[members])] in indices
+        assert members[np.argmax(y[members])] in indices
+        assert members[-1] in indices
+    assert len(indices) <= 3 * len(np.unique(bucket))
+
+def testBucketIndicesIgnoreNan():
+
+    x, y = series(1000)
+    y[10] = np.nan
+    assert len(bucketIndices(x, y, 10 ** 11)) > 0
+    assert len(bucketIndices(x[:0], y[:0], 10 ** 11)) == 0
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def testReduceIndicesBounded(method):
+
+    x, y = series(20000)
+    indices = np.arange(5000, 20000)
+    reduced = reduceIndices(x, y, indices, 1000, method)
+    assert len(reduced) <= 1100
+    assert set(reduced) <= set(indices)
+    assert np.all(np.diff(reduced) > 0)
+    assert len(reduceIndices(x, y, indices[:500], 1000, method)) == 500
+
+def testTieredQueryBounded():
+
+    x, y = series(200000)
+    tiered = TieredSeries(x, y, max_points=1000, factor=4)
+    assert len(tiered.tiers) > 1
+    indices = tiered.query()
+    assert len(indices) <= 1000
+    assert indices[-1] == len(x) - 1
+
+def testTieredQueryKeepsExtremes():
+
+    x, y = series(200000)
+    tiered = TieredSeries(x, y, max_points=1000, factor=4)
+    indices = tiered.query(method='minmax')
+    assert len(indices) <= 1000 * 4 + 2
+    assert np.argmax(y) in indices
+    assert np.argmin(y) in indices
+
+def testTieredZoomUsesFinerTier():
+
+    x, y = series(200000)
+    tiered = TieredSeries(x, y, max_points=1000, factor=4)
+    x0, x1 = x[100000], x[100500]
+    indices = tiered.query(x0, x1)
+    assert np.array_equal(indices, np.arange(99999, 100502))
+
+    # one point on each side of the view, so that the lines reach its edges
+    inside = indices[(x[indices] >= x0) & (x[indices] <= x1)]
+    assert len(indices) - len(inside) == 2
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# tests/test_eventlog.py
+
+# JSON-lines event log: tick sampling, reading across rotated files and the wallet replay
+
+import json
+import pytest
+from eventlog import eventlog, readEvents, replayWallet
+from storage import connect, queryRollup
+
+@pytest.fixture
+def log():
+
+    # the event log shared by the process, whose logger takes one queue handler only
+    eventlog.tick_credit = {}
+    yield(eventlog)
+    eventlog.stop()
+    eventlog.tick_credit = {}
+
+def testTicksSampledPerSymbol(log, tmp_path):
+
+    log_file = str(tmp_path / 'events.jsonl')
+    log.configure(log_file, tick_sample=0.25, console=False)
+    for i in range(100):
+        log.tick('XRPBUSD', 0.5 + i * 1e-4)
+        log.tick('BTCUSDT', 30000.0 + i)
+    log.stop()
+    ticks = list(readEvents(log_file, ('tick',)))
+
+    # the first tick of each symbol, then one in four
+    assert sum(event['symbol'] == 'XRPBUSD' for event in ticks) == 1 + 100 // 4
+    assert sum(event['symbol'] == 'BTCUSDT' for event in ticks) == 1 + 100 // 4
+    assert ticks[0]['price'] == 0.5
+
+def testNoTicksWithoutSampling(log, tmp_path):
+
+    log_file = str(tmp_path / 'events.jsonl')
+    log.configure(log_file, console=False)
+    log.tick('XRPBUSD', 0.5)
+    log.emit('info', 'XRPBUSD', ['started'])
+    log.stop()
+    assert [event['event'] for event in readEvents(log_file)] == ['info']
+
+def testReadAcrossRotatedFiles(log, tmp_path):
+
+    # small files, so that the log rotates several times
+    log_file = str(tmp_path / 'events.jsonl')
+    log.configure(log_file, max_bytes=500, backup_count=100, console=False)
+    for i in range(50):
+        log.emit('order', 'XRPBUSD' if i % 2 else 'BTCUSDT', n=i)
+    log.stop()
+    assert len(list(tmp_path.glob('events.jsonl.*'))) > 1
+    assert [event['n'] for event in readEvents(log_file)] == list(range(50))
+    assert [event['n'] for event in readEvents(log_file, symbol='XRPBUSD')] == list(range(1, 50, 2))
+
+def testTruncatedLineSkipped(tmp_path):
+
+    log_file = tmp_path / 'events.jsonl'
+    log_file.write_text(json.dumps({'ts': 0, 'event': 'info', 'symbol': None}) + '\n{"ts": 1, "eve')
+    assert len(list(readEvents(str(log_file)))) == 1
+
+def testReplayWallet(log, tmp_path):
+
+    log_file = str(tmp_path / 'events.jsonl')
+    log.configure(log_file, console=False)
+    wallet = {'trade_coin': 'XRP', 'stake_currency': 'BUSD'}
+    log.emit('wallet', 'XRPBUSD', stake_balance=1000.0, trade_balance=0.0, price=0.5, changed=True, **wallet)
+    log.emit('wallet', 'XRPBUSD', stake_balance=1000.0, trade_balance=0.0, price=0.5, changed=False, **wallet)
+    log.emit('fill', 'XRPBUSD', side='BUY')
+    log.emit('wallet', 'XRPBUSD', stake_balance=900.0, trade_balance=200.0, price=0.49, changed=True, **wallet)
+    log.stop()
+
+    db_file = str(tmp_path / 'replay.db')
+    assert replayWallet(log_file, db_file) == 2
+    cnx = connect(db_file)
+    assert cnx.execute('SELECT trade_coin, stake_currency FROM symbols WHERE symbol = ?', ('XRPBUSD',)).fetchone() == ('XRP', 'BUSD')
+    rows = cnx.execute('SELECT stake_balance, trade_balance, price FROM wallet ORDER BY ts, id').fetchall()
+    assert rows == [(1000.0, 0.0, 0.5), (900.0, 200.0, 0.49)]
+    assert queryRollup(cnx, 'XRPBUSD', '1d')[0][-1] == 2
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# tests/test_grid.py
+
+# behavior of the band grid, without exchange
+
+import numpy as np
+import pytest
+from grid import GridStrategy
+
+def testBandThresholdsAroundPrice():
+
+    grid = GridStrategy(grid_step=0.01)
+    grid.setGrid(100.0)
+    assert grid.buy_threshold == 99.0
+    assert grid.sell_threshold == 101.0
+    assert grid.decide(100.0) is None
+    assert grid.decide(98.9) == 'buy'
+    assert grid.decide(101.1) == 'reset'
+
+def testBandSellThresholdCoversFees():
+
+    grid = GridStrategy(grid_step=0.01, fee_rate=0.001)
+    grid.setGrid(100.0)
+    grid.openPosition(1.0, 99.0)
+    assert grid.sell_threshold > 99.0 * 1.01
+    assert grid.positions.last.expected_pnl == pytest.approx(99.0 * 1.001 * 0.01, rel=1e-4)
+
+def testBandSellsNewestAndStoplossSellsOldest():
+
+    grid = GridStrategy(grid_step=0.01, max_open_trades=3)
+    grid.setGrid(100.0)
+    grid.openPosition(1.0, 99.0)
+    grid.openPosition(2.0, 98.0)
+    assert grid.stoploss_price == pytest.approx(99.0 * (1 - 0.04))
+    assert grid.decide(99.0) == 'sell'
+    assert grid.closeLastPosition(99.0) == (2.0, 98.0)
+    assert grid.decide(90.0) == 'stoploss'
+    assert grid.closeOldestPosition() == (1.0, 99.0)
+    assert grid.active_trades == 0
+    assert grid.stoploss_price == -np.inf
+
+def testBandStopsBuyingAtMaxOpenTrades():
+
+    grid = GridStrategy(grid_step=0.01, max_open_trades=1, stoploss=0.5)
+    grid.setGrid(100.0)
+    grid.openPosition(1.0, 99.0)
+    assert grid.decide(97.0) is None
+
+def testBandStateRoundTrip():
+
+    grid = GridStrategy(grid_step=0.01)
+    grid.setGrid(100.0)
+    grid.openPosition(1.0, 99.0, order_id=7)
+    restored = GridStrategy(grid_step=0.01)
+    restored.setState(grid.getState())
+    assert restored.getState() == grid.getState()
+
+def testBandReplayMatchesLiveMoves():
+
+    grid = GridStrategy(grid_step=0.01)
+    grid.setGrid(100.0)
+    grid.openPosition(1.0, 99.0)
+    grid.closeLastPosition(100.5)
+    replayed = GridStrategy(grid_step=0.01)
+    for event, amount, price in [('start', None, 100.0), ('buy', 1.0, 99.0), ('sell', 1.0, 100.5)]:
+        replayed.replayEvent(event, amount, price)
+    assert (replayed.buy_threshold, replayed.sell_threshold) == (grid.buy_threshold, grid.sell_threshold)
+    assert replayed.active_trades == 0
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# tests/test_ladder.py
+
+# behavior of the static ladder, without exchange
+
+import numpy as np
+import pytest
+from grid import GridStrategy, LadderStrategy
+
+def ladder(**kwargs) -> LadderStrategy:
+
+    # levels 1.0, 1.1, ..., 2.0 with the cursor between 1.5 and 1.6
+    grid = LadderStrategy(n_levels=11, lower=1.0, upper=2.0, **kwargs)
+    grid.setGrid(1.55)
+    return(grid)
+
+def testLadderLevels():
+
+    assert ladder().levels == pytest.approx(np.linspace(1.0, 2.0, 11))
+    geometric = LadderStrategy(n_levels=3, lower=1.0, upper=4.0, spacing='geometric')
+    assert geometric.levels == pytest.approx([1.0, 2.0, 4.0])
+    with pytest.raises(ValueError):
+        LadderStrategy(spacing='harmonic')
+
+def testLadderBuysAllCrossedLevels():
+
+    grid = ladder()
+    assert grid.decide(1.52) is None
+    assert grid.decide(1.32) == 'ladder'
+    assert grid.cross(1.32) == ('buy', [4, 5])
+
+def testLadderKeepsUntradedBuys():
+
+    # the buy of level 4 failed: the next tick below it buys it again
+    grid = ladder()
+    trigger, levels = grid.cross(1.32)
+    grid.openLevel(5, 1.0)
+    grid.moveCursor(1.32, trigger, levels)
+    assert grid.cursor == 5
+    assert grid.decide(1.33) == 'ladder'
+    assert grid.cross(1.33) == ('buy', [4])
+
+def testLadderSellsAboveSellLevel():
+
+    grid = ladder()
+    grid.cross(1.32)
+    grid.openLevel(4, 1.0)
+    grid.openLevel(5, 1.0)
+    grid.moveCursor(1.32, 'buy', [4, 5])
+    assert grid.cross(1.55) == ('sell', [4])
+    grid.closeLevel(4)
+    grid.moveCursor(1.55, 'sell', [4])
+    assert grid.cross(1.65) == ('sell', [5])
+
+def testLadderStoplossSellsAllLevels():
+
+    grid = ladder(stoploss=0.1)
+    grid.openLevel(4, 1.0)
+    grid.openLevel(5, 1.0)
+    assert grid.stoploss_price == pytest.approx(0.9)
+    assert grid.cross(0.85) == ('stoploss', [4, 5])
+
+def testLadderTopLevelsWithoutSellLevel():
+
+    # with 5 % fees no level is high enough to sell a position bought at 1.9 or 2.0
+    grid = ladder(fee_rate=0.05)
+    assert grid.buyableLevels() == 9
+    assert grid.expectedPnl(1.0, 1.9, 9) is None
+    assert grid.expectedPnl(1.0, 2.0, 10) is None
+    assert grid.expectedPnl(1.0, 1.8, 8) == pytest.approx(2.0 * 0.95 - 1.8 * 1.05)
+    grid.setGrid(2.05)
+    assert grid.cross(1.85) == (None, [])
+    assert grid.cross(1.75) == ('buy', [8])
+
+def testLadderFreeLevelSkipsLevelsWithoutSellLevel():
+
+    grid = ladder(fee_rate=0.05)
+    assert grid.freeLevel(1.95) == 8
+    for level in range(9):
+        grid.openLevel(level, 1.0)
+    assert grid.freeLevel(1.95) is None
+    grid.openPosition(1.0, 1.95)
+    assert grid.active_trades == 9
+
+def testLadderStateRoundTrip():
+
+    grid = ladder(stoploss=0.1)
+    grid.openLevel(4, 1.0, order_id=1)
+    grid.openLevel(5, 2.0, order_id=2)
+    restored = LadderStrategy(n_levels=11, lower=1.0, upper=2.0, stoploss=0.1)
+    restored.setState(grid.getState())
+    assert restored.getState() == grid.getState()
+    assert restored.held_levels == [4, 5]
+
+def testLadderAdoptsBandPositions():
+
+    band = GridStrategy(grid_step=0.01)
+    band.setGrid(1.5)
+    band.openPosition(1.0, 1.43)
+    grid = LadderStrategy(n_levels=11, lower=1.0, upper=2.0)
+    grid.setState(band.getState())
+    assert grid.held_levels == [4]
+    assert grid.positions.first.price == pytest.approx(1.4)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# tests/test_livestate.py
+
+# live state file written by a bot worker and read by the dashboard
+
+import os
+import numpy as np
+import pytest
+from grid import GridStrategy
+from livestate import MAX_POSITIONS, LiveState
+
+PAIRS = {'XRPBUSD': ('XRP', 'BUSD'), 'BTCUSDT': ('BTC', 'USDT')}
+
+@pytest.fixture
+def state_file(tmp_path):
+
+    return(str(tmp_path / 'live.state'))
+
+def testNewSlotsHaveNoPrices(state_file):
+
+    LiveState.create(state_file, PAIRS)
+    states = LiveState(state_file).read()
+    assert list(states) == ['XRPBUSD', 'BTCUSDT']
+    assert states['BTCUSDT']['trade_coin'] == 'BTC'
+    assert np.isnan(states['BTCUSDT']['price'])
+    assert states['BTCUSDT']['active_trades'] == 0
+
+def testPublishedGridIsRead(state_file):
+
+    writer = LiveState.create(state_file, PAIRS)
+    grid = GridStrategy(grid_step=0.01)
+    grid.setGrid(0.5)
+    grid.openPosition(10.0, 0.495)
+    writer.publish('XRPBUSD', 0.49, grid, 995.05, 10.0)
+
+    state = LiveState(state_file).read()['XRPBUSD']
+    assert state['price'] == 0.49
+    assert state['buy_threshold'] == grid.buy_threshold
+    assert state['sell_threshold'] == grid.sell_threshold
+    assert state['active_trades'] == 1
+    assert state['position_amounts'] == [10.0]
+    assert state['position_prices'] == [0.495]
+    assert state['stake_balance'] == 995.05
+    assert state['pid'] == os.getpid()
+    assert not state['stale']
+    assert state['sequence'] % 2 == 0
+
+def testNewestPositionsKept(state_file):
+
+    writer = LiveState.create(state_file, PAIRS)
+    grid = GridStrategy(grid_step=0.001, max_open_trades=MAX_POSITIONS + 10)
+    grid.setGrid(1.0)
+    for i in range(MAX_POSITIONS + 10):
+        grid.openPosition(1.0, 1.0 - i * 1e-3)
+    writer.publish('XRPBUSD', 0.9, grid, 0.0, float(MAX_POSITIONS + 10))
+
+    state = LiveState(state_file).read()['XRPBUSD']
+    assert state['n_positions'] == MAX_POSITIONS + 10
+    assert state['total_amount'] == MAX_POSITIONS + 10
+    assert len(state['position_prices']) == MAX_POSITIONS
+    assert state['position_prices'][-1] == grid.positions.last.price
+
+def testTornSlotReturnsLastConsistentCopy(state_file):
+
+    writer = LiveState.create(state_file, PAIRS)
+    grid = GridStrategy()
+    grid.setGrid(0.5)
+    writer.publish('XRPBUSD', 0.5, grid, 1000.0, 0.0)
+    reader = LiveState(state_file)
+    assert reader.readSlot(0)['price'] == 0.5
+
+    # a writer killed inside publish() leaves the sequence odd
+    writer.fields['sequence'][0] += 1
+    writer.fields['price'][0] = 0.7
+    stale = reader.readSlot(0, retries=3)
+    assert stale['stale']
+    assert stale['price'] == 0.5
+
+    # without a previous consistent read there is nothing to show
+    assert LiveState(state_file).readSlot(0, retries=3) is None
+
+def testClaimRecoversTornSlot(state_file):
+
+    writer = LiveState.create(state_file, PAIRS)
+    grid = GridStrategy()
+    grid.setGrid(0.5)
+    writer.fields['sequence'][0] += 1
+
+    # the restarted worker makes the slot consistent before writing it again
+    restarted = LiveState(state_file, readonly=False)
+    restarted.claim(['XRPBUSD'])
+    assert LiveState(state_file).readSlot(0, retries=3) is not None
+    restarted.publish('XRPBUSD', 0.6, grid, 1000.0, 0.0)
+    state = LiveState(state_file).readSlot(0, retries=3)
+    assert state['price'] == 0.6
+    assert state['sequence'] % 2 == 0
+
+def testRecreatedFileIsDetected(state_file):
+
+    LiveState.create(state_file, PAIRS)
+    reader = LiveState(state_file)
+    assert not reader.replaced()
+    LiveState.create(state_file, PAIRS)
+    assert reader.replaced()
+
+def testRejectsOtherFiles(state_file):
+
+    with open(state_file, 'wb') as state_fh:
+        state_fh.write(b'\0' * 128)
+    with pytest.raises(ValueError):
+        LiveState(state_file)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# tests/test_metrics.py
+
+# latency histograms with a bounded relative error
+
+import numpy as np
+import pytest
+from metrics import Histogram, Metrics
+
+def testEmptyHistogram():
+
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.summary()['min'] == 0.0
+
+@pytest.mark.parametrize('p', [1, 50, 90, 99, 99.9])
+def testPercentileRelativeError(p):
+
+    # log-normal latencies from a few microseconds to tens of milliseconds
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(np.log(200e-6), 1.5, 100000)
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    # the upper bound of the bucket holding the exact percentile
+    exact = np.percentile(values, p, method='inverted_cdf')
+    assert exact <= histogram.percentile(p) <= exact * (1 + 2 ** -histogram.sub_bucket_bits) + histogram.unit
+
+def testSmallValuesResolvedToUnit():
+
+    histogram = Histogram()
+    for units in range(1, 101):
+        histogram.record(units * 1e-6 + 1e-9)
+    assert histogram.percentile(50) == pytest.approx(51e-6)
+    assert histogram.percentile(100) == pytest.approx(100e-6 + 1e-9)
+
+def testPercentileCappedAtMax():
+
+    histogram = Histogram()
+    histogram.record(0.0123)
+    assert histogram.percentile(99) == 0.0123
+    histogram.record(-1.0)
+    assert histogram.min == 0.0
+
+def testSummaryAndPrometheus():
+
+    metrics = Metrics()
+    for value in (0.001, 0.002, 0.003):
+        metrics.record('onPrice', value)
+    with metrics.span('order'):
+        pass
+    summary = metrics.summary()
+    assert list(summary) == ['onPrice', 'order']
+    assert summary['onPrice']['count'] == 3
+    assert summary['onPrice']['mean'] == pytest.approx(0.002)
+    assert summary['onPrice']['max'] == 0.003
+    text = metrics.prometheus()
+    assert 'gridbot_latency_seconds_count{span="onPrice"} 3' in text
+    assert 'gridbot_latency_seconds{span="order",quantile="0.99"}' in text
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+# tests/test_scheduler.py
+
+# token bucket of request weight shared by the bots, on a clock moved by the tests
+
+import threading
+import time
+import types
+import pytest
+import requests
+import scheduler
+from scheduler import PRIORITY_ACCOUNT, PRIORITY_MARKET_DATA, PRIORITY_ORDER, RestSession, WeightBudget, requestPriority, requestWeight
+
+class Clock:
+
+    # monotonic time that moves by step on every read, or only when the test moves it
+    def __init__(self, step=0.0):
+
+        self.now = 1000.0
+        self.step = step
+
+    def __call__(self) -> float:
+
+        self.now += self.step
+        return(self.now)
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    clock = Clock()
+    monkeypatch.setattr(scheduler, 'time', types.SimpleNamespace(monotonic=clock))
+    return(clock)
+
+def advance(budget, clock, seconds):
+
+    # move the clock and wake the waiting requests
+    clock.now += seconds
+    with budget.condition:
+        budget.condition.notify_all()
+
+def waitFor(condition, timeout=2.0):
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def response(status_code, used_weight=None, retry_after=None) -> requests.Response:
+
+    response = requests.Response()
+    response.status_code = status_code
+    if used_weight is not None:
+        response.headers['X-MBX-USED-WEIGHT-1M'] = str(used_weight)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return(response)
+
+def testRequestWeightAndPriority():
+
+    base = 'https://api.binance.com'
+    assert requestWeight('GET', f'{base}/api/v3/ticker/price?symbol=XRPBUSD') == 2
+    assert requestWeight('GET', f'{base}/api/v3/ticker/price') == 4
+    assert requestWeight('GET', f'{base}/api/v3/order?symbol=XRPBUSD') == 4
+    assert requestWeight('POST', f'{base}/api/v3/order') == 1
+    assert requestWeight('GET', f'{base}/api/v3/openOrders') == 80
+    assert requestPriority('POST', f'{base}/api/v3/order') == PRIORITY_ORDER
+    assert requestPriority('GET', f'{base}/api/v3/order') == PRIORITY_MARKET_DATA
+    assert requestPriority('GET', f'{base}/api/v3/account') == PRIORITY_ACCOUNT
+
+def testRefillCappedAtLimit(clock):
+
+    budget = WeightBudget(weight_limit=60)
+    budget.acquire(30)
+    assert budget.tokens == 30
+    clock.now += 10
+    budget.refill(clock.now)
+    assert budget.tokens == pytest.approx(40)
+    clock.now += 600
+    budget.refill(clock.now)
+    assert budget.tokens == 60
+
+def testOrderReserveFloor(clock):
+
+    # the last half of the budget is left to the orders
+    budget = WeightBudget(weight_limit=60, order_reserve=0.5)
+    budget.acquire(30)
+    market_data = threading.Thread(target=budget.acquire, args=(1,), daemon=True)
+    market_data.start()
+    waitFor(lambda: budget.waiters)
+    assert market_data.is_alive()
+
+    budget.acquire(25, PRIORITY_ORDER)
+    assert budget.tokens == 5
+
+    # 26 seconds refill the 26 tokens the request needs to stay above the floor
+    advance(budget, clock, 26)
+    market_data.join(2)
+    assert not market_data.is_alive()
+    assert budget.tokens == pytest.approx(30)
+
+def testOrdersServedFirst(clock):
+
+    # during a pause an order arriving after a price request is sent first
+    budget = WeightBudget(weight_limit=60, order_reserve=0.5)
+    budget.pause(10)
+    market_data = threading.Thread(target=budget.acquire, args=(1,), daemon=True)
+    market_data.start()
+    waitFor(lambda: len(budget.waiters) == 1)
+    order = threading.Thread(target=budget.acquire, args=(40, PRIORITY_ORDER), daemon=True)
+    order.start()
+    waitFor(lambda: len(budget.waiters) == 2)
+    assert budget.waiters[0][0] == PRIORITY_ORDER
+
+    # a full budget after the pause; the order leaves too little for the price request
+    advance(budget, clock, 60)
+    order.join(2)
+    assert not order.is_alive()
+    assert market_data.is_alive()
+    advance(budget, clock, 60)
+    market_data.join(2)
+    assert not market_data.is_alive()
+
+def testUpdateFromUsedWeight(clock):
+
+    budget = WeightBudget(weight_limit=1200)
+    budget.update(1000)
+    assert budget.tokens == 200
+    budget.update(100)
+    assert budget.tokens == 200
+
+    # the used weight counts all the processes sharing the address
+    budget = WeightBudget(weight_limit=1200, share=0.5)
+    budget.update(1000)
+    assert budget.tokens == 100
+
+def testPauseBacksOffExponentially(clock):
+
+    budget = WeightBudget(max_backoff=10)
+    assert [budget.pause() for _ in range(5)] == [2, 4, 8, 10, 10]
+    assert budget.paused_until == clock.now + 10
+    assert budget.tokens == 0
+    budget.resetBackoff()
+    assert budget.pause() == 2
+
+    # Retry-After wins over the backoff, and a pause is never shortened
+    assert budget.pause(30) == 30
+    assert budget.paused_until == clock.now + 30
+    budget.pause(1)
+    assert budget.paused_until == clock.now + 30
+
+@pytest.fixture
+def session(monkeypatch):
+
+    # responses are served from a list, and every pause elapses at the next clock read
+    monkeypatch.setattr(scheduler, 'time', types.SimpleNamespace(monotonic=Clock(step=100.0)))
+    session = RestSession(max_retries=3)
+    session.responses = []
+    session.requested = []
+
+    def request(self, method, url, *args, **kwargs):
+
+        self.requested.append((method, url))
+        return(self.responses.pop(0))
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    return(session)
+
+def testRateLimitedPriceRequestRetried(session):
+
+    session.responses = [response(429, 1200, retry_after=5), response(200, 10)]
+    assert session.get('https://api.binance.com/api/v3/ticker/price?symbol=XRPBUSD').status_code == 200
+    assert len(session.requested) == 2
+    assert session.budget.backoff_count == 0
+
+def testRateLimitedOrderNotRetried(session):
+
+    session.responses = [response(429, 1200)]
+    assert session.post('https://api.binance.com/api/v3/order').status_code == 429
+    assert len(session.requested) == 1
+    assert session.budget.backoff_count == 1
+
+def testBanNotRetried(session):
+
+    session.responses = [response(418, retry_after=120)]
+    assert session.get('https://api.binance.com/api/v3/klines?symbol=XRPBUSD').status_code == 418
+    assert len(session.requested) == 1
+
+def testRetriesBounded(session):
+
+    session.responses = [response(429) for _ in range(5)]
+    assert session.get('https://api.binance.com/api/v3/ticker/price').status_code == 429
+    assert len(session.requested) == 4
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# tests/test_storage.py
+
+# schema migrations of the wallet database and the rollups of the wallet rows
+
+import sqlite3
+import pytest
+from grid import GridStrategy, LadderStrategy
+from storage import SCHEMA_VERSION, Journal, bulkInsertWallet, connect, queryRollup
+
+# three rows in the first minute bucket, the middle one without price, and one in the next
+ROWS = [
+    ('XRPBUSD', 1699999980000, 1000.0, 0.0, 0.50),
+    ('XRPBUSD', 1700000010000, 900.0, 200.0, 0.49),
+    ('XRPBUSD', 1700000039000, 900.0, 200.0, None),
+    ('XRPBUSD', 1700000041000, 1010.0, 0.0, 0.51),
+    ('BTCUSDT', 1700000010000, 500.0, 0.01, 30000.0)
+]
+
+def legacyDatabase(db_file):
+
+    # wallet table written by pandas.DataFrame.to_sql before schema version 1
+    cnx = sqlite3.connect(db_file)
+    cnx.execute('CREATE TABLE "XRPBUSD" ("index" INTEGER, local_time TIMESTAMP, BUSD REAL, XRP REAL, XRPBUSD_price REAL)')
+    cnx.executemany('INSERT INTO "XRPBUSD" VALUES (?, ?, ?, ?, ?)', [
+        (0, '2023-11-14 22:13:20', 1000.0, 0.0, 0.5),
+        (1, '2023-11-14 22:13:50', 900.0, 200.0, 0.49)
+    ])
+    cnx.commit()
+    cnx.close()
+
+def testNewDatabase(tmp_path):
+
+    cnx = connect(str(tmp_path / 'wallet.db'))
+    assert cnx.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    tables = {row[0] for row in cnx.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'symbols', 'wallet', 'wallet_1m', 'wallet_1h', 'wallet_1d'} <= tables
+
+def testLegacyTablesMigrated(tmp_path):
+
+    db_file = str(tmp_path / 'wallet.db')
+    legacyDatabase(db_file)
+    cnx = connect(db_file)
+    assert cnx.execute('SELECT symbol, trade_coin, stake_currency FROM symbols').fetchall() == [('XRPBUSD', 'XRP', 'BUSD')]
+    rows = cnx.execute('SELECT stake_balance, trade_balance, price FROM wallet ORDER BY ts').fetchall()
+    assert rows == [(1000.0, 0.0, 0.5), (900.0, 200.0, 0.49)]
+    ts = [row[0] for row in cnx.execute('SELECT ts FROM wallet ORDER BY ts')]
+    assert ts[1] - ts[0] == 30000
+    assert cnx.execute('SELECT COUNT(*) FROM "XRPBUSD_legacy"').fetchone()[0] == 2
+    assert queryRollup(cnx, 'XRPBUSD', '1d')[0][-1] == 2
+
+    # a second connection finds the database migrated
+    cnx.close()
+    cnx = connect(db_file)
+    assert cnx.execute('SELECT COUNT(*) FROM wallet').fetchone()[0] == 2
+
+def testJournalGainsExpectedPnl(tmp_path):
+
+    db_file = str(tmp_path / 'wallet.db')
+    cnx = sqlite3.connect(db_file)
+    cnx.execute('CREATE TABLE journal (id INTEGER PRIMARY KEY AUTOINCREMENT, symbol TEXT NOT NULL, event TEXT NOT NULL)')
+    cnx.execute('PRAGMA user_version = 1')
+    cnx.commit()
+    cnx.close()
+    cnx = connect(db_file)
+    columns = [row[1] for row in cnx.execute('PRAGMA table_info(journal)')]
+    assert 'expected_pnl' in columns
+
+def testFailedMigrationRolledBack(tmp_path):
+
+    # a legacy table whose local_time cannot be copied
+    db_file = str(tmp_path / 'wallet.db')
+    cnx = sqlite3.connect(db_file)
+    cnx.execute('CREATE TABLE "XRPBUSD" ("index" INTEGER, local_time TIMESTAMP NOT NULL, BUSD REAL, XRP REAL, XRPBUSD_price REAL)')
+    cnx.execute('CREATE TABLE wallet (id INTEGER PRIMARY KEY, symbol TEXT NOT NULL, ts INTEGER NOT NULL, stake_balance REAL, trade_balance REAL, price REAL)')
+    cnx.execute('INSERT INTO "XRPBUSD" VALUES (0, \'not a time\', 1000.0, 0.0, 0.5)')
+    cnx.commit()
+    cnx.close()
+    with pytest.raises(sqlite3.IntegrityError):
+        connect(db_file)
+    cnx = sqlite3.connect(db_file)
+    assert cnx.execute('PRAGMA user_version').fetchone()[0] == 0
+    assert cnx.execute('SELECT COUNT(*) FROM wallet').fetchone()[0] == 0
+
+@pytest.mark.parametrize('resolution', ['1m', '1h', '1d'])
+def testBulkInsertMatchesTriggers(tmp_path, resolution):
+
+    bulk = connect(str(tmp_path / 'bulk.db'))
+    bulkInsertWallet(bulk, ROWS)
+    triggered = connect(str(tmp_path / 'triggered.db'))
+    triggered.executemany('INSERT INTO wallet (symbol, ts, stake_balance, trade_balance, price) VALUES (?, ?, ?, ?, ?)', ROWS)
+    for symbol in ('XRPBUSD', 'BTCUSDT'):
+        assert queryRollup(bulk, symbol, resolution) == queryRollup(triggered, symbol, resolution)
+
+def testMinuteRollup(tmp_path):
+
+    cnx = connect(str(tmp_path / 'wallet.db'))
+    bulkInsertWallet(cnx, ROWS)
+    first, second = queryRollup(cnx, 'XRPBUSD', '1m')
+    bucket, open_, high, low, close, stake_balance, trade_balance, n = first
+    assert (open_, high, low, close) == (0.50, 0.50, 0.49, 0.49)
+    assert (stake_balance, trade_balance, n) == (900.0, 200.0, 3)
+    assert second[1:] == (0.51, 0.51, 0.51, 0.51, 1010.0, 0.0, 1)
+
+@pytest.mark.parametrize('strategy', [GridStrategy, LadderStrategy])
+def testJournalReplaysFills(tmp_path, strategy):
+
+    # a buy filled below the price that crossed the threshold, with the commission in the trade coin
+    journal = Journal(str(tmp_path / 'wallet.db'))
+    grid = strategy(fee_rate=0.001)
+    grid.setGrid(1.0)
+    journal.record('XRPBUSD', 'start', 1.0)
+    fills = {'order_id': 42, 'transact_time': 1700000000000, 'executed_qty': 100.0, 'fill_price': 0.97, 'commission': {'XRP': 0.1}}
+    grid.openPosition(99.9, 0.98, fills['order_id'], fills['fill_price'], fills['commission'], fills['transact_time'])
+    position = grid.positions.last
+    journal.record('XRPBUSD', 'buy', position.price, position.amount, fills, position.expected_pnl)
+
+    state, events = journal.load('XRPBUSD')
+    assert state is None
+    assert events[1] == ('buy', 99.9, position.price, 42, 0.97, {'XRP': 0.1}, 1700000000000)
+    replayed = strategy(fee_rate=0.001)
+    for event in events:
+        replayed.replayEvent(*event)
+    assert replayed.getState() == grid.getState()
+    assert replayed.positions.last.expected_pnl == pytest.approx(position.expected_pnl)
+    journal.close()